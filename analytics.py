@@ -0,0 +1,332 @@
+"""
+Columnar analytics over many checked-out shopping carts.
+
+`CartAnalytics` collects the lines of finished carts into typed columns (cart, code and quantity),
+with the cart ids and the codes dictionary-encoded, and looks up the pricing terms of each code only once.
+The line prices, the savings against the unit prices and the number of special bundles of every line
+are calculated column by column, and grouped by code or by cart without building a dictionary per line.
+
+If NumPy is installed and every price is an int or a float, the columns are NumPy arrays and the calculations are vectorized.
+Without NumPy, or with prices of another type like `Decimal`, the same results are calculated exactly with plain Python loops.
+
+Usage:
+    python main.py --batch orders/ --output results.jsonl
+    python analytics.py results.jsonl [--catalogue catalogue.json] [--by code|cart_id] [--csv lines.csv] [--columns lines/]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from array import array
+from batch_pricing import bundle_terms
+from store import Store
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the columns are calculated with Python loops without it.
+    np = None
+
+LINE_COLUMNS = ("cart_id", "code", "quantity", "line_price", "savings", "bundles")
+AGGREGATE_COLUMNS = ("lines", "units", "revenue", "savings", "bundle_hits", "bundle_hit_rate")
+
+
+class CartAnalytics:
+    """
+    The lines of many finished carts, in columns.
+
+    Attributes:
+        store (Store): The store whose prices are used to price the lines.
+        cart_ids: The distinct cart ids, in the order they were added.
+        codes: The distinct codes, in the order they were first added.
+        cart_rows: The index in `cart_ids` of the cart of each line.
+        code_rows: The index in `codes` of the code of each line.
+        quantities: The quantity of each line.
+
+    >>> from product import Product
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> store.add_product(Product("C", 25))
+    >>> analytics = CartAnalytics(store)
+    >>> analytics.add_carts([("customer-1", {"A": 4, "C": 1}), ("customer-2", {"A": 2})])
+    >>> summary = analytics.aggregate("code")
+    >>> [int(revenue) for revenue in summary["revenue"]], [int(savings) for savings in summary["savings"]]
+    ([290, 25], [10, 0])
+    """
+    def __init__(self, store: Store):
+        self.store = store
+        self.cart_ids = []
+        self.cart_index = {}
+        self.codes = []
+        self.code_index = {}
+        self.unit_prices = []
+        self.bundle_sizes = array("q")
+        self.bundle_prices = []
+        self.has_special = array("q")
+        self.cart_rows = array("q")
+        self.code_rows = array("q")
+        self.quantities = array("q")
+
+    def __len__(self):
+        return len(self.quantities)
+
+    def add_cart(self, cart_id, content: dict):
+        """
+        Adds the lines of a finished cart, where `content` is a dictionary of codes and quantities, like `Cart.get_cart()`.
+
+        Raises:
+            ValueError: If a code is not in the store.
+        """
+        cart_row = self.cart_index.get(cart_id)
+        if cart_row is None:
+            cart_row = self.cart_index[cart_id] = len(self.cart_ids)
+            self.cart_ids.append(cart_id)
+        for code, quantity in content.items():
+            code_row = self.code_index.get(code)
+            if code_row is None:
+                code_row = self.add_code(code)
+            self.cart_rows.append(cart_row)
+            self.code_rows.append(code_row)
+            self.quantities.append(quantity)
+
+    def add_carts(self, carts):
+        """ Adds the lines of many finished carts, given as (cart id, content) pairs. """
+        for cart_id, content in carts:
+            self.add_cart(cart_id, content)
+
+    def add_code(self, code: str) -> int:
+        """ Looks up the pricing terms of the product `code` and returns its index in `codes`. """
+        shelf = self.store.get_shelf()
+        if code not in shelf:
+            raise ValueError(f"We don't have {code} in our store.")
+        product = shelf[code]
+        bundle_size, bundle_price = bundle_terms(product)
+        self.unit_prices.append(product.unit_price)
+        self.bundle_sizes.append(bundle_size)
+        self.bundle_prices.append(bundle_price)
+        self.has_special.append(1 if product.special_quantity and product.special_price else 0)
+        self.code_index[code] = len(self.codes)
+        self.codes.append(code)
+        return self.code_index[code]
+
+    def price_typecode(self):
+        """
+        Returns the typecode of the `array` module the prices fit in exactly: "q" if they are all ints,
+        "d" if they are all ints or floats, or None if any price has another type, like `Decimal`.
+        """
+        types = {type(price) for price in self.unit_prices + self.bundle_prices}
+        if types <= {int}:
+            return "q"
+        if types <= {int, float}:
+            return "d"
+        return None
+
+    def is_vectorized(self) -> bool:
+        """ Check if the columns are calculated with NumPy: it has to be installed, and the prices have to be ints or floats. """
+        return np is not None and self.price_typecode() is not None
+
+    def columns(self) -> dict:
+        """
+        Returns the columns of the lines: cart_id, code, quantity, line_price,
+        savings (the price at the unit price minus the line price) and bundles (the number of special bundles).
+        """
+        if self.is_vectorized():
+            price_dtype = np.int64 if self.price_typecode() == "q" else np.float64
+            code_rows = np.frombuffer(self.code_rows, dtype=np.int64)
+            quantities = np.frombuffer(self.quantities, dtype=np.int64)
+            unit_prices = np.array(self.unit_prices, dtype=price_dtype)[code_rows]
+            bundle_count, remaining_item_count = np.divmod(quantities, np.frombuffer(self.bundle_sizes, dtype=np.int64)[code_rows])
+            line_prices = bundle_count * np.array(self.bundle_prices, dtype=price_dtype)[code_rows] + remaining_item_count * unit_prices
+            return {
+                "cart_id": np.array(self.cart_ids, dtype=object)[np.frombuffer(self.cart_rows, dtype=np.int64)],
+                "code": np.array(self.codes, dtype=object)[code_rows],
+                "quantity": quantities,
+                "line_price": line_prices,
+                "savings": quantities * unit_prices - line_prices,
+                "bundles": bundle_count * np.frombuffer(self.has_special, dtype=np.int64)[code_rows],
+            }
+
+        line_prices = []
+        savings = []
+        bundles = []
+        for code_row, quantity in zip(self.code_rows, self.quantities):
+            unit_price = self.unit_prices[code_row]
+            bundle_count, remaining_item_count = divmod(quantity, self.bundle_sizes[code_row])
+            line_price = bundle_count * self.bundle_prices[code_row] + remaining_item_count * unit_price
+            line_prices.append(line_price)
+            savings.append(quantity * unit_price - line_price)
+            bundles.append(bundle_count * self.has_special[code_row])
+        return {
+            "cart_id": [self.cart_ids[cart_row] for cart_row in self.cart_rows],
+            "code": [self.codes[code_row] for code_row in self.code_rows],
+            "quantity": list(self.quantities),
+            "line_price": line_prices,
+            "savings": savings,
+            "bundles": bundles,
+        }
+
+    def aggregate(self, by: str="code") -> dict:
+        """
+        Groups the lines by "code" or by "cart_id", and returns the columns of the groups: the key (code or cart_id),
+        lines, units, revenue, savings, bundle_hits (the number of lines with at least one special bundle) and bundle_hit_rate.
+
+        Raises:
+            ValueError: If `by` is neither "code" nor "cart_id".
+        """
+        if by == "code":
+            keys, rows = self.codes, self.code_rows
+        elif by == "cart_id":
+            keys, rows = self.cart_ids, self.cart_rows
+        else:
+            raise ValueError("The lines can only be grouped by code or by cart_id.")
+        columns = self.columns()
+        group_count = len(keys)
+
+        if self.is_vectorized():
+            rows = np.frombuffer(rows, dtype=np.int64)
+            lines = np.bincount(rows, minlength=group_count)
+            groups = {
+                by: list(keys),
+                "lines": lines,
+                "units": group_sum(rows, columns["quantity"], group_count),
+                "revenue": group_sum(rows, columns["line_price"], group_count),
+                "savings": group_sum(rows, columns["savings"], group_count),
+                "bundle_hits": np.bincount(rows, weights=columns["bundles"] > 0, minlength=group_count).astype(np.int64),
+            }
+            groups["bundle_hit_rate"] = groups["bundle_hits"] / np.maximum(lines, 1)
+            return groups
+
+        groups = {by: list(keys)}
+        for name in AGGREGATE_COLUMNS[:-1]:
+            groups[name] = [0] * group_count
+        for row, quantity, line_price, savings, bundles in zip(
+            rows, columns["quantity"], columns["line_price"], columns["savings"], columns["bundles"],
+        ):
+            groups["lines"][row] += 1
+            groups["units"][row] += quantity
+            groups["revenue"][row] += line_price
+            groups["savings"][row] += savings
+            groups["bundle_hits"][row] += bundles > 0
+        groups["bundle_hit_rate"] = [hits / max(lines, 1) for hits, lines in zip(groups["bundle_hits"], groups["lines"])]
+        return groups
+
+    def write_csv(self, file):
+        """ Writes the columns of the lines to a CSV `file`, one row per line. """
+        columns = self.columns()
+        writer = csv.writer(file)
+        writer.writerow(LINE_COLUMNS)
+        writer.writerows(zip(*(to_list(columns[name]) for name in LINE_COLUMNS)))
+
+    def write_columns(self, directory: str):
+        """
+        Writes each column of the lines to its own binary file in the `directory`, with a manifest.json describing them.
+        The cart ids and the codes are dictionary-encoded: their columns hold indexes into dictionaries kept in the manifest.
+        Read them back with `read_columns`.
+
+        Raises:
+            ValueError: If a price is neither an int nor a float, so the prices cannot be written exactly as binary numbers.
+        """
+        price_type = self.price_typecode()
+        if price_type is None:
+            raise ValueError("The line prices can only be written as binary columns if every price is an int or a float.")
+        os.makedirs(directory, exist_ok=True)
+        columns = self.columns()
+        typed_columns = {
+            "cart_id": self.cart_rows,
+            "code": self.code_rows,
+            "quantity": self.quantities,
+            "line_price": array(price_type, to_list(columns["line_price"])),
+            "savings": array(price_type, to_list(columns["savings"])),
+            "bundles": array("q", to_list(columns["bundles"])),
+        }
+        manifest = {
+            "rows": len(self),
+            "byteorder": sys.byteorder,
+            "columns": {name: {"type": column.typecode, "file": f"{name}.bin"} for name, column in typed_columns.items()},
+            "dictionaries": {"cart_id": self.cart_ids, "code": self.codes},
+        }
+        for name, column in typed_columns.items():
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+                column.tofile(f)
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+
+def group_sum(rows, values, group_count: int):
+    """ Returns the sums of the NumPy array `values` per group of `rows`, keeping integer and object (like `Decimal`) sums exact. """
+    if values.dtype.kind in "iuO":
+        sums = np.zeros(group_count, dtype=object if values.dtype.kind == "O" else np.int64)
+        np.add.at(sums, rows, values)
+        return sums
+    return np.bincount(rows, weights=values, minlength=group_count)
+
+
+def to_list(column) -> list:
+    """ Returns a column as a list of Python values. """
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+
+def read_columns(directory: str) -> dict:
+    """
+    Reads the columns written by `CartAnalytics.write_columns`, with the cart ids and the codes decoded.
+
+    Returns:
+        dict: The columns, as arrays of the `array` module, and lists for the cart ids and the codes.
+    """
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    columns = {}
+    for name, description in manifest["columns"].items():
+        column = array(description["type"])
+        with open(os.path.join(directory, description["file"]), "rb") as f:
+            column.fromfile(f, manifest["rows"])
+        if manifest["byteorder"] != sys.byteorder:
+            column.byteswap()
+        dictionary = manifest["dictionaries"].get(name)
+        columns[name] = [dictionary[row] for row in column] if dictionary is not None else column
+    return columns
+
+
+def iter_batch_carts(file):
+    """ Yields the (file name, cart) of each order file checked out in a batch results `file` written by `main.py --batch`. """
+    for line in file:
+        if line.strip():
+            result = json.loads(line)
+            if "cart" in result:
+                yield result["file"], result["cart"]
+
+
+def print_aggregate(groups: dict, by: str):
+    """ Prints the grouped aggregates as a table. """
+    print(f"{by:<20}{'lines':>10}{'units':>12}{'revenue':>14}{'savings':>12}{'bundle hits':>13}{'hit rate':>10}")
+    for index, key in enumerate(groups[by]):
+        print(
+            f"{str(key):<20}{int(groups['lines'][index]):>10}{int(groups['units'][index]):>12}"
+            f"{groups['revenue'][index]:>14}{groups['savings'][index]:>12}{int(groups['bundle_hits'][index]):>13}"
+            f"{groups['bundle_hit_rate'][index]:>10.1%}"
+        )
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Aggregate the carts checked out by main.py --batch.")
+    parser.add_argument("results", help="results of main.py --batch, as JSON Lines")
+    parser.add_argument("--catalogue", default="catalogue.json", help="catalogue of the store (JSON, or compiled by catalogue_file.py)")
+    parser.add_argument("--by", choices=("code", "cart_id"), default="code", help="group the lines by code or by cart")
+    parser.add_argument("--csv", help="file to write the lines to as CSV")
+    parser.add_argument("--columns", help="directory to write the columns of the lines to")
+    args = parser.parse_args(arguments)
+
+    from batch import load_store
+    analytics = CartAnalytics(load_store(args.catalogue))
+    with open(args.results, "r", encoding="utf-8") as f:
+        analytics.add_carts(iter_batch_carts(f))
+    print_aggregate(analytics.aggregate(args.by), args.by)
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            analytics.write_csv(f)
+    if args.columns:
+        analytics.write_columns(args.columns)
+
+
+if __name__ == '__main__':
+    main()
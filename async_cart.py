@@ -0,0 +1,176 @@
+import asyncio
+from collections import namedtuple
+from collections.abc import AsyncIterable
+from cart import Cart, is_order_iterable
+from store import Store
+
+OrderLineResult = namedtuple("OrderLineResult", ["order_item", "product", "quantity", "error"])
+OrderLineResult.__doc__ = """
+The result of taking one order item.
+
+Attributes:
+    order_item: The order item, as it was received.
+    product: The product added to the shopping cart, or None if the order item is invalid.
+    quantity: The quantity added to the shopping cart, or None if the order item is invalid.
+    error: The error message if the order item is invalid, otherwise None.
+"""
+
+# Put on an order queue after the last order item.
+END_OF_ORDER = object()
+
+
+class AsyncCart:
+    """
+    An asyncio interface to a shopping cart in a store.
+
+    Invalid order items are returned as `OrderLineResult`s instead of being printed,
+    and long orders give control back to the event loop every `yield_every` order items,
+    so that many carts can share one event loop.
+
+    Attributes:
+        cart: The `Cart` holding the products and the subtotal.
+        yield_every: The number of order items taken before giving control back to the event loop.
+    """
+    def __init__(self, store: Store, yield_every: int=100):
+        """
+        Initialize an empty shopping cart with a subtotal of 0 in a given store.
+
+        Raises:
+            ValueError: If `yield_every` is not a positive integer.
+        """
+        if not isinstance(yield_every, int) or yield_every <= 0:
+            raise ValueError("The number of order items between yields should be a positive integer.")
+        self.cart = Cart(store)
+        self.yield_every = yield_every
+
+    def get_cart(self):
+        """ Returns the current products and their quantities in the shopping cart. """
+        return self.cart.get_cart()
+
+    def get_subtotal(self):
+        """ Returns the current subtotal of the shopping cart. """
+        return self.cart.get_subtotal()
+
+    async def add_product(self, product: str, quantity: int):
+        """
+        Adds a `product` with a given `quantity` to the shopping cart.
+
+        Raises:
+            TypeError: If the `product` is None or empty.
+            TypeError: If the `quantity` is not a non-negative integer.
+            ValueError: If the `product` is not in the store.
+        """
+        self.cart.add_product(product, quantity)
+
+    async def take_order(self, data):
+        """
+        Takes an order from the `data` and adds the products in the data to the shopping cart.
+
+        Args:
+            data: The order, as an iterable or an async iterable of order items in the `Cart.take_order` format.
+
+        Returns:
+            list: An `OrderLineResult` for each order item.
+
+        >>> from product import Product
+        >>> store = Store()
+        >>> store.add_product(Product("A", 50, 3, 140))
+        >>> cart = AsyncCart(store)
+        >>> asyncio.run(cart.take_order([{"code": "A", "quantity": 3}, {"code": "E", "quantity": 1}]))
+        [OrderLineResult(order_item={'code': 'A', 'quantity': 3}, product='A', quantity=3, error=None), OrderLineResult(order_item={'code': 'E', 'quantity': 1}, product=None, quantity=None, error="An error occurred: We don't have E in our store.")]
+        """
+        return [result async for result in self.iter_order_results(data)]
+
+    async def iter_order_results(self, data):
+        """
+        Takes an order from the `data` one order item at a time,
+        and yields an `OrderLineResult` for each order item as soon as it is added to the shopping cart.
+
+        Args:
+            data: The order, as an iterable or an async iterable of order items in the `Cart.take_order` format.
+        """
+        if isinstance(data, AsyncIterable):
+            items = data
+        elif is_order_iterable(data) and not (isinstance(data, list) and not data):
+            items = _as_async_iterable(data)
+        else:
+            yield OrderLineResult(data, None, None, f"The data {data} is not a valid list.")
+            return
+
+        item_count = 0
+        async for order_item in items:
+            item_count += 1
+            yield self.take_order_item(order_item)
+            if item_count % self.yield_every == 0:
+                await asyncio.sleep(0)
+        if item_count == 0:
+            yield OrderLineResult(data, None, None, "The order is empty.")
+
+    async def consume_queue(self, queue: asyncio.Queue):
+        """
+        Takes the order items from the `queue` until `END_OF_ORDER` is received.
+        A bounded queue applies backpressure to the producer putting the order items on it.
+
+        Returns:
+            list: An `OrderLineResult` for each invalid order item.
+        """
+        errors = []
+        item_count = 0
+        while True:
+            order_item = await queue.get()
+            try:
+                if order_item is END_OF_ORDER:
+                    return errors
+                result = self.take_order_item(order_item)
+                if result.error:
+                    errors.append(result)
+            finally:
+                queue.task_done()
+            item_count += 1
+            if item_count % self.yield_every == 0:
+                await asyncio.sleep(0)
+
+    def take_order_item(self, order_item):
+        """ Adds one `order_item` to the shopping cart and returns its `OrderLineResult`. """
+        product, quantity, error = self.cart.check_order_item(order_item)
+        if not error and quantity != 0:
+            self.cart.add_valid_product(product, quantity)
+        return OrderLineResult(order_item, product, quantity, error)
+
+
+async def feed_queue(queue: asyncio.Queue, data):
+    """
+    Puts the order items from the `data` (an iterable or an async iterable) on the `queue`, followed by `END_OF_ORDER`.
+    If the queue is bounded, this waits whenever the queue is full.
+    """
+    items = data if isinstance(data, AsyncIterable) else _as_async_iterable(data)
+    async for order_item in items:
+        await queue.put(order_item)
+    await queue.put(END_OF_ORDER)
+
+
+async def take_order_stream(cart: AsyncCart, data, max_pending: int=1000):
+    """
+    Takes an order from the `data` (an iterable or an async iterable) through a queue
+    holding at most `max_pending` order items, so that a fast producer is slowed down to the pace of the cart.
+
+    Returns:
+        list: An `OrderLineResult` for each invalid order item.
+    """
+    queue = asyncio.Queue(max_pending)
+    producer = asyncio.create_task(feed_queue(queue, data))
+    consumer = asyncio.create_task(cart.consume_queue(queue))
+    try:
+        await asyncio.wait({producer, consumer}, return_when=asyncio.FIRST_EXCEPTION)
+        if producer.done() and producer.exception():
+            raise producer.exception()
+        return await consumer
+    finally:
+        producer.cancel()
+        consumer.cancel()
+
+
+async def _as_async_iterable(data):
+    """ Yields the items of the iterable `data` asynchronously. """
+    for item in data:
+        yield item
@@ -0,0 +1,127 @@
+"""
+Checks out many order files in a batch, without prompting.
+
+Each order file is a JSON array or a JSON Lines file of order items, optionally compressed with gzip.
+The files are checked out concurrently by a pool of worker processes, against a store built from a catalogue file.
+A JSON object is written for each file to a single output stream, and throughput stats are printed to stderr at the end.
+
+Usage:
+    python main.py --batch <directory or glob>... --catalogue <catalogue.json or catalogue.bin> [--workers N] [--output results.jsonl]
+"""
+import glob
+import gzip
+import json
+import os
+import sys
+import time
+from catalogue_file import MappedStore, read_catalogue
+from checkout import checkout_cart, map_with_store
+from order_reader import iter_order_items
+from store import Store
+
+ORDER_FILE_EXTENSIONS = (".json", ".ndjson", ".jsonl", ".json.gz", ".ndjson.gz", ".jsonl.gz")
+
+
+def load_store(catalogue_file_name: str) -> Store:
+    """
+    Builds a store from a JSON catalogue, or loads it from a catalogue file compiled by `catalogue_file.py`.
+
+    Raises:
+        ValueError: If the catalogue is invalid.
+    """
+    if catalogue_file_name.endswith(".json"):
+        store = Store()
+        with open(catalogue_file_name, "r") as f:
+            for product in read_catalogue(f):
+                store.add_product(product)
+        return store
+    return MappedStore(catalogue_file_name)
+
+
+def find_order_files(patterns) -> list:
+    """
+    Returns the order files in the directories or matching the glob `patterns`, sorted and without duplicates.
+    Only the files with an order file extension are taken from the directories.
+    """
+    file_names = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in os.listdir(pattern):
+                path = os.path.join(pattern, name)
+                if name.endswith(ORDER_FILE_EXTENSIONS) and os.path.isfile(path):
+                    file_names.add(path)
+        else:
+            file_names.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(file_names)
+
+
+def open_order_file(file_name: str):
+    """ Opens an order file as text, decompressing it if its name ends with '.gz'. """
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, "rt", encoding="utf-8")
+    return open(file_name, "r", encoding="utf-8")
+
+
+def checkout_file(store: Store, file_name: str) -> dict:
+    """ Checks out the order in the file named `file_name`, and returns the result as a dictionary. """
+    item_count = 0
+
+    def counted(items):
+        nonlocal item_count
+        for item in items:
+            item_count += 1
+            yield item
+
+    try:
+        with open_order_file(file_name) as f:
+            result = checkout_cart(store, file_name, counted(iter_order_items(f)))
+    except json.JSONDecodeError:
+        return {"file": file_name, "error": f"The file {file_name} is not a valid JSON file.", "order_items": item_count}
+    except (OSError, UnicodeDecodeError) as e:
+        return {"file": file_name, "error": f"The file {file_name} could not be read: {e}", "order_items": item_count}
+    return {
+        "file": file_name,
+        "cart": result.cart,
+        "subtotal": result.subtotal,
+        "errors": result.errors,
+        "order_items": item_count,
+    }
+
+
+def checkout_files(store: Store, file_names, processes: int=None):
+    """
+    Checks out the order files concurrently in a pool of `processes` worker processes,
+    and yields the result of each file as soon as it is finished.
+    If `processes` is 1, the files are checked out in the current process.
+    """
+    return map_with_store(store, checkout_file, file_names, processes)
+
+
+def run_batch(patterns, catalogue_file_name: str, processes: int=None, output=None, stats=None) -> int:
+    """
+    Checks out the order files in the directories or matching the glob `patterns`,
+    writes a JSON object for each file to `output` (stdout by default),
+    and prints the throughput stats to `stats` (stderr by default).
+
+    Returns:
+        int: The exit status, 0 if every file could be read, otherwise 1.
+    """
+    output = output or sys.stdout
+    stats = stats or sys.stderr
+    started = time.perf_counter()
+    store = load_store(catalogue_file_name)
+    file_names = find_order_files(patterns)
+    file_count = item_count = error_count = failed_file_count = 0
+    for result in checkout_files(store, file_names, processes):
+        output.write(json.dumps(result) + "\n")
+        file_count += 1
+        item_count += result["order_items"]
+        error_count += len(result.get("errors", ()))
+        failed_file_count += "error" in result
+    elapsed = time.perf_counter() - started
+    print(
+        f"Checked out {file_count} files ({failed_file_count} failed) with {item_count} order items "
+        f"({error_count} invalid) in {elapsed:.3f}s: {file_count / elapsed:.1f} files/s, {item_count / elapsed:.1f} order items/s.",
+        file=stats,
+    )
+    return 1 if failed_file_count else 0
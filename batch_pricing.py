@@ -0,0 +1,98 @@
+from product import Product
+from store import Store
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the batch functions fall back to the scalar path without it.
+    np = None
+
+
+def bundle_terms(product: Product):
+    """
+    Returns the (bundle size, bundle price) used to price the `product` with the bundle math.
+
+    A product without a special price is priced as a bundle of 1 at its unit price,
+    which gives exactly the same result as `quantity * unit_price`.
+    >>> bundle_terms(Product("A", 50, 3, 140))
+    (3, 140)
+    >>> bundle_terms(Product("C", 25))
+    (1, 25)
+    """
+    if product.special_quantity and product.special_price:
+        return product.special_quantity, product.special_price
+    return 1, product.unit_price
+
+
+def calculate_prices(product: Product, quantities):
+    """
+    Returns the total prices of the `product` for a batch of `quantities`.
+
+    If `quantities` is a NumPy integer array, the prices are calculated in one vectorized pass
+    and returned as a NumPy array. Otherwise a list is returned, calculated with `Product.calculate_price`.
+
+    Raises:
+        ValueError: If any of the quantities is not a non-negative integer.
+
+    >>> calculate_prices(Product("A", 50, 3, 140), [0, 1, 3, 4])
+    [0, 50, 140, 190]
+    """
+    if np is None or not isinstance(quantities, np.ndarray):
+        return [product.calculate_price(quantity) for quantity in quantities]
+    if not is_non_negative_int_array(quantities):
+        raise ValueError(f"The quantity of {product.get_item_code()} should be a non-negative integer.")
+    bundle_size, bundle_price = bundle_terms(product)
+    if bundle_size == 1:
+        return quantities * product.unit_price
+    bundle_count, remaining_item_count = np.divmod(quantities, bundle_size)
+    return bundle_count * bundle_price + remaining_item_count * product.unit_price
+
+
+def price_order_lines(store: Store, lines):
+    """
+    Returns the prices of a column of (code, quantity) `lines` priced against the products in the `store`.
+
+    With NumPy available, the lines are grouped by code and priced in one vectorized pass
+    and the prices are returned as a NumPy array. Otherwise a list is returned.
+
+    Raises:
+        ValueError: If a code is not in the store.
+        ValueError: If any of the quantities is not a non-negative integer.
+
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> store.add_product(Product("C", 25))
+    >>> [int(price) for price in price_order_lines(store, [("A", 4), ("C", 2), ("A", 3)])]
+    [190, 50, 140]
+    """
+    shelf = store.get_shelf()
+    lines = list(lines)
+    for code, _ in lines:
+        if code not in shelf:
+            raise ValueError(f"We don't have {code} in our store.")
+    if np is None:
+        return [shelf[code].calculate_price(quantity) for code, quantity in lines]
+    if not lines:
+        return np.array([], dtype=np.int64)
+
+    codes = [code for code, _ in lines]
+    quantities = np.array([quantity for _, quantity in lines])
+    if not is_non_negative_int_array(quantities):
+        for code, quantity in lines:
+            shelf[code].calculate_price(quantity)
+
+    # Look up each distinct code once and broadcast its pricing terms back to the lines.
+    distinct_codes = list(dict.fromkeys(codes))
+    code_index = {code: index for index, code in enumerate(distinct_codes)}
+    rows = np.fromiter((code_index[code] for code in codes), dtype=np.intp, count=len(codes))
+    terms = [bundle_terms(shelf[code]) for code in distinct_codes]
+    unit_prices = np.array([shelf[code].unit_price for code in distinct_codes])[rows]
+    bundle_sizes = np.array([size for size, _ in terms], dtype=np.int64)[rows]
+    bundle_prices = np.array([price for _, price in terms])[rows]
+
+    bundle_count, remaining_item_count = np.divmod(quantities, bundle_sizes)
+    return bundle_count * bundle_prices + remaining_item_count * unit_prices
+
+
+def is_non_negative_int_array(quantities):
+    """ Check if the NumPy array `quantities` only holds non-negative integers. """
+    return quantities.dtype.kind in "iu" and bool((quantities >= 0).all())
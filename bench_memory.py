@@ -0,0 +1,53 @@
+"""
+Compares the memory used by the catalogue layouts of the store.
+
+Usage:
+    python bench_memory.py [number of products]
+"""
+import sys
+import tracemalloc
+from compact_store import CompactStore
+from product import Product
+from store import Store
+
+
+class DictProduct(Product):
+    """ A product with a `__dict__`, like the products before `__slots__` was added. """
+
+
+def build_store(store_class, product_class, product_count: int):
+    """ Builds a store with `product_count` products, every third product having a special price. """
+    store = store_class()
+    for index in range(product_count):
+        if index % 3 == 0:
+            store.add_product(product_class(f"SKU{index}", 50 + index % 100, 3, 140))
+        else:
+            store.add_product(product_class(f"SKU{index}", 25 + index % 100))
+    return store
+
+
+def measure(build):
+    """ Returns the memory (in bytes) still allocated by the object returned by `build`. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return after - before
+
+
+def main(product_count: int=100_000):
+    layouts = {
+        "Store of dict products": lambda: build_store(Store, DictProduct, product_count),
+        "Store of slotted products": lambda: build_store(Store, Product, product_count),
+        "CompactStore": lambda: build_store(CompactStore, Product, product_count),
+    }
+    print(f"Memory used by a catalogue of {product_count} products:")
+    for name, build in layouts.items():
+        size = measure(build)
+        print(f"{name:>28}: {size / 2**20:8.1f} MiB ({size / product_count:6.1f} bytes per product)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
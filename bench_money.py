@@ -0,0 +1,73 @@
+"""
+Compares the throughput of `Cart.take_order` with prices as floats, as Decimals, and as integer cents,
+and the drift of a float subtotal accumulated over all the orders.
+
+Usage:
+    python bench_money.py [--skus N] [--order-size N] [--orders N] [--seed N]
+"""
+import argparse
+from decimal import Decimal
+from benchmark import OrderGenerator, generate_catalogue, measure, print_results
+from cart import Cart
+from money import CentsCart, CentsStore, from_cents
+from product import Product
+from store import Store
+
+
+def build_stores(sku_count: int, seed: int=0) -> dict:
+    """
+    Returns a store with the same catalogue for each money mode. The prices of the generated catalogue are used as cents,
+    so every price has a fractional part in the float and Decimal stores.
+    """
+    stores = {"float": Store(), "Decimal": Store(), "cents": CentsStore()}
+    for product in generate_catalogue(sku_count, seed=seed):
+        special_price = product.special_price
+        stores["float"].add_product(Product(
+            product.item_code, product.unit_price / 100, product.special_quantity, special_price / 100 if special_price else None,
+        ))
+        decimal_product = Product(
+            product.item_code, from_cents(product.unit_price), product.special_quantity, from_cents(special_price) if special_price else None,
+        )
+        stores["Decimal"].add_product(decimal_product)
+        stores["cents"].add_product(decimal_product)
+    return stores
+
+
+def run_money_benchmark(sku_count: int=10_000, order_size: int=100, order_count: int=200, seed: int=0) -> dict:
+    """ Runs `take_order` on the same orders in each money mode, and returns the results and the final subtotals. """
+    stores = build_stores(sku_count, seed)
+    generator = OrderGenerator(list(stores["cents"].get_shelf()), order_size, seed=seed)
+    orders = [generator.order() for _ in range(order_count)]
+    cart_classes = {"float": Cart, "Decimal": Cart, "cents": CentsCart}
+
+    results = []
+    subtotals = {}
+    for mode, store in stores.items():
+        cart_class = cart_classes[mode]
+        results.append(measure(f"take_order ({mode})", [lambda order=order: cart_class(store).take_order(order) for order in orders], order_size))
+        # One cart taking all the orders accumulates as many changes of its subtotal as possible.
+        cart = cart_class(store)
+        for order in orders:
+            cart.take_order(order)
+        subtotals[mode] = cart.get_subtotal()
+    return {"results": results, "subtotals": subtotals}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compare the money modes of the prices on take_order.")
+    parser.add_argument("--skus", type=int, default=10_000, help="number of products in the catalogue")
+    parser.add_argument("--order-size", type=int, default=100, help="number of order items in each order")
+    parser.add_argument("--orders", type=int, default=200, help="number of orders")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    args = parser.parse_args(arguments)
+
+    report = run_money_benchmark(args.skus, args.order_size, args.orders, args.seed)
+    print_results(report)
+    exact = report["subtotals"]["cents"]
+    print("\nSubtotal of all the orders in one cart:")
+    for mode, subtotal in report["subtotals"].items():
+        print(f"{mode:>9}: {subtotal!s:>24} (drift {Decimal(subtotal) - exact})")
+
+
+if __name__ == '__main__':
+    main()
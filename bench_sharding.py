@@ -0,0 +1,61 @@
+"""
+Measures how the throughput of `ShardRouter.take_orders` scales with the number of shards.
+
+Usage:
+    python bench_sharding.py [--max-shards N] [--skus N] [--carts N] [--orders N] [--order-size N] [--seed N]
+"""
+import argparse
+import os
+import time
+from benchmark import OrderGenerator, generate_catalogue
+from sharding import ShardRouter
+from store import Store
+
+
+def run_sharding_benchmark(max_shards: int=4, sku_count: int=10_000, cart_count: int=1000, order_count: int=4000,
+                           order_size: int=100, seed: int=0) -> list:
+    """ Takes the same orders with 1 to `max_shards` shards, and returns the results for each number of shards. """
+    store = Store()
+    for product in generate_catalogue(sku_count, seed=seed):
+        store.add_product(product)
+    generator = OrderGenerator(list(store.get_shelf()), order_size, seed=seed)
+    orders = [(f"customer-{index % cart_count}", generator.order()) for index in range(order_count)]
+
+    results = []
+    for shard_count in range(1, max_shards + 1):
+        with ShardRouter(store, shard_count) as router:
+            started = time.perf_counter()
+            router.take_orders(orders)
+            elapsed = time.perf_counter() - started
+            cart_counts = router.cart_counts()
+        results.append({
+            "shards": shard_count,
+            "seconds": elapsed,
+            "orders_per_second": order_count / elapsed if elapsed else 0,
+            "order_items_per_second": order_count * order_size / elapsed if elapsed else 0,
+            "carts_per_shard": sorted(cart_counts.values()),
+        })
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Measure the throughput of the sharded carts with 1 to N shards.")
+    parser.add_argument("--max-shards", type=int, default=os.cpu_count() or 1, help="largest number of shards")
+    parser.add_argument("--skus", type=int, default=10_000, help="number of products in the catalogue")
+    parser.add_argument("--carts", type=int, default=1000, help="number of carts")
+    parser.add_argument("--orders", type=int, default=4000, help="number of orders")
+    parser.add_argument("--order-size", type=int, default=100, help="number of order items in each order")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    args = parser.parse_args(arguments)
+
+    results = run_sharding_benchmark(args.max_shards, args.skus, args.carts, args.orders, args.order_size, args.seed)
+    print(f"{'shards':>6}{'orders/sec':>14}{'order items/sec':>18}{'speedup':>10}  carts per shard")
+    for result in results:
+        print(
+            f"{result['shards']:>6}{result['orders_per_second']:>14,.0f}{result['order_items_per_second']:>18,.0f}"
+            f"{result['orders_per_second'] / results[0]['orders_per_second']:>10.2f}  {result['carts_per_shard']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
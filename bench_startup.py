@@ -0,0 +1,108 @@
+"""
+Measures the startup of `main.py`: the time to the first subtotal for a small order file,
+and the modules imported on the way, from `python -X importtime`.
+
+Each scenario starts a fresh interpreter, like a job of a serverless worker, and is run `--runs` times.
+The "eager imports" scenario imports the modules `main.py` used to import at the top before running it,
+to compare with the lazy imports of `main.py`.
+
+Usage:
+    python bench_startup.py [--runs N] [--order-file data-set-1.json] [--top N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+EAGER_IMPORTS = "import argparse, json, numbers, sys, product, cart, store, order_reader"
+
+
+def scenarios(order_file: str) -> dict:
+    """ Returns the (arguments of the interpreter, standard input) of each scenario. """
+    return {
+        "interpreter only": (["-c", "pass"], ""),
+        "eager imports": (["-c", f"{EAGER_IMPORTS}; exec(compile(open('main.py').read(), 'main.py', 'exec'))"], order_file + "\n"),
+        "main.py": (["main.py"], order_file + "\n"),
+        "main.py --stream": (["main.py", "--stream"], order_file + "\n"),
+    }
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Returns the (module, self time, cumulative time) in microseconds of each module in the `-X importtime` output `stderr`,
+    with the nesting of the module in its name.
+
+    >>> parse_importtime("import time: self [us] | cumulative | imported package\\nimport time:       375 |        375 |   numbers\\n")
+    [('  numbers', 375, 375)]
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, cumulative_time, module = line[len("import time:"):].split("|")
+        if self_time.strip().isdigit():
+            modules.append((module[1:].rstrip(), int(self_time), int(cumulative_time)))
+    return modules
+
+
+def run_once(arguments: list, stdin: str, directory: str) -> dict:
+    """
+    Runs the interpreter with the `arguments`, and returns the time to the first subtotal (or to the exit of the interpreter
+    if it never prints a subtotal), and the modules it imported.
+    """
+    environment = dict(os.environ, PYTHONIOENCODING="utf-8")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", *arguments], cwd=directory, env=environment,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    process.stdin.write(stdin)
+    process.stdin.close()
+    first_subtotal = None
+    for line in process.stdout:
+        if first_subtotal is None and "Subtotal:" in line:
+            first_subtotal = time.perf_counter() - started
+    stderr = process.stderr.read()
+    process.wait()
+    exited = time.perf_counter() - started
+    return {"seconds": first_subtotal if first_subtotal is not None else exited, "modules": parse_importtime(stderr)}
+
+
+def run_startup_benchmark(runs: int=10, order_file: str="data-set-1.json", directory: str=None) -> list:
+    """ Runs each scenario `runs` times, and returns the median time to the first subtotal and the imports of each. """
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, (arguments, stdin) in scenarios(order_file).items():
+        measurements = [run_once(arguments, stdin, directory) for _ in range(runs)]
+        modules = measurements[-1]["modules"]
+        results.append({
+            "name": name,
+            "median_ms": statistics.median(measurement["seconds"] for measurement in measurements) * 1000,
+            "min_ms": min(measurement["seconds"] for measurement in measurements) * 1000,
+            "modules": len(modules),
+            "import_ms": sum(cumulative for module, _, cumulative in modules if not module.startswith(" ")) / 1000,
+            "slowest_imports": sorted(modules, key=lambda module: -module[1]),
+        })
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Measure the time to the first subtotal of main.py in a fresh interpreter.")
+    parser.add_argument("--runs", type=int, default=10, help="number of runs of each scenario")
+    parser.add_argument("--order-file", default="data-set-1.json", help="order file to check out")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports to show for each scenario")
+    args = parser.parse_args(arguments)
+
+    results = run_startup_benchmark(args.runs, args.order_file)
+    print(f"{'scenario':<20}{'first subtotal (ms)':>21}{'min (ms)':>10}{'imports (ms)':>14}{'modules':>9}")
+    for result in results:
+        print(f"{result['name']:<20}{result['median_ms']:>21.1f}{result['min_ms']:>10.1f}{result['import_ms']:>14.1f}{result['modules']:>9}")
+    for result in results:
+        slowest = ", ".join(f"{module.strip()} {self_time / 1000:.1f} ms" for module, self_time, _ in result["slowest_imports"][:args.top])
+        print(f"\nSlowest imports of {result['name']}: {slowest}")
+
+
+if __name__ == '__main__':
+    main()
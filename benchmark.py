@@ -0,0 +1,327 @@
+"""
+Benchmarks the checkout hot paths with synthetic catalogues and orders.
+
+Reports the throughput (operations per second), the p50 and p99 latencies and the peak memory of:
+    add_product:    adding a single order item with `Cart.add_product`
+    take_order:     taking a whole order with `Cart.take_order`
+    file_checkout:  checking out an order file like `main.main` does
+
+Usage:
+    python benchmark.py [--skus N] [--order-size N] [--orders N] [--skew S] [--invalid-share P] [--seed N] [--output results.json]
+                        [--compare-validation] [--compare-price-cache]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from cart import Cart
+from price_cache import PriceCache
+from product import Product
+from store import Store
+
+
+def generate_catalogue(sku_count: int, special_share: float=0.3, seed: int=0) -> list:
+    """
+    Returns `sku_count` products, of which about `special_share` have a special price.
+
+    >>> [product.get_item_code() for product in generate_catalogue(3)]
+    ['SKU0', 'SKU1', 'SKU2']
+    """
+    rng = random.Random(seed)
+    products = []
+    for index in range(sku_count):
+        unit_price = rng.randint(1, 100)
+        if rng.random() < special_share:
+            special_quantity = rng.randint(2, 5)
+            products.append(Product(f"SKU{index}", unit_price, special_quantity, unit_price * special_quantity - rng.randint(1, unit_price)))
+        else:
+            products.append(Product(f"SKU{index}", unit_price))
+    return products
+
+
+class OrderGenerator:
+    """
+    Generates synthetic orders in the `Cart.take_order` format.
+
+    The item codes are drawn with a Zipf-like distribution: the code of rank `i` is drawn
+    with a weight of `1 / (i + 1) ** skew`, so a `skew` of 0 draws all the codes uniformly.
+    About `invalid_share` of the order items are invalid.
+    """
+    def __init__(self, codes: list, order_size: int, skew: float=1.0, invalid_share: float=0.0, seed: int=0):
+        """
+        Raises:
+            ValueError: If there are no codes, or the order size is not a positive integer.
+            ValueError: If `skew` is negative or `invalid_share` is not between 0 and 1.
+        """
+        if not codes:
+            raise ValueError("There should be at least one item code.")
+        if not isinstance(order_size, int) or order_size <= 0:
+            raise ValueError("The order size should be a positive integer.")
+        if skew < 0:
+            raise ValueError("The skew should be non-negative.")
+        if not 0 <= invalid_share <= 1:
+            raise ValueError("The share of invalid order items should be between 0 and 1.")
+        self.codes = list(codes)
+        self.order_size = order_size
+        self.invalid_share = invalid_share
+        self.rng = random.Random(seed)
+        cumulative_weight = 0
+        self.cumulative_weights = []
+        for rank in range(len(self.codes)):
+            cumulative_weight += 1 / (rank + 1) ** skew
+            self.cumulative_weights.append(cumulative_weight)
+
+    def order_item(self):
+        """ Returns one valid or invalid order item. """
+        code = self.rng.choices(self.codes, cum_weights=self.cumulative_weights)[0]
+        quantity = self.rng.randint(1, 10)
+        if self.rng.random() >= self.invalid_share:
+            return {"code": code, "quantity": quantity}
+        return self.rng.choice([
+            {"code": code},
+            {"quantity": quantity},
+            {"code": code, "quantity": -quantity},
+            {"code": code, "quantity": "Not integer"},
+            {"code": "NOT A SKU", "quantity": quantity},
+            [code, quantity],
+        ])
+
+    def order(self) -> list:
+        """ Returns one order of `order_size` order items. """
+        return [self.order_item() for _ in range(self.order_size)]
+
+
+def percentile(sorted_values: list, fraction: float):
+    """
+    Returns the `fraction` percentile of the `sorted_values` with the nearest-rank method.
+
+    >>> percentile([1, 2, 3, 4], 0.5)
+    2
+    """
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * fraction // 1))
+    return sorted_values[int(rank) - 1]
+
+
+def measure(name: str, operations, operation_count: int=1) -> dict:
+    """
+    Runs each of the `operations` (callables taking no argument) once, and returns the results of the benchmark `name`.
+    Each operation counts as `operation_count` operations for the throughput.
+    Then runs the operations again under `tracemalloc` to measure the peak memory.
+
+    Operations that change a shared state, like a cart they all add to, should be given as a function
+    returning a new list of operations with a new state, so that the second run starts from the same state as the first.
+    """
+    make_operations = operations if callable(operations) else lambda: operations
+    latencies = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        timed_operations = list(make_operations())
+        started = time.perf_counter()
+        for operation in timed_operations:
+            operation_started = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - operation_started)
+        elapsed = time.perf_counter() - started
+
+        traced_operations = list(make_operations())
+        tracemalloc.start()
+        for operation in traced_operations:
+            operation()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "name": name,
+        "operations": len(latencies) * operation_count,
+        "seconds": elapsed,
+        "ops_per_second": len(latencies) * operation_count / elapsed if elapsed else 0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run_benchmarks(sku_count: int=10_000, order_size: int=100, order_count: int=200,
+                   skew: float=1.0, invalid_share: float=0.1, seed: int=0) -> dict:
+    """ Runs all the benchmarks and returns the parameters and the results. """
+    store = Store()
+    for product in generate_catalogue(sku_count, seed=seed):
+        store.add_product(product)
+    generator = OrderGenerator(list(store.get_shelf()), order_size, skew, invalid_share, seed)
+    orders = [generator.order() for _ in range(order_count)]
+
+    def add_product_operations():
+        cart = Cart(store)
+        for order in orders:
+            for order_item in order:
+                if isinstance(order_item, dict) and "code" in order_item and "quantity" in order_item:
+                    yield lambda item=order_item: add_product_or_error(cart, item["code"], item["quantity"])
+
+    def take_order_operations():
+        for order in orders:
+            yield lambda order=order: Cart(store).take_order(order)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_names = []
+        for index, order in enumerate(orders):
+            file_name = os.path.join(directory, f"order-{index}.json")
+            with open(file_name, "w") as f:
+                json.dump(order, f)
+            file_names.append(file_name)
+
+        results = [
+            # A new cart for each run, so the memory run does not add to the cart filled by the timed run.
+            measure("add_product", add_product_operations),
+            measure("take_order", list(take_order_operations()), order_size),
+            measure("file_checkout", [lambda file_name=file_name: checkout_file_like_main(store, file_name) for file_name in file_names], order_size),
+        ]
+
+    return {
+        "parameters": {
+            "skus": sku_count,
+            "order_size": order_size,
+            "orders": order_count,
+            "skew": skew,
+            "invalid_share": invalid_share,
+            "seed": seed,
+        },
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+
+
+def run_validation_benchmark(sku_count: int=10_000, order_size: int=100, order_count: int=200,
+                             invalid_share: float=0.5, seed: int=0) -> list:
+    """
+    Compares `Cart.take_order` on dirty orders with the single-pass validation of `validation.py`,
+    and with the exception-driven validation it replaced.
+    """
+    store = Store()
+    for product in generate_catalogue(sku_count, seed=seed):
+        store.add_product(product)
+    generator = OrderGenerator(list(store.get_shelf()), order_size, 1.0, invalid_share, seed)
+    orders = [generator.order() for _ in range(order_count)]
+    operations = [lambda order=order: Cart(store).take_order(order) for order in orders]
+
+    results = [measure("take_order_dirty", operations, order_size)]
+    single_pass_check_order_item = Cart.check_order_item
+    Cart.check_order_item = exception_check_order_item
+    try:
+        results.append(measure("take_order_dirty_exceptions", operations, order_size))
+    finally:
+        Cart.check_order_item = single_pass_check_order_item
+    return results
+
+
+def run_price_cache_benchmark(sku_count: int=10_000, order_size: int=100, order_count: int=200, skew: float=1.0, seed: int=0) -> list:
+    """
+    Compares pricing the order lines with `Product.calculate_price` and with a warm `PriceCache`,
+    and `Cart.take_order` without and with a shared `PriceCache`.
+    Each operation prices the lines of a whole order, so the cost of the call to the operation does not hide the difference.
+    """
+    store = Store()
+    for product in generate_catalogue(sku_count, seed=seed):
+        store.add_product(product)
+    shelf = store.get_shelf()
+    generator = OrderGenerator(list(shelf), order_size, skew, 0.0, seed)
+    orders = [generator.order() for _ in range(order_count)]
+    order_lines = [[(shelf[item["code"]], item["quantity"]) for item in order] for order in orders]
+    cache = PriceCache(max_size=sku_count * 10)
+    for lines in order_lines:
+        for product, quantity in lines:
+            cache.calculate_price(product, quantity, True)
+
+    def price_directly(lines):
+        for product, quantity in lines:
+            product.calculate_price(quantity, True)
+
+    def price_with_cache(lines):
+        calculate_price = cache.calculate_price
+        for product, quantity in lines:
+            calculate_price(product, quantity, True)
+
+    return [
+        measure("calculate_price", [lambda lines=lines: price_directly(lines) for lines in order_lines], order_size),
+        measure("calculate_price_cached", [lambda lines=lines: price_with_cache(lines) for lines in order_lines], order_size),
+        measure("take_order", [lambda order=order: Cart(store).take_order(order) for order in orders], order_size),
+        measure("take_order_cached", [lambda order=order: Cart(store, cache).take_order(order) for order in orders], order_size),
+    ]
+
+
+def exception_check_order_item(cart: Cart, order_item):
+    """ Checks an order item like `Cart.check_order_item` did before `validation.py`, by raising and catching exceptions. """
+    if not isinstance(order_item, dict):
+        return None, None, f"The order item {order_item} is not a dictionary."
+    try:
+        product = order_item['code']
+        quantity = order_item['quantity']
+        cart.validate_order_line(product, quantity)
+    except KeyError as e:
+        return None, None, f"An error occurred: Cannot retrieve {e} from the order item: {order_item}."
+    except Exception as e:
+        return None, None, f"An error occurred: {e}"
+    return str(product), quantity, None
+
+
+def add_product_or_error(cart: Cart, product, quantity):
+    """ Adds a product to the `cart`, ignoring invalid products and quantities. """
+    try:
+        cart.add_product(product, quantity)
+    except (TypeError, ValueError):
+        pass
+
+
+def checkout_file_like_main(store: Store, file_name: str):
+    """ Checks out the order in the file named `file_name` like `main.main` does. """
+    cart = Cart(store)
+    with open(file_name, "r") as f:
+        cart.take_order(json.load(f))
+    print(f"Shopping cart content: {cart.get_cart()}\n")
+    print(f"Subtotal: {cart.get_subtotal()}")
+
+
+def print_results(report: dict):
+    """ Prints the results of the benchmarks as a table. """
+    print(f"{'benchmark':<29}{'ops/sec':>14}{'p50 (ms)':>12}{'p99 (ms)':>12}{'peak memory (KiB)':>20}")
+    for result in report["results"]:
+        print(
+            f"{result['name']:<29}{result['ops_per_second']:>14,.0f}{result['p50_ms']:>12.4f}"
+            f"{result['p99_ms']:>12.4f}{result['peak_memory_bytes'] / 1024:>20,.1f}"
+        )
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark the checkout hot paths.")
+    parser.add_argument("--skus", type=int, default=10_000, help="number of products in the catalogue")
+    parser.add_argument("--order-size", type=int, default=100, help="number of order items in each order")
+    parser.add_argument("--orders", type=int, default=200, help="number of orders")
+    parser.add_argument("--skew", type=float, default=1.0, help="skew of the Zipf-like distribution of the item codes")
+    parser.add_argument("--invalid-share", type=float, default=0.1, help="share of invalid order items")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--compare-validation", action="store_true",
+                        help="also compare take_order on dirty orders with the single-pass and the exception-driven validation")
+    parser.add_argument("--compare-price-cache", action="store_true",
+                        help="also compare pricing without and with a warm PriceCache")
+    args = parser.parse_args(arguments)
+
+    report = run_benchmarks(args.skus, args.order_size, args.orders, args.skew, args.invalid_share, args.seed)
+    if args.compare_validation:
+        report["results"] += run_validation_benchmark(args.skus, args.order_size, args.orders, max(args.invalid_share, 0.5), args.seed)
+    if args.compare_price_cache:
+        report["results"] += run_price_cache_benchmark(args.skus, args.order_size, args.orders, args.skew, args.seed)
+    print_results(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
+from collections.abc import Iterable, Mapping
 from store import Store
 from product import Product
+from validation import validate_order_item
 
 class Cart:
     """
@@ -9,17 +11,20 @@ class Cart:
         cart: A dictionary where the keys are product names and the values are quantities.
         subtotal: The current subtotal of the shopping cart.
         store: The store where the cart is shopping.
+        price_cache: The cache of the product prices, or None if the prices are not cached.
     """
-    def __init__(self, store: Store):
+    def __init__(self, store: Store, price_cache=None):
         """
         Initialize an empty shopping cart with a subtotal of 0 in a given store.
 
         Args:
             store (Store): The store where the cart is shopping.
+            price_cache (PriceCache): An optional cache of the product prices, which can be shared by many carts.
         """
         self.cart = {}
         self.subtotal = 0
         self.store = store
+        self.price_cache = price_cache
 
     def get_cart(self):
         """
@@ -53,30 +58,98 @@ class Cart:
         >>> cart.get_cart()
         {'A': 3}
         """
+        self.validate_order_line(product, quantity)
+        if quantity != 0:
+            self.add_valid_product(str(product), quantity)
+
+    def validate_order_line(self, product, quantity):
+        """
+        Check if a `product` with a given `quantity` can be added to the shopping cart.
+
+        Raises:
+            TypeError: If the `product` is None or empty.
+            TypeError: If the `quantity` is not a non-negative integer.
+            ValueError: If the `product` is not in the store.
+        """
         if not product:
             raise TypeError(f"Invalid product {product}.")
         if not isinstance(quantity, int) or quantity < 0:
             raise TypeError(f"The quantity of {product} should be a non-negative integer.")
         if product not in self.store.get_shelf():
             raise ValueError(f"We don't have {product} in our store.")
-        if quantity != 0:
-            product = str(product)
-            quantity_before = self.cart.get(product, 0)
-            quantity_after = quantity_before + quantity
+
+    def add_valid_product(self, product: str, quantity: int):
+        """ Adds a `product` with a given `quantity` that has already been validated to the shopping cart. """
+        self.set_valid_quantity(product, self.cart.get(product, 0) + quantity)
+
+    def set_quantity(self, product: str, quantity: int):
+        """
+        Sets the quantity of a `product` in the shopping cart to `quantity`,
+        and updates the subtotal by the price difference only. A `quantity` of 0 removes the product.
+
+        Raises:
+            TypeError: If the `product` is None or empty.
+            TypeError: If the `quantity` is not a non-negative integer.
+            ValueError: If the `product` is not in the store.
+
+        >>> store = Store()
+        >>> store.add_product(Product("A", 50, 3, 140))
+        >>> cart = Cart(store)
+        >>> cart.add_product("A", 4)
+        >>> cart.set_quantity("A", 3)
+        >>> cart.get_cart(), cart.get_subtotal()
+        ({'A': 3}, 140)
+        """
+        self.validate_order_line(product, quantity)
+        self.set_valid_quantity(str(product), quantity)
+
+    def remove_product(self, product: str):
+        """
+        Removes a `product` from the shopping cart.
+
+        Raises:
+            TypeError: If the `product` is None or empty.
+            ValueError: If the `product` is not in the shopping cart.
+        """
+        if not product:
+            raise TypeError(f"Invalid product {product}.")
+        if str(product) not in self.cart:
+            raise ValueError(f"There is no {product} in the shopping cart.")
+        self.set_valid_quantity(str(product), 0)
+
+    def set_valid_quantity(self, product: str, quantity_after: int):
+        """ Sets the quantity of a `product` that has already been validated to `quantity_after`, and updates the subtotal. """
+        quantity_before = self.cart.get(product, 0)
+        if quantity_after:
             self.cart[product] = quantity_after
-            product_instance = self.store.get_shelf().get(product)
-            price_difference = product_instance.price_difference(quantity_before, quantity_after)
-            self.update_subtotal(price_difference)
-    
+        else:
+            self.cart.pop(product, None)
+        product_instance = self.store.get_shelf()[product]
+        if self.price_cache is None:
+            price_difference = product_instance.price_difference(quantity_before, quantity_after, trusted=True)
+        else:
+            price_difference = self.price_cache.price_difference(product_instance, quantity_before, quantity_after, trusted=True)
+        self.update_subtotal(price_difference)
+
 
-    def take_order(self, data: list):
+    def take_order(self, data: Iterable, aggregate: bool=False, errors: list=None):
         """ 
         Takes an order from the `data` and adds the products in the data to the shopping cart.
         The shopping cart only handles valid products and quantities. 
-        Invalid products or quantities will be printed to the terminal.
+        Invalid products or quantities will be printed to the terminal, or appended to `errors`.
         
         Args:
-            data (list): The order, represented as a list of dictionaries. Each dictionary should have a 'code' key and a 'quantity' key.
+            data (Iterable): The order, represented as a list (or any other iterable, such as a generator) of dictionaries. 
+                Each dictionary should have a 'code' key and a 'quantity' key.
+            aggregate (bool): If True, the quantities of the valid order items are first summed per product, 
+                and then each product is priced once, instead of once per order item. 
+                This is faster for orders with many order items for the same products. With integer or Decimal prices
+                it gives the same result; with float prices the subtotal is rounded differently,
+                so it may differ in the last digits from the subtotal of the order items taken one by one.
+            errors (list): If given, the messages for the invalid order items are appended to this list instead of being printed.
+
+        The order items are added as they are read. If reading the `data` raises partway, for example
+        a stream that is not valid JSON, the exception is raised and the order items read before it stay in the cart.
         
         Example of data:
         ```
@@ -84,18 +157,74 @@ class Cart:
 
         ```
         """
-        if not data or not isinstance(data, list):
-            print(f"The data {data} is not a valid list.")
+        if not is_order_iterable(data) or (isinstance(data, list) and not data):
+            report_error(f"The data {data} is not a valid list.", errors)
+            return
+        if not aggregate:
+            for product, quantity in self.iter_valid_order_lines(data, errors):
+                self.add_valid_product(product, quantity)
             return
+        quantities = {}
+        for product, quantity in self.iter_valid_order_lines(data, errors):
+            quantities[product] = quantities.get(product, 0) + quantity
+        for product, quantity in quantities.items():
+            self.add_valid_product(product, quantity)
+
+    def iter_valid_order_lines(self, data: Iterable, errors: list=None):
+        """
+        Yields the (product, quantity) of each valid order item with a non-zero quantity in the `data`.
+        Invalid order items will be printed to the terminal, or appended to `errors` if it is given.
+        """
+        item_count = 0
         for order_item in data:
-            if not isinstance(order_item, dict):
-                print(f"The order item {order_item} is not a dictionary.")
-                continue
-            try:
-                product = order_item['code']
-                quantity = order_item['quantity']
-                self.add_product(product, quantity)
-            except KeyError as e:
-                print(f"An error occurred: Cannot retrieve {e} from the order item: {order_item}.")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+            item_count += 1
+            product, quantity, error = self.check_order_item(order_item)
+            if error:
+                report_error(error, errors)
+            elif quantity != 0:
+                yield product, quantity
+        if item_count == 0:
+            # An empty list is reported by `take_order`, so this is an iterable such as a stream, whose repr says nothing.
+            report_error("The order is empty.", errors)
+
+    def check_order_item(self, order_item):
+        """
+        Checks an `order_item` of an order without adding it to the shopping cart, without raising exceptions.
+
+        Returns:
+            tuple: The (product, quantity, error) of the order item. 
+                If the order item is invalid, `product` and `quantity` are None and `error` is the error message.
+                Otherwise `error` is None.
+
+        >>> store = Store()
+        >>> store.add_product(Product("A", 50, 3, 140))
+        >>> cart = Cart(store)
+        >>> cart.check_order_item({"code": "A", "quantity": 3})
+        ('A', 3, None)
+        >>> cart.check_order_item({"code": "A"})
+        (None, None, "An error occurred: Cannot retrieve 'quantity' from the order item: {'code': 'A'}.")
+        """
+        product, quantity, _, message = validate_order_item(order_item, self.store.get_shelf())
+        return product, quantity, message
+
+
+def report_error(message: str, errors: list=None):
+    """ Prints the error `message`, or appends it to the `errors` if they are given. """
+    if errors is None:
+        print(message)
+    else:
+        errors.append(message)
+
+
+def is_order_iterable(data):
+    """
+    Check if `data` can be iterated over as a sequence of order items.
+    Dictionaries and strings are iterable, but they are not valid orders.
+    >>> is_order_iterable([{"code": "A", "quantity": 3}])
+    True
+    >>> is_order_iterable(item for item in [])
+    True
+    >>> is_order_iterable({"code": "A", "quantity": 3})
+    False
+    """
+    return isinstance(data, Iterable) and not isinstance(data, (Mapping, str, bytes))
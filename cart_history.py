@@ -0,0 +1,98 @@
+from cart import Cart
+from store import Store
+
+
+class HistoryCart(Cart):
+    """
+    A shopping cart that records every change in an append-only operation log,
+    so that changes can be undone and redone, and the cart can be replayed to any point in time.
+
+    Each change is logged as a (product, quantity before, quantity after) tuple,
+    so undoing, redoing and replaying a change only re-prices the product of the change.
+    Undos and redos are logged as changes too, and the log is never rewritten.
+
+    Attributes:
+        log: The list of (product, quantity before, quantity after) changes.
+        undo_stack: The positions in the log of the changes that can be undone.
+        redo_stack: The positions in the log of the changes that can be redone.
+    """
+    def __init__(self, store: Store, price_cache=None):
+        """ Initialize an empty shopping cart with a subtotal of 0 and an empty log in a given store. """
+        super().__init__(store, price_cache)
+        self.log = []
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def set_valid_quantity(self, product: str, quantity_after: int):
+        """ Sets the quantity of a `product` that has already been validated to `quantity_after`, and logs the change. """
+        if self.log_change(product, quantity_after):
+            self.undo_stack.append(len(self.log) - 1)
+            self.redo_stack.clear()
+
+    def log_change(self, product: str, quantity_after: int) -> bool:
+        """ Applies and logs a change of the quantity of a `product`. Returns False if the quantity did not change. """
+        quantity_before = self.cart.get(product, 0)
+        if quantity_before == quantity_after:
+            return False
+        super().set_valid_quantity(product, quantity_after)
+        self.log.append((product, quantity_before, quantity_after))
+        return True
+
+    def undo(self):
+        """
+        Undoes the last change that has not been undone yet.
+
+        Raises:
+            IndexError: If there is no change to undo.
+
+        >>> from product import Product
+        >>> store = Store()
+        >>> store.add_product(Product("A", 50, 3, 140))
+        >>> cart = HistoryCart(store)
+        >>> cart.add_product("A", 2)
+        >>> cart.add_product("A", 1)
+        >>> cart.undo()
+        >>> cart.get_cart(), cart.get_subtotal()
+        ({'A': 2}, 100)
+        >>> cart.redo()
+        >>> cart.get_cart(), cart.get_subtotal()
+        ({'A': 3}, 140)
+        """
+        if not self.undo_stack:
+            raise IndexError("There is no change to undo.")
+        position = self.undo_stack.pop()
+        product, quantity_before, _ = self.log[position]
+        self.log_change(product, quantity_before)
+        self.redo_stack.append(position)
+
+    def redo(self):
+        """
+        Redoes the last undone change.
+
+        Raises:
+            IndexError: If there is no change to redo.
+        """
+        if not self.redo_stack:
+            raise IndexError("There is no change to redo.")
+        position = self.redo_stack.pop()
+        product, _, quantity_after = self.log[position]
+        self.log_change(product, quantity_after)
+        self.undo_stack.append(position)
+
+    def replay(self, position: int) -> Cart:
+        """
+        Returns a new cart with the content of this cart after the first `position` changes of the log.
+
+        Raises:
+            ValueError: If `position` is not between 0 and the length of the log.
+        """
+        if not isinstance(position, int) or not 0 <= position <= len(self.log):
+            raise ValueError(f"The position should be between 0 and {len(self.log)}.")
+        quantities = {}
+        for product, _, quantity_after in self.log[:position]:
+            quantities[product] = quantity_after
+        cart = Cart(self.store, self.price_cache)
+        for product, quantity in quantities.items():
+            if quantity:
+                cart.set_valid_quantity(product, quantity)
+        return cart
@@ -0,0 +1,301 @@
+"""
+Durable shopping carts, recovered after a crash from a snapshot and a write-ahead log.
+
+Each change of a `JournaledCart` is appended to the log as the new quantity of the product,
+so replaying a change more than once gives the same cart. The log is written in batches,
+with one fsync for all the changes of a batch (group commit), and periodically compacted into a snapshot
+of the content and the subtotal of every cart. Recovering only replays the changes logged after the snapshot.
+
+`CartJournal` keeps the log and the snapshots in files in a directory, and `SqliteCartJournal` in an SQLite database.
+"""
+import json
+import os
+import sqlite3
+from decimal import Decimal
+from cart import Cart
+from store import Store
+
+
+class JournaledCart(Cart):
+    """
+    A shopping cart whose changes are recorded in a journal.
+
+    Attributes:
+        cart_id: The id of the cart in the journal.
+        journal: The journal recording the changes.
+    """
+    def __init__(self, store: Store, cart_id, journal):
+        super().__init__(store)
+        self.cart_id = cart_id
+        self.journal = journal
+
+    def set_valid_quantity(self, product: str, quantity_after: int):
+        """ Sets the quantity of a `product` that has already been validated to `quantity_after`, and records the change. """
+        super().set_valid_quantity(product, quantity_after)
+        self.journal.record(self.cart_id, product, quantity_after)
+
+
+class BaseCartJournal:
+    """
+    The part of a journal shared by all the backends.
+
+    Attributes:
+        store: The store where the carts are shopping.
+        carts: A dictionary where the keys are cart ids and the values are `JournaledCart`s.
+        batch_size: The number of changes written before they are committed.
+        snapshot_every: The number of changes after which a snapshot is taken, or None to only take snapshots explicitly.
+
+    The changes of a batch that is not full yet are only committed on `commit`, `snapshot` or `close`, however long ago
+    they were made. Call `commit` to bound how long a change can stay uncommitted, for example at the end of each request.
+    """
+    def __init__(self, store: Store, batch_size: int=64, snapshot_every: int=None):
+        """
+        Raises:
+            ValueError: If `batch_size` or `snapshot_every` is not a positive integer.
+        """
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise ValueError("The batch size should be a positive integer.")
+        if snapshot_every is not None and (not isinstance(snapshot_every, int) or snapshot_every <= 0):
+            raise ValueError("The number of changes between snapshots should be a positive integer.")
+        self.store = store
+        self.carts = {}
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.pending_changes = 0
+        self.changes_since_snapshot = 0
+        self.replaying = False
+
+    def open_cart(self, cart_id) -> JournaledCart:
+        """
+        Returns the cart with the `cart_id`, creating an empty cart if there is none.
+
+        Raises:
+            TypeError: If `cart_id` is neither a string nor an integer, which are the ids the journal recovers unchanged.
+        """
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            if not isinstance(cart_id, (str, int)) or isinstance(cart_id, bool):
+                raise TypeError("The cart id should be a string or an integer.")
+            cart = self.carts[cart_id] = JournaledCart(self.store, cart_id, self)
+        return cart
+
+    def record(self, cart_id, product: str, quantity: int):
+        """ Records that the quantity of the `product` in the cart `cart_id` is now `quantity`. """
+        if self.replaying:
+            return
+        self.append(cart_id, product, quantity)
+        self.pending_changes += 1
+        self.changes_since_snapshot += 1
+        if self.snapshot_every is not None and self.changes_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        elif self.pending_changes >= self.batch_size:
+            self.commit()
+
+    def restore(self, cart_id, content: dict, subtotal):
+        """ Restores a cart from a snapshot, without pricing it again. """
+        cart = self.open_cart(cart_id)
+        cart.cart = dict(content)
+        cart.subtotal = decode_subtotal(subtotal)
+
+    def replay(self, cart_id, product: str, quantity: int):
+        """ Applies a logged change to a cart, without recording it again. """
+        self.replaying = True
+        try:
+            self.open_cart(cart_id).set_valid_quantity(product, quantity)
+        finally:
+            self.replaying = False
+
+    def snapshot_rows(self):
+        """ Returns the (cart id, content, subtotal) of every non-empty cart, with the subtotals encoded by `encode_subtotal`. """
+        return [[cart_id, cart.cart, encode_subtotal(cart.subtotal)] for cart_id, cart in self.carts.items() if cart.cart]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CartJournal(BaseCartJournal):
+    """
+    A journal that keeps the write-ahead log and the snapshots in files in a `directory`.
+
+    The log is split into segments. A snapshot starts a new segment and deletes the segments it compacts.
+
+    >>> import tempfile
+    >>> from product import Product
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> with CartJournal(directory.name, store) as journal:
+    ...     journal.open_cart("customer-1").add_product("A", 4)
+    >>> CartJournal(directory.name, store).carts["customer-1"].get_subtotal()
+    190
+    """
+    def __init__(self, directory: str, store: Store, batch_size: int=64, snapshot_every: int=None):
+        """ Opens the journal in the `directory`, recovering the carts from it. """
+        super().__init__(store, batch_size, snapshot_every)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment = self.recover()
+        self.log_file = open(self.segment_path(self.segment), "a", encoding="utf-8")
+        fsync_directory(directory)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def segments(self) -> list:
+        """ Returns the numbers of the log segments in the directory, in ascending order. """
+        return sorted(
+            int(name[4:-4]) for name in os.listdir(self.directory)
+            if name.startswith("wal-") and name.endswith(".log") and name[4:-4].isdigit()
+        )
+
+    def recover(self) -> int:
+        """ Loads the snapshot and replays the log after it. Returns the number of the segment to write next. """
+        first_segment = 0
+        if os.path.exists(self.snapshot_path()):
+            with open(self.snapshot_path(), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            first_segment = snapshot["segment"]
+            for cart_id, content, subtotal in snapshot["carts"]:
+                self.restore(cart_id, content, subtotal)
+
+        segments = [segment for segment in self.segments() if segment >= first_segment]
+        for segment in segments:
+            with open(self.segment_path(segment), "r", encoding="utf-8") as f:
+                for line in f:
+                    # A crash can leave the last line of a segment incomplete.
+                    if not line.endswith("\n"):
+                        break
+                    cart_id, product, quantity = json.loads(line)
+                    self.replay(cart_id, product, quantity)
+        # Writing to a new segment never appends after an incomplete line.
+        return max(segments, default=first_segment - 1) + 1
+
+    def append(self, cart_id, product: str, quantity: int):
+        self.log_file.write(json.dumps([cart_id, product, quantity]) + "\n")
+
+    def commit(self):
+        """ Writes the pending changes to the log and waits until they are on disk. """
+        if self.pending_changes:
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            self.pending_changes = 0
+
+    def snapshot(self):
+        """
+        Writes a snapshot of all the carts, and deletes the log segments it replaces.
+        If the snapshot cannot be written, the journal keeps logging to the current segment.
+        """
+        self.commit()
+        temporary_path = self.snapshot_path() + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as f:
+                json.dump({"segment": self.segment + 1, "carts": self.snapshot_rows()}, f)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self.log_file.close()
+        self.segment += 1
+        os.replace(temporary_path, self.snapshot_path())
+        # The old segments can only be deleted once the new snapshot is in the directory on disk.
+        fsync_directory(self.directory)
+        for segment in self.segments():
+            if segment < self.segment:
+                os.remove(self.segment_path(segment))
+        self.log_file = open(self.segment_path(self.segment), "a", encoding="utf-8")
+        fsync_directory(self.directory)
+        self.changes_since_snapshot = 0
+
+    def close(self):
+        """ Commits the pending changes and closes the log. """
+        if not self.log_file.closed:
+            self.commit()
+            self.log_file.close()
+
+
+def encode_subtotal(subtotal):
+    """
+    Returns the `subtotal` in a form that JSON and SQLite keep exactly: `Decimal` subtotals as strings.
+
+    >>> encode_subtotal(Decimal("1.40")), encode_subtotal(190)
+    ('1.40', 190)
+    """
+    return str(subtotal) if isinstance(subtotal, Decimal) else subtotal
+
+
+def decode_subtotal(value):
+    """
+    Returns the subtotal encoded by `encode_subtotal` as `value`.
+
+    >>> decode_subtotal("1.40"), decode_subtotal(190)
+    (Decimal('1.40'), 190)
+    """
+    return Decimal(value) if isinstance(value, str) else value
+
+
+def fsync_directory(directory: str):
+    """
+    Waits until the entries of the `directory`, like a renamed or a new file, are on disk.
+    Does nothing on the platforms where a directory cannot be opened, like Windows.
+    """
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class SqliteCartJournal(BaseCartJournal):
+    """ A journal that keeps the write-ahead log and the snapshot in an SQLite `database`. """
+    def __init__(self, database: str, store: Store, batch_size: int=64, snapshot_every: int=None):
+        """ Opens the journal in the `database`, recovering the carts from it. """
+        super().__init__(store, batch_size, snapshot_every)
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY, cart_id, code TEXT, quantity INTEGER);
+            CREATE TABLE IF NOT EXISTS snapshot (cart_id PRIMARY KEY, content TEXT, subtotal);
+        """)
+        self.recover()
+
+    def recover(self):
+        """ Loads the snapshot and replays the changes after it. """
+        for cart_id, content, subtotal in self.connection.execute("SELECT cart_id, content, subtotal FROM snapshot"):
+            self.restore(cart_id, json.loads(content), subtotal)
+        for cart_id, product, quantity in self.connection.execute("SELECT cart_id, code, quantity FROM changes ORDER BY seq"):
+            self.replay(cart_id, product, quantity)
+
+    def append(self, cart_id, product: str, quantity: int):
+        self.connection.execute("INSERT INTO changes (cart_id, code, quantity) VALUES (?, ?, ?)", (cart_id, product, quantity))
+
+    def commit(self):
+        """ Commits the pending changes. """
+        if self.pending_changes:
+            self.connection.commit()
+            self.pending_changes = 0
+
+    def snapshot(self):
+        """ Replaces the snapshot with all the carts, and deletes the changes it replaces, in one transaction. """
+        with self.connection:
+            self.connection.execute("DELETE FROM snapshot")
+            self.connection.executemany(
+                "INSERT INTO snapshot (cart_id, content, subtotal) VALUES (?, ?, ?)",
+                [(cart_id, json.dumps(content), subtotal) for cart_id, content, subtotal in self.snapshot_rows()],
+            )
+            self.connection.execute("DELETE FROM changes")
+        self.pending_changes = 0
+        self.changes_since_snapshot = 0
+
+    def close(self):
+        """ Commits the pending changes and closes the database. """
+        self.commit()
+        self.connection.close()
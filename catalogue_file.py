@@ -0,0 +1,251 @@
+"""
+Compiles a catalogue of products into a fixed-layout binary file,
+and loads a store from such a file without building the products up front.
+
+The file starts with a header, followed by a hash table and the product records:
+
+    header:     magic (4 bytes), version (uint32), product count (uint32), slot count (uint32), code width (uint32)
+    hash table: slot count x uint32, the row of the product in the slot plus 1, or 0 for an empty slot
+    records:    product count x (code, flags, unit price, special quantity, special price)
+
+Usage:
+    python catalogue_file.py <catalogue.json> <catalogue.bin>
+"""
+import json
+import mmap
+import struct
+import sys
+import zlib
+from collections.abc import Mapping
+from compact_store import make_product, validate_compact_price
+from product import Product
+from store import Store
+
+MAGIC = b"CART"
+VERSION = 1
+HEADER = struct.Struct("<4sIIII")
+SLOT = struct.Struct("<I")
+
+UNIT_PRICE_IS_FLOAT = 1
+SPECIAL_PRICE_IS_FLOAT = 2
+HAS_SPECIAL_QUANTITY = 4
+HAS_SPECIAL_PRICE = 8
+
+
+def record_struct(code_width: int) -> struct.Struct:
+    """ Returns the layout of a product record with item codes of `code_width` bytes. """
+    return struct.Struct(f"<{code_width}sB8sq8s")
+
+
+def code_hash(code: bytes) -> int:
+    """ Returns a hash of an encoded item code that is the same in every process. """
+    return zlib.crc32(code)
+
+
+def pack_price(price) -> bytes:
+    """
+    Packs an integer price as an int64 and a float price as a float64.
+
+    Raises:
+        ValueError: If the price cannot be stored exactly, see `validate_compact_price`.
+    """
+    validate_compact_price(price)
+    return struct.pack("<q", price) if isinstance(price, int) else struct.pack("<d", price)
+
+
+def compile_catalogue(products, file_name: str):
+    """
+    Writes the `products` to a binary catalogue file named `file_name`.
+
+    Raises:
+        TypeError: If one of the products is not an instance of Product.
+        ValueError: If a price is not an int of 64 bits or a float.
+        ValueError: If a product appears more than once.
+    """
+    products = list(products)
+    codes = []
+    for product in products:
+        if not isinstance(product, Product):
+            raise TypeError("You should only add the product to the shelf.")
+        # The prices are checked before the file is opened, so an invalid price never leaves a truncated file.
+        validate_compact_price(product.unit_price)
+        if product.special_price is not None:
+            validate_compact_price(product.special_price)
+        codes.append(product.get_item_code().encode("utf-8"))
+    if len(set(codes)) != len(codes):
+        duplicate = next(code for code in codes if codes.count(code) > 1)
+        raise ValueError(f"The product {duplicate.decode('utf-8')} is already on the shelf.")
+
+    code_width = max((len(code) for code in codes), default=1)
+    record = record_struct(code_width)
+    slot_count = 1
+    while slot_count < 2 * len(products):
+        slot_count *= 2
+
+    slots = [0] * slot_count
+    for row, code in enumerate(codes):
+        slot = code_hash(code) % slot_count
+        while slots[slot]:
+            slot = (slot + 1) % slot_count
+        slots[slot] = row + 1
+
+    with open(file_name, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(products), slot_count, code_width))
+        f.write(struct.pack(f"<{slot_count}I", *slots))
+        for code, product in zip(codes, products):
+            flags = 0
+            if not isinstance(product.unit_price, int):
+                flags |= UNIT_PRICE_IS_FLOAT
+            if product.special_quantity is not None:
+                flags |= HAS_SPECIAL_QUANTITY
+            if product.special_price is not None:
+                flags |= HAS_SPECIAL_PRICE
+                if not isinstance(product.special_price, int):
+                    flags |= SPECIAL_PRICE_IS_FLOAT
+            f.write(record.pack(
+                code,
+                flags,
+                pack_price(product.unit_price),
+                product.special_quantity or 0,
+                pack_price(product.special_price or 0),
+            ))
+
+
+class MappedShelf(Mapping):
+    """
+    A read-only shelf backed by a memory-mapped catalogue file.
+
+    Products are read from the file the first time they are looked up and kept afterwards.
+    The file pages are shared through the OS page cache by all the processes mapping the same file.
+    """
+    def __init__(self, buffer):
+        """
+        Initialize a shelf from the `buffer` of a catalogue file.
+
+        Raises:
+            ValueError: If the buffer is not a catalogue file.
+        """
+        if len(buffer) < HEADER.size:
+            raise ValueError("The file is not a catalogue file.")
+        magic, version, self.product_count, self.slot_count, code_width = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("The file is not a catalogue file.")
+        self.buffer = buffer
+        self.code_width = code_width
+        self.record = record_struct(code_width)
+        self.records_offset = HEADER.size + self.slot_count * SLOT.size
+        if len(buffer) < self.records_offset + self.product_count * self.record.size:
+            raise ValueError("The catalogue file is truncated.")
+        self.products = {}
+
+    def find_row(self, item_code):
+        """ Returns the row of the product with the `item_code`, or None if it is not on the shelf. """
+        if not isinstance(item_code, str) or not self.slot_count:
+            return None
+        code = item_code.encode("utf-8")
+        slot = code_hash(code) % self.slot_count
+        while True:
+            row = SLOT.unpack_from(self.buffer, HEADER.size + slot * SLOT.size)[0]
+            if not row:
+                return None
+            if self.read_code(row - 1) == code:
+                return row - 1
+            slot = (slot + 1) % self.slot_count
+
+    def read_code(self, row: int) -> bytes:
+        """ Returns the encoded item code of the product in the `row`. """
+        offset = self.records_offset + row * self.record.size
+        return bytes(self.buffer[offset:offset + self.code_width]).rstrip(b"\0")
+
+    def read_product(self, row: int) -> Product:
+        """ Returns the product in the `row`. """
+        code, flags, unit_price, special_quantity, special_price = self.record.unpack_from(
+            self.buffer, self.records_offset + row * self.record.size
+        )
+        unit_price = struct.unpack("<d" if flags & UNIT_PRICE_IS_FLOAT else "<q", unit_price)[0]
+        special_price = struct.unpack("<d" if flags & SPECIAL_PRICE_IS_FLOAT else "<q", special_price)[0]
+        return make_product(
+            code.rstrip(b"\0").decode("utf-8"),
+            unit_price,
+            special_quantity if flags & HAS_SPECIAL_QUANTITY else None,
+            special_price if flags & HAS_SPECIAL_PRICE else None,
+        )
+
+    def __getitem__(self, item_code):
+        product = self.products.get(item_code)
+        if product is None:
+            row = self.find_row(item_code)
+            if row is None:
+                raise KeyError(item_code)
+            product = self.products[item_code] = self.read_product(row)
+        return product
+
+    def __contains__(self, item_code):
+        hash(item_code)  # Unhashable item codes raise a TypeError, like they do for a dictionary shelf.
+        return item_code in self.products or self.find_row(item_code) is not None
+
+    def __iter__(self):
+        for row in range(self.product_count):
+            yield self.read_code(row).decode("utf-8")
+
+    def __len__(self):
+        return self.product_count
+
+
+class MappedStore(Store):
+    """
+    A read-only store whose shelf is a memory-mapped catalogue file written by `compile_catalogue`.
+
+    Attributes:
+        shelf (MappedShelf): The shelf of the store, where the keys are product names and the values are Product instances.
+    """
+
+    def __init__(self, file_name: str):
+        """
+        Initialize a store from the catalogue file named `file_name`.
+
+        Raises:
+            ValueError: If the file is not a catalogue file.
+        """
+        with open(file_name, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b""
+        self.file_name = file_name
+        self.shelf = MappedShelf(buffer)
+
+
+    def __reduce__(self):
+        """ Sends only the file name to other processes, which then map the same file. """
+        return MappedStore, (self.file_name,)
+
+
+    def add_product(self, product: Product):
+        """
+        Raises:
+            ValueError: Products cannot be added to a store loaded from a catalogue file.
+        """
+        raise ValueError("Cannot add products to a store loaded from a catalogue file.")
+
+
+def read_catalogue(file) -> list:
+    """
+    Reads a JSON catalogue from an open `file` and returns its products.
+
+    The catalogue is a list of dictionaries with a 'code' key, a 'unit_price' key,
+    and optional 'special_quantity' and 'special_price' keys.
+
+    Raises:
+        ValueError: If a product in the catalogue is invalid.
+    """
+    products = []
+    for item in json.load(file):
+        if not isinstance(item, dict) or "code" not in item or "unit_price" not in item:
+            raise ValueError(f"Invalid product {item} in the catalogue.")
+        products.append(Product(item["code"], item["unit_price"], item.get("special_quantity"), item.get("special_price")))
+    return products
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python catalogue_file.py <catalogue.json> <catalogue.bin>")
+    with open(sys.argv[1], "r") as f:
+        compile_catalogue(read_catalogue(f), sys.argv[2])
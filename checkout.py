@@ -0,0 +1,98 @@
+from collections import namedtuple
+from multiprocessing import Pool
+from cart import Cart
+from store import Store
+
+CheckoutResult = namedtuple("CheckoutResult", ["cart_id", "cart", "subtotal", "errors"])
+CheckoutResult.__doc__ = """
+The result of checking out one cart.
+
+Attributes:
+    cart_id: The id of the cart (or customer) the order belongs to.
+    cart: The content of the shopping cart, as returned by `Cart.get_cart`.
+    subtotal: The subtotal of the shopping cart.
+    errors: A list of the messages for the invalid order items.
+"""
+
+# The store shared by all the items processed in a worker process, and the function processing them.
+_worker_store = None
+_worker_function = None
+
+
+def checkout_cart(store: Store, cart_id, order) -> CheckoutResult:
+    """
+    Creates a new shopping cart in the `store`, takes the `order` and returns the result.
+    The messages for invalid order items are collected in the result instead of being printed.
+
+    >>> from product import Product
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> checkout_cart(store, "customer-1", [{"code": "A", "quantity": 4}, {"code": "E", "quantity": 1}])
+    CheckoutResult(cart_id='customer-1', cart={'A': 4}, subtotal=190, errors=["An error occurred: We don't have E in our store."])
+    """
+    cart = Cart(store)
+    errors = []
+    cart.take_order(order, errors=errors)
+    return CheckoutResult(cart_id, cart.get_cart(), cart.get_subtotal(), errors)
+
+
+def checkout_carts(store: Store, orders, processes: int=None, chunk_size: int=64):
+    """
+    Checks out many independent carts against a shared, read-only `store`
+    and returns an iterator that yields a `CheckoutResult` for each cart as soon as it is finished.
+
+    The carts are spread across a pool of worker processes. The store is sent to each worker once,
+    and the orders are sent in chunks of `chunk_size` orders. The results are not yielded in the order of `orders`.
+
+    Args:
+        store (Store): The store where all the carts are shopping.
+        orders: A dictionary, or an iterable of (cart id, order) pairs, where each order is in the `Cart.take_order` format.
+        processes (int): The number of worker processes. Defaults to the number of CPUs.
+            If it is 1, the carts are checked out in the current process.
+        chunk_size (int): The number of orders sent to a worker at a time.
+
+    Raises:
+        ValueError: If `processes` or `chunk_size` is not a positive integer.
+    """
+    if processes is not None and (not isinstance(processes, int) or processes <= 0):
+        raise ValueError("The number of processes should be a positive integer.")
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise ValueError("The chunk size should be a positive integer.")
+    if isinstance(orders, dict):
+        orders = orders.items()
+    return map_with_store(store, _checkout_cart_order, orders, processes, chunk_size)
+
+
+def _checkout_cart_order(store: Store, cart_order) -> CheckoutResult:
+    """ Checks out one (cart id, order) pair. """
+    cart_id, order = cart_order
+    return checkout_cart(store, cart_id, order)
+
+
+def map_with_store(store: Store, function, items, processes: int=None, chunk_size: int=1):
+    """
+    Yields `function(store, item)` for each of the `items`, as soon as it is finished, calculated in a pool
+    of `processes` worker processes. The store is sent to each worker once, and the items in chunks of `chunk_size` items.
+    The results are not yielded in the order of `items`. If `processes` is 1, the items are processed in the current process.
+
+    The `function` has to be defined at the top level of a module, so that it can be sent to the workers.
+    """
+    if processes == 1:
+        for item in items:
+            yield function(store, item)
+        return
+
+    with Pool(processes, initializer=_init_worker, initargs=(store, function)) as pool:
+        yield from pool.imap_unordered(_call_in_worker, items, chunk_size)
+
+
+def _init_worker(store: Store, function):
+    """ Keeps the shared `store` and the `function` processing the items in the worker process. """
+    global _worker_store, _worker_function
+    _worker_store = store
+    _worker_function = function
+
+
+def _call_in_worker(item):
+    """ Processes one item against the store of the worker process. """
+    return _worker_function(_worker_store, item)
@@ -0,0 +1,287 @@
+"""
+A local HTTP checkout service around `Store` and `Cart`, using only the standard library.
+
+Endpoints (all the bodies are JSON):
+    POST /carts                 creates an empty cart and returns {"cart_id": ...}
+    POST /carts/<cart id>/items takes one order item or a list of order items, and returns the cart,
+                                the subtotal and the messages for the invalid order items of the request
+    GET  /carts/<cart id>       returns the cart and the subtotal
+    GET  /stats                 returns the number of carts, of requests taking order items, and of `take_order` calls
+
+The service speaks HTTP/1.1, so clients can keep their connections alive between requests.
+Concurrent requests for the same cart are coalesced: the first request to get the cart takes the order items
+of all the requests waiting for it in a single batch, pricing each product once, and answers all of them.
+
+Usage:
+    python checkout_service.py [--catalogue catalogue.json] [--host 127.0.0.1] [--port 8080]
+"""
+import argparse
+import itertools
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from cart import Cart
+from store import Store
+from validation import validate_order_item
+
+CART_PATH = re.compile(r"^/carts/([^/]+)$")
+ITEMS_PATH = re.compile(r"^/carts/([^/]+)/items$")
+
+
+class PendingRequest:
+    """
+    The order items of a request waiting to be taken by a `CartSession`.
+
+    Attributes:
+        order_items: The order items of the request.
+        errors: The messages for the invalid order items of the request, once it is done.
+        done: Whether the request has been taken, successfully or not.
+        result: The (cart, subtotal) after the order items were taken, or None if the request is waiting or failed.
+        failure: The exception raised while the order items were taken, or None.
+    """
+    def __init__(self, order_items: list):
+        self.order_items = order_items
+        self.errors = []
+        self.done = False
+        self.result = None
+        self.failure = None
+
+
+class CartSession:
+    """
+    A cart of the service, with the requests waiting for it.
+
+    Attributes:
+        cart (Cart): The shopping cart.
+        batches: The number of `take_order` calls made for the cart.
+        requests: The number of requests taken by the cart.
+    """
+    def __init__(self, cart: Cart):
+        self.cart = cart
+        self.cart_lock = Lock()
+        self.pending_lock = Lock()
+        self.pending = []
+        self.batches = 0
+        self.requests = 0
+
+    def take_order_items(self, order_items: list) -> PendingRequest:
+        """
+        Takes the `order_items` together with those of the other requests waiting for the cart,
+        and returns the request once it is done. If taking the batch failed, the `failure` of the request is set.
+        """
+        request = PendingRequest(order_items)
+        with self.pending_lock:
+            self.pending.append(request)
+        with self.cart_lock:
+            # Another request may have taken this one while it was waiting for the cart.
+            if not request.done:
+                with self.pending_lock:
+                    batch, self.pending = self.pending, []
+                self.take_batch(batch)
+        return request
+
+    def take_batch(self, batch: list):
+        """
+        Takes the valid order items of all the requests in the `batch`, summing the quantities per product
+        and pricing each product once, like `Cart.take_order` with `aggregate=True`.
+        Every request of the batch is done afterwards, with a result or a failure.
+        """
+        try:
+            shelf = self.cart.store.get_shelf()
+            quantities = {}
+            for request in batch:
+                for order_item in request.order_items:
+                    product, quantity, error_code, message = validate_order_item(order_item, shelf)
+                    if error_code:
+                        request.errors.append(message)
+                    elif quantity:
+                        quantities[product] = quantities.get(product, 0) + quantity
+            # The order items are already validated, so they are added without being validated again.
+            for product, quantity in quantities.items():
+                self.cart.add_valid_product(product, quantity)
+            result = (self.cart.get_cart().copy(), self.cart.get_subtotal())
+            for request in batch:
+                request.result = result
+        except Exception as failure:
+            for request in batch:
+                request.failure = failure
+        finally:
+            self.batches += 1
+            self.requests += len(batch)
+            for request in batch:
+                request.done = True
+
+    def get_result(self) -> tuple:
+        """ Returns the (cart, subtotal) of the cart. """
+        with self.cart_lock:
+            return self.cart.get_cart().copy(), self.cart.get_subtotal()
+
+
+class CheckoutService:
+    """
+    The carts of the checkout service, shopping in a shared store.
+
+    Attributes:
+        store (Store): The store where the carts are shopping.
+        sessions: A dictionary where the keys are cart ids and the values are `CartSession`s.
+    """
+    def __init__(self, store: Store):
+        self.store = store
+        self.sessions = {}
+        self.sessions_lock = Lock()
+        self.cart_ids = itertools.count(1)
+
+    def create_cart(self) -> str:
+        """ Creates an empty cart and returns its id. """
+        with self.sessions_lock:
+            cart_id = str(next(self.cart_ids))
+            self.sessions[cart_id] = CartSession(Cart(self.store))
+        return cart_id
+
+    def get_session(self, cart_id: str) -> CartSession:
+        """
+        Raises:
+            KeyError: If there is no cart with the `cart_id`.
+        """
+        return self.sessions[cart_id]
+
+    def stats(self) -> dict:
+        """ Returns the number of carts, of requests taking order items, and of `take_order` calls. """
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+        return {
+            "carts": len(sessions),
+            "requests": sum(session.requests for session in sessions),
+            "take_order_calls": sum(session.batches for session in sessions),
+        }
+
+
+class CheckoutRequestHandler(BaseHTTPRequestHandler):
+    """ Handles the requests of a `CheckoutServer`. """
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately, which would wait for delayed ACKs on kept-alive connections.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        try:
+            body = self.read_body()
+        except ValueError:
+            # The end of the body is unknown, so the connection cannot be reused.
+            self.close_connection = True
+            self.send_json(400, {"error": "The Content-Length header is not a valid length."})
+            return
+        if self.path == "/carts":
+            self.send_json(201, {"cart_id": self.server.service.create_cart()})
+            return
+        match = ITEMS_PATH.match(self.path)
+        if not match:
+            self.send_json(404, {"error": f"There is no resource at {self.path}."})
+            return
+        try:
+            data = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.send_json(400, {"error": "The body is not valid JSON."})
+            return
+        try:
+            session = self.server.service.get_session(match.group(1))
+        except KeyError:
+            self.send_json(404, {"error": f"There is no cart {match.group(1)}."})
+            return
+        request = session.take_order_items(data if isinstance(data, list) else [data])
+        if request.failure is not None:
+            self.send_json(500, {"error": f"The order items could not be taken: {request.failure}"})
+            return
+        cart, subtotal = request.result
+        self.send_json(200, {"cart": cart, "subtotal": subtotal, "errors": request.errors})
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.service.stats())
+            return
+        match = CART_PATH.match(self.path)
+        if not match:
+            self.send_json(404, {"error": f"There is no resource at {self.path}."})
+            return
+        try:
+            cart, subtotal = self.server.service.get_session(match.group(1)).get_result()
+        except KeyError:
+            self.send_json(404, {"error": f"There is no cart {match.group(1)}."})
+            return
+        self.send_json(200, {"cart": cart, "subtotal": subtotal})
+
+    def read_body(self) -> bytes:
+        """
+        Reads the body of the request, so that the connection can be reused.
+
+        Raises:
+            ValueError: If the Content-Length header is not a non-negative integer.
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 0:
+            raise ValueError("The Content-Length should be non-negative.")
+        return self.rfile.read(length)
+
+    def send_json(self, status: int, content: dict):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CheckoutServer(ThreadingHTTPServer):
+    """
+    An HTTP server for a `CheckoutService`, handling each connection in its own thread.
+
+    >>> import http.client, threading
+    >>> from product import Product
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> server = CheckoutServer(("127.0.0.1", 0), CheckoutService(store))
+    >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+    >>> connection = http.client.HTTPConnection(*server.server_address)
+    >>> connection.request("POST", "/carts")
+    >>> json.loads(connection.getresponse().read())
+    {'cart_id': '1'}
+    >>> connection.request("POST", "/carts/1/items", json.dumps([{"code": "A", "quantity": 4}, {"code": "E", "quantity": 1}]))
+    >>> json.loads(connection.getresponse().read())
+    {'cart': {'A': 4}, 'subtotal': 190, 'errors': ["An error occurred: We don't have E in our store."]}
+    >>> connection.close()
+    >>> server.shutdown()
+    >>> server.server_close()
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address, service: CheckoutService, verbose: bool=False):
+        super().__init__(server_address, CheckoutRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Run the local HTTP checkout service.")
+    parser.add_argument("--catalogue", default="catalogue.json", help="catalogue of the store (JSON, or compiled by catalogue_file.py)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--verbose", action="store_true", help="log every request to stderr")
+    args = parser.parse_args(arguments)
+
+    from batch import load_store
+    server = CheckoutServer((args.host, args.port), CheckoutService(load_store(args.catalogue)), args.verbose)
+    print(f"Serving the checkout service on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
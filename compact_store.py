@@ -0,0 +1,181 @@
+from array import array
+from collections.abc import Mapping
+from product import Product, validate_product_parameters
+from store import Store
+
+
+class CompactShelf(Mapping):
+    """
+    A read-only shelf that keeps the products in typed columns instead of one `Product` object per product.
+
+    The item codes are indexed by their row, so looking up a product is O(1).
+    A `Product` is only created for a row when it is looked up.
+
+    Attributes:
+        index: A dictionary where the keys are item codes and the values are rows.
+        unit_prices (PriceColumn): The unit prices of the products.
+        special_quantities: The special quantities of the products, 0 if there is no special price.
+        special_prices (PriceColumn): The special prices of the products, 0 if there is no special price.
+    """
+    def __init__(self):
+        """ Initialize an empty shelf. """
+        self.index = {}
+        self.unit_prices = PriceColumn()
+        self.special_quantities = array("q")
+        self.special_prices = PriceColumn()
+
+    def append(self, item_code: str, unit_price, special_quantity, special_price):
+        """ Adds a row for a product with already validated parameters and prices to the shelf. """
+        self.unit_prices.append(unit_price)
+        self.special_prices.append(special_price or 0)
+        self.special_quantities.append(special_quantity or 0)
+        self.index[item_code] = len(self.index)
+
+    def __getitem__(self, item_code):
+        row = self.index[item_code]
+        return make_product(
+            item_code,
+            self.unit_prices[row],
+            self.special_quantities[row] or None,
+            self.special_prices[row] or None,
+        )
+
+    def __contains__(self, item_code):
+        return item_code in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class CompactStore(Store):
+    """
+    A store that keeps its shelf in a `CompactShelf`, for catalogues with millions of products.
+
+    Prices are kept in 64-bit integer columns, with a float column for the float prices, so each price
+    is returned with its own type. Other prices, like `Decimal` or `Fraction`, cannot be stored exactly and are rejected.
+
+    Attributes:
+        shelf (CompactShelf): The shelf of the store, where the keys are product names and the values are Product instances.
+    """
+
+    def __init__(self):
+        """ Initialize an empty store. """
+        self.shelf = CompactShelf()
+
+
+    def add_product(self, product: Product):
+        """
+        Add a product to the shelf.
+
+        Raises:
+            TypeError: If the product is not an instance of Product.
+            ValueError: If the product is already on the shelf.
+        """
+        if not isinstance(product, Product):
+            raise TypeError("You should only add the product to the shelf.")
+        self.add_item(product.get_item_code(), product.unit_price, product.special_quantity, product.special_price)
+
+
+    def add_item(self, item_code, unit_price, special_quantity: int=None, special_price=None):
+        """
+        Add a product to the shelf without creating a `Product` instance.
+
+        Raises:
+            ValueError: If the product parameters are invalid, see `Product`.
+            ValueError: If a price is not an int of 64 bits or a float.
+            ValueError: If the product is already on the shelf.
+
+        >>> store = CompactStore()
+        >>> store.add_item("A", 50, 3, 140)
+        >>> store.get_shelf()["A"].calculate_price(4)
+        190
+        """
+        validate_product_parameters(unit_price, special_quantity, special_price)
+        validate_compact_price(unit_price)
+        if special_price is not None:
+            validate_compact_price(special_price)
+        item_code = str(item_code)
+        if item_code in self.shelf:
+            raise ValueError(f"The product {item_code} is already on the shelf.")
+        self.shelf.append(item_code, unit_price, special_quantity, special_price)
+
+
+class PriceColumn:
+    """
+    A column of prices where each price keeps its type, int or float.
+
+    The prices are kept in a 64-bit integer array. The float column and the type of each row
+    are only created once a float price is added, so a column of integer prices costs 8 bytes per row.
+
+    Attributes:
+        ints: The integer prices, 0 for the rows of float prices.
+        floats: The float prices, 0.0 for the rows of integer prices, or None if there is no float price.
+        is_float: 1 for the rows of float prices and 0 for the others, or None if there is no float price.
+
+    >>> column = PriceColumn()
+    >>> column.append(50)
+    >>> column.append(10.5)
+    >>> column[0], column[1]
+    (50, 10.5)
+    """
+    def __init__(self):
+        self.ints = array("q")
+        self.floats = None
+        self.is_float = None
+
+    def append(self, price):
+        """ Appends a price that has been validated by `validate_compact_price`. """
+        if isinstance(price, float):
+            if self.floats is None:
+                self.floats = array("d", bytes(8 * len(self.ints)))
+                self.is_float = bytearray(len(self.ints))
+            self.ints.append(0)
+            self.floats.append(price)
+            self.is_float.append(1)
+            return
+        self.ints.append(price)
+        if self.floats is not None:
+            self.floats.append(0.0)
+            self.is_float.append(0)
+
+    def __getitem__(self, row):
+        if self.is_float is not None and self.is_float[row]:
+            return self.floats[row]
+        return self.ints[row]
+
+    def __len__(self):
+        return len(self.ints)
+
+
+def validate_compact_price(price):
+    """
+    Checks that a price can be stored exactly in a `PriceColumn` or a catalogue file, as an int of 64 bits or a float.
+
+    Raises:
+        ValueError: If the price is not an int of 64 bits or a float.
+
+    >>> from decimal import Decimal
+    >>> validate_compact_price(Decimal("0.10"))
+    Traceback (most recent call last):
+    ...
+    ValueError: The price 0.10 cannot be stored exactly, it should be an int or a float.
+    """
+    if isinstance(price, float):
+        return
+    if not isinstance(price, int):
+        raise ValueError(f"The price {price} cannot be stored exactly, it should be an int or a float.")
+    if not -2 ** 63 <= price < 2 ** 63:
+        raise ValueError(f"The price {price} is too large to be stored as an int of 64 bits.")
+
+
+def make_product(item_code: str, unit_price, special_quantity, special_price) -> Product:
+    """ Creates a `Product` from parameters that have already been validated. """
+    product = Product.__new__(Product)
+    product.item_code = item_code
+    product.unit_price = unit_price
+    product.special_quantity = special_quantity
+    product.special_price = special_price
+    return product
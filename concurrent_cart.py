@@ -0,0 +1,132 @@
+from threading import Lock, get_native_id
+from cart import Cart
+from store import Store
+
+
+class ConcurrentCart(Cart):
+    """
+    A shopping cart that can be updated from several threads at the same time.
+
+    The products are spread over a fixed number of lock stripes. Each stripe has its own lock
+    and its own part of the subtotal, so updates to products in different stripes do not block each other,
+    and an update to a product is atomic with its subtotal delta.
+    The `subtotal` attribute is the sum of the subtotals of the stripes, like `get_subtotal`.
+
+    A `PriceCache` is not thread-safe, so with a `price_cache` the prices are looked up under one more lock,
+    which all the stripes share.
+
+    Attributes:
+        locks: A list of locks, one for each stripe.
+        stripe_subtotals: A list of the subtotals of the products in each stripe.
+        price_cache_lock: The lock of the `price_cache`.
+    """
+    def __init__(self, store: Store, stripe_count: int=16, price_cache=None):
+        """
+        Initialize an empty shopping cart with a subtotal of 0 in a given store.
+
+        Args:
+            store (Store): The store where the cart is shopping.
+            stripe_count (int): The number of lock stripes.
+            price_cache (PriceCache): An optional cache of the product prices, which can be shared by many carts.
+
+        Raises:
+            ValueError: If `stripe_count` is not a positive integer.
+        """
+        if not isinstance(stripe_count, int) or stripe_count <= 0:
+            raise ValueError("The stripe count should be a positive integer.")
+        self.locks = [Lock() for _ in range(stripe_count)]
+        self.stripe_subtotals = [0] * stripe_count
+        self.price_cache_lock = Lock()
+        super().__init__(store, price_cache)
+
+    @property
+    def subtotal(self):
+        """ The current subtotal of the shopping cart, the sum of the subtotals of the stripes. """
+        return self.snapshot()[1]
+
+    @subtotal.setter
+    def subtotal(self, subtotal):
+        self.acquire_all()
+        try:
+            self.stripe_subtotals = [subtotal] + [0] * (len(self.locks) - 1)
+        finally:
+            self.release_all()
+
+    def stripe_index(self, product: str) -> int:
+        """ Returns the index of the lock stripe of the `product`. """
+        return hash(product) % len(self.locks)
+
+    def get_cart(self):
+        """
+        Returns the current products and their quantities in the shopping cart
+        as a dictionary, sorted by the product name in ascending order.
+        """
+        return self.snapshot()[0]
+
+    def get_subtotal(self):
+        """ Returns the current subtotal of the shopping cart. """
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """
+        Returns a consistent snapshot of the content and the subtotal of the shopping cart,
+        taken while holding the locks of all the stripes.
+
+        >>> from product import Product
+        >>> store = Store()
+        >>> store.add_product(Product("A", 50, 3, 140))
+        >>> cart = ConcurrentCart(store)
+        >>> cart.add_product("A", 4)
+        >>> cart.snapshot()
+        ({'A': 4}, 190)
+        """
+        self.acquire_all()
+        try:
+            return dict(sorted(self.cart.items())), sum(self.stripe_subtotals)
+        finally:
+            self.release_all()
+
+    def acquire_all(self):
+        """ Acquires the locks of all the stripes, always in the same order. """
+        for lock in self.locks:
+            lock.acquire()
+
+    def release_all(self):
+        """ Releases the locks of all the stripes. """
+        for lock in reversed(self.locks):
+            lock.release()
+
+    def update_subtotal(self, price):
+        """ Add the `price` to the subtotal of the cart, in the stripe of the calling thread. """
+        stripe = get_native_id() % len(self.locks)
+        with self.locks[stripe]:
+            self.stripe_subtotals[stripe] += price
+
+    def add_valid_product(self, product: str, quantity: int):
+        """ Adds a `product` with a given `quantity` that has already been validated to the shopping cart. """
+        self.update_quantity(product, lambda quantity_before: quantity_before + quantity)
+
+    def set_valid_quantity(self, product: str, quantity_after: int):
+        """ Sets the quantity of a `product` that has already been validated to `quantity_after`, and updates the subtotal. """
+        self.update_quantity(product, lambda quantity_before: quantity_after)
+
+    def update_quantity(self, product: str, new_quantity):
+        """
+        Sets the quantity of a `product` to `new_quantity(quantity_before)` and updates the subtotal,
+        atomically under the lock of the stripe of the product.
+        """
+        product_instance = self.store.get_shelf()[product]
+        stripe = self.stripe_index(product)
+        with self.locks[stripe]:
+            quantity_before = self.cart.get(product, 0)
+            quantity_after = new_quantity(quantity_before)
+            if quantity_after:
+                self.cart[product] = quantity_after
+            else:
+                self.cart.pop(product, None)
+            if self.price_cache is None:
+                price_difference = product_instance.price_difference(quantity_before, quantity_after, trusted=True)
+            else:
+                with self.price_cache_lock:
+                    price_difference = self.price_cache.price_difference(product_instance, quantity_before, quantity_after, trusted=True)
+            self.stripe_subtotals[stripe] += price_difference
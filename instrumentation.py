@@ -0,0 +1,276 @@
+"""
+Counters, timing histograms and a sampling profiler for the checkout hot paths.
+
+The instrumented methods are only wrapped while the instrumentation is enabled,
+so when it is disabled the methods are the original ones and there is no overhead.
+
+>>> from product import Product
+>>> store = Store()
+>>> store.add_product(Product("A", 50, 3, 140))
+>>> instrumentation = Instrumentation()
+>>> instrumentation.enable()
+>>> Cart(store).take_order([{"code": "A", "quantity": 3}, {"code": "E", "quantity": 1}])
+An error occurred: We don't have E in our store.
+>>> instrumentation.disable()
+>>> instrumentation.snapshot()["order_items"]
+{'total': 2, 'errors': 1}
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from weakref import WeakKeyDictionary
+from cart import Cart
+from product import Product
+from store import Store
+
+# The methods that are counted and timed, as (class, method name) pairs.
+INSTRUMENTED_METHODS = [
+    (Cart, "take_order"),
+    (Cart, "add_product"),
+    (Store, "get_shelf"),
+    (Product, "price_difference"),
+]
+
+# The upper bounds (in seconds) of the buckets of the timing histograms.
+BUCKET_BOUNDS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+class Histogram:
+    """
+    A histogram of durations with fixed buckets.
+
+    Attributes:
+        bucket_counts: The number of durations in each bucket, the last bucket holding the durations above all the bounds.
+        count: The number of durations.
+        sum: The sum of the durations.
+    """
+    def __init__(self):
+        """ Initialize an empty histogram. """
+        self.bucket_counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, duration: float):
+        """ Adds a `duration` (in seconds) to the histogram. """
+        bucket = 0
+        while bucket < len(BUCKET_BOUNDS) and duration > BUCKET_BOUNDS[bucket]:
+            bucket += 1
+        self.bucket_counts[bucket] += 1
+        self.count += 1
+        self.sum += duration
+
+    def to_dict(self):
+        """ Returns the histogram as a dictionary. """
+        return {"buckets": list(zip(BUCKET_BOUNDS + ("+Inf",), self.bucket_counts)), "count": self.count, "sum": self.sum}
+
+
+class Instrumentation:
+    """
+    Collects the number of calls and the durations of the instrumented methods,
+    and the number of order items and invalid order items taken by each cart.
+
+    Only one `Instrumentation` can be enabled at a time.
+
+    Attributes:
+        histograms: A dictionary where the keys are method names and the values are `Histogram`s.
+        cart_order_items: A dictionary where the keys are carts and the values are [order items, invalid order items] counters.
+        order_items: The number of order items taken by all the carts.
+        order_item_errors: The number of invalid order items taken by all the carts.
+        sink: Where the metrics are sent by `flush`, or None.
+        profiler: The `SamplingProfiler` if the profiler mode is on, otherwise None.
+    """
+    enabled_instance = None
+
+    def __init__(self):
+        """ Initialize a disabled instrumentation with empty metrics. """
+        self.histograms = {f"{cls.__name__}.{name}": Histogram() for cls, name in INSTRUMENTED_METHODS}
+        self.cart_order_items = WeakKeyDictionary()
+        self.order_items = 0
+        self.order_item_errors = 0
+        self.sink = None
+        self.profiler = None
+        self.original_methods = {}
+
+    def enable(self, sink=None, profile: bool=False, profile_interval: float=0.001):
+        """
+        Starts collecting the metrics.
+
+        Args:
+            sink: Where the metrics are sent by `flush`, such as an `InMemorySink`, a `JsonLogSink` or a `PrometheusSink`.
+            profile (bool): If True, also run a `SamplingProfiler` on the current thread.
+            profile_interval (float): The interval (in seconds) between two samples of the profiler.
+
+        Raises:
+            RuntimeError: If an instrumentation is already enabled.
+        """
+        if Instrumentation.enabled_instance is not None:
+            raise RuntimeError("An instrumentation is already enabled.")
+        Instrumentation.enabled_instance = self
+        self.sink = sink
+        for cls, name in INSTRUMENTED_METHODS:
+            self.original_methods[cls, name] = cls.__dict__[name]
+            setattr(cls, name, self.timed(cls.__dict__[name], self.histograms[f"{cls.__name__}.{name}"]))
+        self.original_methods[Cart, "check_order_item"] = Cart.__dict__["check_order_item"]
+        Cart.check_order_item = self.counted_check_order_item(Cart.__dict__["check_order_item"])
+        if profile:
+            self.profiler = SamplingProfiler(profile_interval)
+            self.profiler.start()
+
+    def disable(self):
+        """ Stops collecting the metrics and restores the original methods. """
+        if Instrumentation.enabled_instance is not self:
+            return
+        for (cls, name), method in self.original_methods.items():
+            setattr(cls, name, method)
+        self.original_methods.clear()
+        if self.profiler is not None:
+            self.profiler.stop()
+        Instrumentation.enabled_instance = None
+
+    def timed(self, method, histogram: Histogram):
+        """ Returns a wrapper of the `method` that adds the duration of each call to the `histogram`. """
+        perf_counter = time.perf_counter
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+
+    def counted_check_order_item(self, method):
+        """ Returns a wrapper of `Cart.check_order_item` that counts the order items and the invalid order items of each cart. """
+        @wraps(method)
+        def wrapper(cart, order_item):
+            result = method(cart, order_item)
+            counters = self.cart_order_items.get(cart)
+            if counters is None:
+                counters = self.cart_order_items[cart] = [0, 0]
+            counters[0] += 1
+            self.order_items += 1
+            if result[2]:
+                counters[1] += 1
+                self.order_item_errors += 1
+            return result
+        return wrapper
+
+    def error_rate(self, cart: Cart) -> float:
+        """ Returns the share of invalid order items taken by the `cart`, or 0 if it has not taken any. """
+        order_items, errors = self.cart_order_items.get(cart, (0, 0))
+        return errors / order_items if order_items else 0.0
+
+    def snapshot(self) -> dict:
+        """ Returns the current metrics as a dictionary. """
+        metrics = {
+            "methods": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            "order_items": {"total": self.order_items, "errors": self.order_item_errors},
+            "carts": len(self.cart_order_items),
+        }
+        if self.profiler is not None:
+            metrics["profile"] = self.profiler.top()
+        return metrics
+
+    def flush(self):
+        """ Sends the current metrics to the sink, if there is one. """
+        if self.sink is not None:
+            self.sink.emit(self.snapshot())
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler that periodically samples the function running in a thread from a background thread.
+
+    Attributes:
+        interval: The interval (in seconds) between two samples.
+        samples: A Counter where the keys are "file:line function" strings and the values are the number of samples.
+    """
+    def __init__(self, interval: float=0.001, thread_id: int=None):
+        """ Initialize a profiler of the thread `thread_id`, by default the current thread. """
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """ Starts sampling in a background thread. """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Stops sampling. """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """ Takes a sample every `interval` seconds until the profiler is stopped. """
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                code = frame.f_code
+                self.samples[f"{code.co_filename}:{code.co_firstlineno} {code.co_name}"] += 1
+
+    def top(self, count: int=20) -> list:
+        """ Returns the `count` most sampled functions as (function, number of samples) pairs. """
+        return self.samples.most_common(count)
+
+
+class InMemorySink:
+    """ A sink that keeps the metrics in a list. """
+    def __init__(self):
+        self.snapshots = []
+
+    def emit(self, metrics: dict):
+        self.snapshots.append(metrics)
+
+
+class JsonLogSink:
+    """ A sink that writes the metrics to an open text `file` as one JSON object per line. """
+    def __init__(self, file):
+        self.file = file
+
+    def emit(self, metrics: dict):
+        self.file.write(json.dumps({"time": time.time(), **metrics}) + "\n")
+        self.file.flush()
+
+
+class PrometheusSink:
+    """ A sink that writes the metrics to an open text `file` in the Prometheus text exposition format. """
+    def __init__(self, file):
+        self.file = file
+
+    def emit(self, metrics: dict):
+        self.file.write(format_prometheus(metrics))
+        self.file.flush()
+
+
+def format_prometheus(metrics: dict) -> str:
+    """ Returns the `metrics` of an `Instrumentation.snapshot` in the Prometheus text exposition format. """
+    lines = [
+        "# HELP checkout_method_duration_seconds Duration of the instrumented checkout methods.",
+        "# TYPE checkout_method_duration_seconds histogram",
+    ]
+    for name, histogram in metrics["methods"].items():
+        cumulative_count = 0
+        for bound, count in histogram["buckets"]:
+            cumulative_count += count
+            lines.append(f'checkout_method_duration_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative_count}')
+        lines.append(f'checkout_method_duration_seconds_sum{{method="{name}"}} {histogram["sum"]}')
+        lines.append(f'checkout_method_duration_seconds_count{{method="{name}"}} {histogram["count"]}')
+    lines += [
+        "# HELP checkout_order_items_total Order items taken by the carts.",
+        "# TYPE checkout_order_items_total counter",
+        f'checkout_order_items_total {metrics["order_items"]["total"]}',
+        "# HELP checkout_order_item_errors_total Invalid order items taken by the carts.",
+        "# TYPE checkout_order_item_errors_total counter",
+        f'checkout_order_item_errors_total {metrics["order_items"]["errors"]}',
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+"""
+Generates load against the local HTTP checkout service of `checkout_service.py`.
+
+Each client thread keeps one connection alive and posts orders of `--order-size` order items,
+spread over `--carts` carts shared by all the clients, so that concurrent requests for the same cart are coalesced.
+Reports the requests per second, the p50, p90, p99 and p99.9 latencies,
+and the number of `take_order` calls the requests were coalesced into.
+
+Usage:
+    python load_generator.py [--port PORT] [--clients N] [--requests N] [--carts N] [--order-size N] [--invalid-share P]
+
+Without `--port`, a service is started in this process on a free port, with the catalogue of `--catalogue`
+or a generated catalogue of `--skus` products.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from benchmark import OrderGenerator, generate_catalogue, percentile
+from checkout_service import CheckoutServer, CheckoutService
+from store import Store
+
+
+def run_client(host: str, port: int, cart_ids: list, orders: list, latencies: list, failures: list):
+    """ Posts each of the `orders` to the carts in turn over one connection, and appends the latencies to `latencies`. """
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        for index, order in enumerate(orders):
+            body = json.dumps(order)
+            started = time.perf_counter()
+            connection.request("POST", f"/carts/{cart_ids[index % len(cart_ids)]}/items", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                failures.append(response.status)
+    finally:
+        connection.close()
+
+
+def create_carts(host: str, port: int, cart_count: int) -> list:
+    """ Creates `cart_count` carts in the service and returns their ids. """
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        cart_ids = []
+        for _ in range(cart_count):
+            connection.request("POST", "/carts")
+            cart_ids.append(json.loads(connection.getresponse().read())["cart_id"])
+        return cart_ids
+    finally:
+        connection.close()
+
+
+def get_stats(host: str, port: int) -> dict:
+    """ Returns the stats of the service. """
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        connection.request("GET", "/stats")
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def run_load(host: str, port: int, codes: list, client_count: int=8, request_count: int=200, cart_count: int=4,
+             order_size: int=10, invalid_share: float=0.0, seed: int=0) -> dict:
+    """
+    Sends `request_count` requests from each of `client_count` clients, and returns the results.
+
+    Raises:
+        ValueError: If `client_count`, `request_count` or `cart_count` is not a positive integer.
+    """
+    for name, value in (("clients", client_count), ("requests", request_count), ("carts", cart_count)):
+        if not isinstance(value, int) or value <= 0:
+            raise ValueError(f"The number of {name} should be a positive integer.")
+    cart_ids = create_carts(host, port, cart_count)
+    stats_before = get_stats(host, port)
+    latencies = []
+    failures = []
+    threads = []
+    for client in range(client_count):
+        generator = OrderGenerator(codes, order_size, invalid_share=invalid_share, seed=seed + client)
+        orders = [generator.order() for _ in range(request_count)]
+        # Each client starts with a different cart, so that every cart receives concurrent requests.
+        client_cart_ids = cart_ids[client % cart_count:] + cart_ids[:client % cart_count]
+        threads.append(threading.Thread(target=run_client, args=(host, port, client_cart_ids, orders, latencies, failures)))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats_after = get_stats(host, port)
+
+    latencies.sort()
+    return {
+        "clients": client_count,
+        "carts": cart_count,
+        "requests": len(latencies),
+        "failures": len(failures),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p90_ms": percentile(latencies, 0.9) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "take_order_calls": stats_after["take_order_calls"] - stats_before["take_order_calls"],
+    }
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate load against the local HTTP checkout service.")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the service")
+    parser.add_argument("--port", type=int, help="port of the service (default: start a service in this process)")
+    parser.add_argument("--catalogue", help="catalogue of the service, to draw the item codes from and to start the service with (default: the generated catalogue)")
+    parser.add_argument("--skus", type=int, default=1000, help="number of products of the generated catalogue")
+    parser.add_argument("--clients", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="number of requests of each client")
+    parser.add_argument("--carts", type=int, default=4, help="number of carts shared by the clients")
+    parser.add_argument("--order-size", type=int, default=10, help="number of order items in each request")
+    parser.add_argument("--invalid-share", type=float, default=0.0, help="share of invalid order items")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generators")
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    args = parser.parse_args(arguments)
+
+    if args.catalogue:
+        from batch import load_store
+        store = load_store(args.catalogue)
+    else:
+        store = Store()
+        for product in generate_catalogue(args.skus, seed=args.seed):
+            store.add_product(product)
+    codes = list(store.get_shelf())
+
+    server = None
+    host, port = args.host, args.port
+    if port is None:
+        server = CheckoutServer((host, 0), CheckoutService(store))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+    try:
+        results = run_load(host, port, codes, args.clients, args.requests, args.carts, args.order_size, args.invalid_share, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    print(
+        f"{results['requests']} requests ({results['failures']} failed) from {results['clients']} clients in {results['seconds']:.3f}s: "
+        f"{results['requests_per_second']:,.0f} requests/s, p50 {results['p50_ms']:.3f} ms, p90 {results['p90_ms']:.3f} ms, "
+        f"p99 {results['p99_ms']:.3f} ms, p99.9 {results['p999_ms']:.3f} ms"
+    )
+    print(f"{results['take_order_calls']} take_order calls for {results['requests']} requests")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
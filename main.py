@@ -1,10 +1,22 @@
-import json
-from product import Product
-from cart import Cart
-from store import Store
+import sys
 
+# Every job starts a fresh interpreter, so the modules are only imported when they are first needed:
+# argparse is only imported if there are command-line arguments, and the order reader only for --stream.
+
+
+def main(stream: bool=False):
+    """
+    Runs the shopping cart application.
+
+    If `stream` is True, the order items are read from the file (a JSON array or JSON Lines file)
+    and added to the cart one at a time, so the whole order is never loaded into memory.
+    The order data itself is not printed in this mode.
+    """
+    import json
+    from product import Product
+    from cart import Cart
+    from store import Store
 
-def main():
     # Set up store and create a new shopping cart
     store = Store()
     products = [
@@ -25,9 +37,15 @@ def main():
     # Open data file and take order
     try:
         with open(file_name, 'r') as f:
-            data = json.load(f)
-            cart.take_order(data)
-            print(f"\nData: {data}\n")
+            if stream:
+                from order_reader import iter_order_items
+                # If the file turns out not to be valid JSON partway, the order items before the error stay in the cart.
+                cart.take_order(iter_order_items(f))
+                print()
+            else:
+                data = json.load(f)
+                cart.take_order(data)
+                print(f"\nData: {data}\n")
             print(f"Shopping cart content: {cart.get_cart()}\n")
             print(f"Subtotal: {cart.get_subtotal()}")
     except FileNotFoundError:
@@ -42,5 +60,26 @@ def main():
         print(f"An unexpected error occurred: {e}")
 
 
+def parse_arguments(arguments=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Check out the orders in JSON files.")
+    parser.add_argument("--stream", action="store_true", help="stream the order file instead of loading it into memory")
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="check out the order files in these directories or globs without prompting")
+    parser.add_argument("--catalogue", default="catalogue.json", help="catalogue of the store for --batch (JSON, or compiled by catalogue_file.py)")
+    parser.add_argument("--workers", type=int, help="number of worker processes for --batch (default: number of CPUs)")
+    parser.add_argument("--output", help="file to write the results of --batch to as JSON Lines (default: stdout)")
+    return parser.parse_args(arguments)
+
+
 if __name__ == '__main__':
-    main()    
\ No newline at end of file
+    if len(sys.argv) == 1:
+        main()
+    else:
+        args = parse_arguments()
+        if args.batch:
+            from batch import run_batch
+            if args.output:
+                with open(args.output, "w") as output:
+                    sys.exit(run_batch(args.batch, args.catalogue, args.workers, output))
+            sys.exit(run_batch(args.batch, args.catalogue, args.workers))
+        main(stream=args.stream)
@@ -0,0 +1,120 @@
+"""
+An exact money mode, where all the prices are kept as integer minor units (cents).
+
+Prices are converted to cents once, when the products are added to a `CentsStore`,
+and the subtotal is converted back to a `Decimal` amount only when it is read with `CentsCart.get_subtotal`.
+In between, `calculate_price`, `price_difference` and the subtotal only do integer arithmetic,
+so the subtotal is exact however many changes it accumulates, without the cost of `Decimal` arithmetic.
+"""
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from cart import Cart
+from product import Product
+from store import Store
+
+CENTS_PER_UNIT = 100
+
+
+def to_cents(amount) -> int:
+    """
+    Converts an `amount` of money (an int, a Decimal, a Fraction, a float or a string) to an integer number of cents.
+    Floats are converted from their shortest representation, so 0.1 is 10 cents.
+
+    Raises:
+        ValueError: If the `amount` is not a number, or is not a whole number of cents.
+
+    >>> to_cents(Decimal("1.40")), to_cents(0.1), to_cents("12"), to_cents(3), to_cents(Fraction(1, 2))
+    (140, 10, 1200, 300, 50)
+    >>> to_cents(Fraction(1, 3))
+    Traceback (most recent call last):
+    ...
+    ValueError: The amount 1/3 is not a whole number of cents.
+    """
+    if isinstance(amount, int) and not isinstance(amount, bool):
+        return amount * CENTS_PER_UNIT
+    if isinstance(amount, Fraction):
+        cents = amount * CENTS_PER_UNIT
+        if cents.denominator != 1:
+            raise ValueError(f"The amount {amount} is not a whole number of cents.")
+        return int(cents)
+    try:
+        cents = Decimal(str(amount)) * CENTS_PER_UNIT
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"The amount {amount} is not a number.") from None
+    if not cents.is_finite() or cents != cents.to_integral_value():
+        raise ValueError(f"The amount {amount} is not a whole number of cents.")
+    return int(cents)
+
+
+def from_cents(cents: int) -> Decimal:
+    """
+    Converts an integer number of `cents` to a Decimal amount of money with two decimal places.
+
+    >>> from_cents(140), from_cents(-5)
+    (Decimal('1.40'), Decimal('-0.05'))
+    """
+    return Decimal(cents).scaleb(-2)
+
+
+def to_cents_product(product: Product) -> Product:
+    """ Returns a copy of the `product` with its prices in cents. """
+    return Product(
+        product.item_code,
+        to_cents(product.unit_price),
+        product.special_quantity,
+        to_cents(product.special_price) if product.special_price else product.special_price,
+    )
+
+
+class CentsStore(Store):
+    """
+    A store that keeps the prices of its products in cents.
+
+    >>> store = CentsStore()
+    >>> store.add_product(Product("A", Decimal("0.50"), 3, Decimal("1.40")))
+    >>> store.get_shelf()["A"].calculate_price(4)
+    190
+    """
+    def add_product(self, product: Product):
+        """
+        Adds a copy of the `product` with its prices in cents to the shelf.
+
+        Raises:
+            TypeError: If the product is not an instance of Product.
+            ValueError: If the product is already on the shelf, or a price is not a whole number of cents.
+        """
+        if not isinstance(product, Product):
+            raise TypeError("You should only add the product to the shelf.")
+        super().add_product(to_cents_product(product))
+
+
+class CentsCart(Cart):
+    """
+    A shopping cart in a `CentsStore`, whose subtotal is kept in cents.
+
+    >>> store = CentsStore()
+    >>> store.add_product(Product("A", Decimal("0.10")))
+    >>> cart = CentsCart(store)
+    >>> for _ in range(3):
+    ...     cart.add_product("A", 1)
+    >>> cart.get_subtotal(), cart.get_subtotal_cents()
+    (Decimal('0.30'), 30)
+    """
+    def __init__(self, store: CentsStore, price_cache=None):
+        """
+        Initialize an empty shopping cart with a subtotal of 0 cents in a `CentsStore`.
+
+        Raises:
+            TypeError: If the `store` is not a `CentsStore`, whose prices are in cents.
+        """
+        if not isinstance(store, CentsStore):
+            raise TypeError("A CentsCart should shop in a CentsStore, whose prices are in cents.")
+        super().__init__(store, price_cache)
+
+    def get_subtotal(self) -> Decimal:
+        """ Returns the current subtotal of the shopping cart as a Decimal amount of money. """
+        return from_cents(self.subtotal)
+
+    def get_subtotal_cents(self) -> int:
+        """ Returns the current subtotal of the shopping cart in cents. """
+        return self.subtotal
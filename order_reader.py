@@ -0,0 +1,127 @@
+import json
+
+WHITESPACE = " \t\n\r"
+# The largest order item, in characters, read ahead before a malformed or huge order item is rejected.
+MAX_ITEM_SIZE = 1 << 20
+
+
+def iter_order_items(file, chunk_size: int=65536, max_item_size: int=MAX_ITEM_SIZE):
+    """
+    Yields the order items from an open text `file` one at a time,
+    so the whole order never has to be held in memory.
+
+    The file can either be a JSON array of order items, or a JSON Lines (NDJSON) file
+    with one order item per line. The format is detected from the first non-whitespace character.
+
+    Raises:
+        json.JSONDecodeError: If the file is not valid JSON or JSON Lines,
+            or if an order item is longer than `max_item_size` characters.
+
+    >>> from io import StringIO
+    >>> list(iter_order_items(StringIO('[{"code": "A", "quantity": 3}, {"code": "B", "quantity": 1}]')))
+    [{'code': 'A', 'quantity': 3}, {'code': 'B', 'quantity': 1}]
+    >>> list(iter_order_items(StringIO('{"code": "A", "quantity": 3}\\n{"code": "B", "quantity": 1}\\n')))
+    [{'code': 'A', 'quantity': 3}, {'code': 'B', 'quantity': 1}]
+    """
+    buffer = ""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        if buffer.lstrip(WHITESPACE):
+            break
+    buffer = buffer.lstrip(WHITESPACE)
+    if not buffer:
+        raise json.JSONDecodeError("Expecting value", buffer, 0)
+    if buffer[0] == "[":
+        yield from _iter_json_array(file, buffer[1:], chunk_size, max_item_size)
+    else:
+        yield from _iter_json_lines(file, buffer, chunk_size, max_item_size)
+
+
+def _iter_json_array(file, buffer: str, chunk_size: int, max_item_size: int):
+    """ Yields the elements of a JSON array whose opening bracket has already been consumed. """
+    decoder = json.JSONDecoder()
+    position = 0
+    eof = False
+    expect_item = True
+    first_item = True
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+            return
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def read_more_of_item():
+        # Without a limit, a malformed order item would make the rest of the file be read into the buffer.
+        if len(buffer) - position > max_item_size:
+            raise json.JSONDecodeError(f"Expecting an order item of at most {max_item_size} characters", buffer, position)
+        read_more()
+
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array", buffer, position)
+            read_more()
+            continue
+
+        char = buffer[position]
+        if char == "]" and (not expect_item or first_item):
+            position += 1
+            break
+        if not expect_item:
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+            position += 1
+            expect_item = True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more_of_item()
+            continue
+        # A value that ends at the end of the buffer, or before a character that cannot follow it, may be truncated:
+        # "12" or "12." are decoded as 12 when the buffer ends before the rest of "12.75".
+        if not eof and (end == len(buffer) or buffer[end] not in WHITESPACE + ",]"):
+            read_more_of_item()
+            continue
+        position = end
+        expect_item = False
+        first_item = False
+        yield item
+
+    # Only whitespace is allowed after the closing bracket.
+    while True:
+        if buffer[position:].strip(WHITESPACE):
+            raise json.JSONDecodeError("Extra data", buffer, position)
+        if eof:
+            return
+        buffer, position = "", 0
+        read_more()
+
+
+def _iter_json_lines(file, buffer: str, chunk_size: int, max_item_size: int):
+    """ Yields one order item per non-blank line of a JSON Lines file. """
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip(WHITESPACE):
+                yield json.loads(line)
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        if len(buffer) > max_item_size:
+            raise json.JSONDecodeError(f"Expecting an order item of at most {max_item_size} characters", buffer, 0)
+        buffer += chunk
+    if buffer.strip(WHITESPACE):
+        yield json.loads(buffer)
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from product import Product, is_non_negative
+
+
+class PriceCache:
+    """
+    A bounded cache of the prices of (item code, quantity) pairs, with least recently used eviction.
+
+    Each cached price is stored together with the pricing terms of the product
+    (`unit_price`, `special_quantity` and `special_price`) it was calculated with.
+    If the terms of the product have changed since, the cached price is recalculated.
+
+    A cache is not thread-safe. Use one cache per thread.
+
+    A hit still checks the pricing terms and moves the entry to the end, so for the pricing of `Product`,
+    which is a few arithmetic operations, a hit is slower than calculating the price again
+    (see `python benchmark.py --compare-price-cache`). The cache only pays off for products whose pricing is expensive.
+
+    Attributes:
+        max_size: The maximum number of cached prices.
+        hits: The number of prices found in the cache.
+        misses: The number of prices that had to be calculated.
+    """
+    def __init__(self, max_size: int=4096):
+        """
+        Initialize an empty price cache.
+
+        Raises:
+            ValueError: If `max_size` is not a positive integer.
+        """
+        if not isinstance(max_size, int) or max_size <= 0:
+            raise ValueError("The maximum size of the cache should be a positive integer.")
+        self.max_size = max_size
+        self.prices = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.prices)
+
+    def calculate_price(self, product: Product, quantity: int, trusted: bool=False):
+        """
+        Returns the total price for a given `quantity` of the `product`, from the cache if possible.
+        If `trusted` is True, the `quantity` has already been validated and is not checked again.
+
+        Raises:
+            ValueError: If `quantity` is not a non-negative integer.
+
+        >>> cache = PriceCache()
+        >>> product_A = Product("A", 50, 3, 140)
+        >>> cache.calculate_price(product_A, 3), cache.calculate_price(product_A, 3)
+        (140, 140)
+        >>> cache.hits, cache.misses
+        (1, 1)
+        """
+        if not trusted and not is_non_negative(int, quantity):
+            raise ValueError(f"The quantity of {product.get_item_code()} should be a non-negative integer.")
+        key = (product.get_item_code(), quantity)
+        terms = (product.unit_price, product.special_quantity, product.special_price)
+        entry = self.prices.get(key)
+        if entry is not None and entry[0] == terms:
+            self.hits += 1
+            self.prices.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        price = product.calculate_price(quantity, True)
+        self.prices[key] = (terms, price)
+        self.prices.move_to_end(key)
+        if len(self.prices) > self.max_size:
+            self.prices.popitem(last=False)
+        return price
+
+    def price_difference(self, product: Product, quantity_before: int, quantity_after: int, trusted: bool=False):
+        """
+        Returns the price difference resulting from a change in the quantity of the `product`,
+        like `Product.price_difference`, using the cached prices.
+        If `trusted` is True, the quantities have already been validated and are not checked again.
+
+        Raises:
+            ValueError: If `quantity_before` or `quantity_after` is not a non-negative integer.
+        """
+        if not trusted and (not is_non_negative(int, quantity_before) or not is_non_negative(int, quantity_after)):
+            raise ValueError("The quantity of the product should be a non-negative integer.")
+        if quantity_after == quantity_before:
+            return 0
+        return self.calculate_price(product, quantity_after, True) - self.calculate_price(product, quantity_before, True)
+
+    def clear(self):
+        """ Removes all the cached prices and resets the counters. """
+        self.prices.clear()
+        self.hits = 0
+        self.misses = 0
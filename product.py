@@ -1,6 +1,12 @@
 from numbers import Number
 
+# Prices of these types are checked by their exact type, without the slower isinstance check against `Number`.
+CONCRETE_NUMBER_TYPES = (int, float)
+
+
 class Product:
+    __slots__ = ("item_code", "unit_price", "special_quantity", "special_price")
+
     def __init__(self, item_code, unit_price: Number, special_quantity: int=None, special_price: Number=None):
         """ 
         Represents a product with a unit price and an optional special price.
@@ -41,15 +47,16 @@ class Product:
             return f"There is no special price for {self.get_item_code()}"
 
 
-    def calculate_price(self, quantity: int) -> Number:
+    def calculate_price(self, quantity: int, trusted: bool=False) -> Number:
         """ 
         Returns and return the total price for a given `quantity` of the product.
+        If `trusted` is True, the `quantity` has already been validated and is not checked again.
 
         Raises:
             ValueError: If `quantity` is not a non-negative integer.
 
         """
-        if not is_non_negative(int, quantity):
+        if not trusted and not is_non_negative(int, quantity):
             raise ValueError(f"The quantity of {self.get_item_code()} should be a non-negative integer.")
 
         if self.special_quantity and self.special_price and quantity >= self.special_quantity:
@@ -61,11 +68,12 @@ class Product:
         return price
     
     
-    def price_difference(self, quantity_before: int, quantity_after: int) -> Number:
+    def price_difference(self, quantity_before: int, quantity_after: int, trusted: bool=False) -> Number:
         """ 
         Returns the price difference resulting from a change in the quantity of the product.
         `quantity_before` is the quantity of the product before the change.
         `quantity_after` is the quantity of the product after the change.
+        If `trusted` is True, the quantities have already been validated and are not checked again.
         
         Raises:
             ValueError: If `quantity_before` or `quantity_after` is not a non-negative integer.
@@ -80,11 +88,11 @@ class Product:
         >>> product_A.price_difference(3, 2)
         -40
         """
-        if not is_non_negative(int, quantity_before) or not is_non_negative(int, quantity_after):
+        if not trusted and (not is_non_negative(int, quantity_before) or not is_non_negative(int, quantity_after)):
             raise ValueError("The quantity of the product should be a non-negative integer.")
         if quantity_after == quantity_before:
             return 0
-        return self.calculate_price(quantity_after) - self.calculate_price(quantity_before)
+        return self.calculate_price(quantity_after, True) - self.calculate_price(quantity_before, True)
     
 
 def is_non_negative(number_type, number):
@@ -97,9 +105,24 @@ def is_non_negative(number_type, number):
     >>> is_non_negative(Number, -4.33)
     False
     """
+    # An exact type match is much faster than an isinstance check, especially against an ABC like `Number`.
+    if type(number) is number_type:
+        return number >= 0
     return isinstance(number, number_type) and number >= 0
 
 
+def is_non_negative_number(number):
+    """ 
+    Check if the argument `number` is a non-negative number, like `is_non_negative(Number, number)`,
+    with a fast path for ints and floats.
+    >>> is_non_negative_number(4.33), is_non_negative_number(-4), is_non_negative_number("4")
+    (True, False, False)
+    """
+    if type(number) in CONCRETE_NUMBER_TYPES:
+        return number >= 0
+    return isinstance(number, Number) and number >= 0
+
+
 def validate_product_parameters(unit_price, special_quantity, special_price):
     """ 
     Validate parameters for the Product class. 
@@ -108,9 +131,9 @@ def validate_product_parameters(unit_price, special_quantity, special_price):
     `special_quantity` should be a positive integer if it is not None.
     `special_price` should be a non-negative number if it is not None.
     """
-    if not is_non_negative(Number, unit_price):
+    if not is_non_negative_number(unit_price):
         raise ValueError("Unit price should be a non-negative number.")
     if special_quantity is not None and (not isinstance(special_quantity, int) or special_quantity <= 0):
         raise ValueError("Special quantity should be a positive integer.")
-    if special_price and not is_non_negative(Number, special_price):
+    if special_price and not is_non_negative_number(special_price):
         raise ValueError("Special price should be a non-negative number.")
\ No newline at end of file
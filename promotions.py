@@ -0,0 +1,351 @@
+"""
+A rule engine for promotions, finding the lowest price of a shopping cart.
+
+The promotions are indexed by item code, and compiled into a `PricingPlan` that only holds
+the rules relevant to the products in a cart. The plan prices each product with dynamic programming
+over its bundle options, and cross-product bundles with dynamic programming over the bundles.
+
+The states of the cross-bundle search are the remaining quantities of the products sharing the bundles,
+so their number grows with the product of those quantities. Once a search has visited more than
+`MAX_CROSS_BUNDLE_STATES` states, it stops and the products are priced greedily instead: the bundles saving
+the most are applied first, as many times as the quantities allow. The greedy price is never lower than
+the lowest price, and may be higher.
+
+>>> store = Store()
+>>> store.add_product(Product("A", 50, 3, 140))
+>>> store.add_product(Product("B", 35))
+>>> engine = PromotionEngine(store, [BundlePrice("A", 6, 250), CrossBundle({"A": 1, "B": 1}, 70)])
+>>> engine.plan(["A", "B"]).price({"A": 7, "B": 1})
+320
+"""
+from cart import Cart
+from product import Product, is_non_negative_number
+from store import Store
+
+MAX_CROSS_BUNDLE_STATES = 100_000
+
+
+class BundlePrice:
+    """
+    A rule where `quantity` of the product `code` cost `price`, like the special price of a `Product`.
+    Several bundle prices for the same product make tiered bundles.
+    """
+    def __init__(self, code: str, quantity: int, price):
+        """
+        Raises:
+            ValueError: If `quantity` is not a positive integer or `price` is not a non-negative number.
+        """
+        if not isinstance(quantity, int) or quantity <= 0:
+            raise ValueError("The bundle quantity should be a positive integer.")
+        if not is_non_negative_number(price):
+            raise ValueError("The bundle price should be a non-negative number.")
+        self.codes = (code,)
+        self.quantity = quantity
+        self.price = price
+
+    def bundle_options(self, unit_price) -> list:
+        """ Returns the (quantity, price) options this rule adds to the product. """
+        return [(self.quantity, self.price)]
+
+
+class BuyXGetY:
+    """ A rule where, for every `buy` units of the product `code` bought, `free` more units are free. """
+    def __init__(self, code: str, buy: int, free: int):
+        """
+        Raises:
+            ValueError: If `buy` or `free` is not a positive integer.
+        """
+        if not isinstance(buy, int) or not isinstance(free, int) or buy <= 0 or free <= 0:
+            raise ValueError("The bought and free quantities should be positive integers.")
+        self.codes = (code,)
+        self.buy = buy
+        self.free = free
+
+    def bundle_options(self, unit_price) -> list:
+        """ Returns the (quantity, price) options this rule adds to the product. """
+        return [(self.buy + self.free, self.buy * unit_price)]
+
+
+class PercentageDiscount:
+    """ A rule where each unit of the product `code` costs `percent` percent less. """
+    def __init__(self, code: str, percent):
+        """
+        Raises:
+            ValueError: If `percent` is not a number between 0 and 100.
+        """
+        if not is_non_negative_number(percent) or percent > 100:
+            raise ValueError("The discount should be between 0 and 100 percent.")
+        self.codes = (code,)
+        self.percent = percent
+
+    def bundle_options(self, unit_price) -> list:
+        """
+        Returns the (quantity, price) options this rule adds to the product.
+        An int price stays an int when the discount is a whole number of its units.
+
+        >>> PercentageDiscount("A", 10).bundle_options(50), PercentageDiscount("A", 10).bundle_options(25)
+        ([(1, 45)], [(1, 22.5)])
+        """
+        price = unit_price * (100 - self.percent)
+        if isinstance(price, int) and price % 100 == 0:
+            return [(1, price // 100)]
+        return [(1, price / 100)]
+
+
+class CrossBundle:
+    """ A rule where a bundle of several products, given as a dictionary of item codes and quantities, costs `price`. """
+    def __init__(self, quantities: dict, price):
+        """
+        Raises:
+            ValueError: If the bundle has no products, a quantity is not a positive integer, or `price` is not a non-negative number.
+        """
+        if not quantities or any(not isinstance(quantity, int) or quantity <= 0 for quantity in quantities.values()):
+            raise ValueError("The bundle should have products with positive integer quantities.")
+        if not is_non_negative_number(price):
+            raise ValueError("The bundle price should be a non-negative number.")
+        self.codes = tuple(quantities)
+        self.quantities = dict(quantities)
+        self.price = price
+
+
+class PromotionEngine:
+    """
+    Holds the active promotions of a store, indexed by item code.
+
+    Attributes:
+        store: The store whose products are priced.
+        rules_by_code: A dictionary where the keys are item codes and the values are the rules involving the product.
+        include_product_specials: Whether the special price of each `Product` is a `BundlePrice` rule.
+    """
+    def __init__(self, store: Store, rules=(), include_product_specials: bool=True):
+        self.store = store
+        self.include_product_specials = include_product_specials
+        self.rules_by_code = {}
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        """
+        Adds a promotion `rule`.
+
+        Raises:
+            ValueError: If a product of the rule is not in the store.
+        """
+        for code in rule.codes:
+            if code not in self.store.get_shelf():
+                raise ValueError(f"We don't have {code} in our store.")
+        for code in rule.codes:
+            self.rules_by_code.setdefault(code, []).append(rule)
+
+    def plan(self, codes) -> "PricingPlan":
+        """ Compiles the rules relevant to the products `codes` into a `PricingPlan`. """
+        codes = set(codes)
+        shelf = self.store.get_shelf()
+        unit_prices = {}
+        bundle_options = {}
+        cross_bundles = []
+        for code in codes:
+            product = shelf[code]
+            unit_prices[code] = product.unit_price
+            options = []
+            if self.include_product_specials and product.special_quantity and product.special_price:
+                options.append((product.special_quantity, product.special_price))
+            for rule in self.rules_by_code.get(code, ()):
+                if isinstance(rule, CrossBundle):
+                    if rule not in cross_bundles and codes.issuperset(rule.codes):
+                        cross_bundles.append(rule)
+                else:
+                    options.extend(rule.bundle_options(product.unit_price))
+            bundle_options[code] = options
+        return PricingPlan(unit_prices, bundle_options, cross_bundles)
+
+
+class PricingPlan:
+    """
+    The rules relevant to the products of a cart, compiled for pricing.
+
+    Attributes:
+        unit_prices: A dictionary where the keys are item codes and the values are unit prices.
+        bundle_options: A dictionary where the keys are item codes and the values are (quantity, price) options.
+        components: Lists of cross bundles sharing products, with the item codes they involve.
+        max_states: The number of states of a cross-bundle search after which the products are priced greedily.
+        cost_tables: A dictionary where the keys are item codes and the values are the lowest prices of each quantity,
+            up to the quantity past which the lowest prices repeat with the option of the lowest price per unit.
+        repeating_terms: A dictionary where the keys are item codes and the values are the (size, price) of the option
+            of the lowest price per unit, and the quantity past which it is part of a lowest price.
+    """
+    def __init__(self, unit_prices: dict, bundle_options: dict, cross_bundles: list, max_states: int=MAX_CROSS_BUNDLE_STATES):
+        self.unit_prices = unit_prices
+        self.max_states = max_states
+        self.bundle_options = bundle_options
+        self.cost_tables = {}
+        self.repeating_terms = {}
+        self.components = group_cross_bundles(cross_bundles)
+
+    def product_price(self, code: str, quantity: int):
+        """
+        Returns the lowest price of `quantity` of the product `code` with its bundle options.
+
+        Among any `best_size` bundles, some add up to a multiple of `best_size` units, which the option with the lowest
+        price per unit prices as low. So past `best_size` times the largest bundle, a lowest price always uses that option,
+        and the prices are only calculated with dynamic programming up to there.
+        """
+        options = self.bundle_options[code]
+        unit_price = self.unit_prices[code]
+        if not options:
+            return quantity * unit_price
+        terms = self.repeating_terms.get(code)
+        if terms is None:
+            best_size, best_price = 1, unit_price
+            for size, price in options:
+                if price * best_size < best_price * size:
+                    best_size, best_price = size, price
+            terms = self.repeating_terms[code] = (best_size, best_price, best_size * max(size for size, _ in options))
+        best_size, best_price, limit = terms
+        best_count = 0
+        if quantity > limit:
+            best_count = -(-(quantity - limit) // best_size)
+            quantity -= best_count * best_size
+        return self.table_price(code, quantity) + best_count * best_price
+
+    def table_price(self, code: str, quantity: int):
+        """ Returns the lowest price of `quantity` of the product `code`, extending its cost table up to `quantity`. """
+        options = self.bundle_options[code]
+        unit_price = self.unit_prices[code]
+        table = self.cost_tables.setdefault(code, [0])
+        for count in range(len(table), quantity + 1):
+            best = table[count - 1] + unit_price
+            for size, price in options:
+                if size <= count and table[count - size] + price < best:
+                    best = table[count - size] + price
+            table.append(best)
+        return table[quantity]
+
+    def price(self, quantities: dict):
+        """
+        Returns the lowest price of the products and `quantities` of a cart.
+
+        Raises:
+            KeyError: If a product is not in the plan.
+        """
+        total = 0
+        in_component = set()
+        for bundles, codes in self.components:
+            in_component.update(codes)
+            total += self.component_price(bundles, codes, quantities)
+        for code, quantity in quantities.items():
+            if code not in in_component:
+                total += self.product_price(code, quantity)
+        return total
+
+    def component_price(self, bundles: list, codes: list, quantities: dict):
+        """
+        Returns the lowest price of the products `codes` that share the cross `bundles`,
+        or their greedy price if the search visits more than `max_states` states.
+        """
+        memo = {}
+
+        def best(index, remaining):
+            key = (index, remaining)
+            if key in memo:
+                return memo[key]
+            if len(memo) >= self.max_states:
+                raise SearchLimitReached()
+            if index == len(bundles):
+                result = sum(self.product_price(code, quantity) for code, quantity in zip(codes, remaining))
+            else:
+                bundle = bundles[index]
+                requirement = [bundle.quantities.get(code, 0) for code in codes]
+                result = best(index + 1, remaining)
+                count = 1
+                while all(have >= need * count for have, need in zip(remaining, requirement)):
+                    left = tuple(have - need * count for have, need in zip(remaining, requirement))
+                    result = min(result, count * bundle.price + best(index + 1, left))
+                    count += 1
+            memo[key] = result
+            return result
+
+        try:
+            return best(0, tuple(quantities.get(code, 0) for code in codes))
+        except SearchLimitReached:
+            return self.greedy_component_price(bundles, codes, quantities)
+
+    def greedy_component_price(self, bundles: list, codes: list, quantities: dict):
+        """
+        Returns a price of the products `codes` that share the cross `bundles`, applying first the bundles
+        that save the most against the prices of their products, as many times as the quantities allow.
+        """
+        remaining = {code: quantities.get(code, 0) for code in codes}
+        savings = []
+        for bundle in bundles:
+            saving = sum(self.product_price(code, need) for code, need in bundle.quantities.items()) - bundle.price
+            if saving > 0:
+                savings.append((saving, bundle))
+        total = 0
+        for _, bundle in sorted(savings, key=lambda saving: -saving[0]):
+            count = min(remaining[code] // need for code, need in bundle.quantities.items())
+            for code, need in bundle.quantities.items():
+                remaining[code] -= need * count
+            total += count * bundle.price
+        return total + sum(self.product_price(code, quantity) for code, quantity in remaining.items())
+
+
+class SearchLimitReached(Exception):
+    """ Raised when a cross-bundle search visits more states than the limit of its `PricingPlan`. """
+
+
+def group_cross_bundles(cross_bundles: list) -> list:
+    """ Groups the `cross_bundles` that share products, and returns a list of (bundles, item codes) pairs. """
+    groups = []
+    for bundle in cross_bundles:
+        merged_bundles, merged_codes = [bundle], set(bundle.codes)
+        for group in groups[:]:
+            if merged_codes & group[1]:
+                merged_bundles = group[0] + merged_bundles
+                merged_codes |= group[1]
+                groups.remove(group)
+        groups.append((merged_bundles, merged_codes))
+    return [(bundles, sorted(codes)) for bundles, codes in groups]
+
+
+class PromotionCart(Cart):
+    """
+    A shopping cart priced by a `PromotionEngine`.
+
+    The pricing plan is compiled once for the products in the cart, and only compiled again
+    when a product is added to or removed from the cart. The subtotal is priced when it is read,
+    through `get_subtotal` or the `subtotal` attribute, and only after the cart changed.
+    """
+    def __init__(self, store: Store, engine: PromotionEngine):
+        self.engine = engine
+        self.plan = None
+        self.subtotal_is_stale = False
+        super().__init__(store)
+
+    @property
+    def subtotal(self):
+        """ The lowest price of the shopping cart with the promotions, see `get_subtotal`. """
+        return self.get_subtotal()
+
+    @subtotal.setter
+    def subtotal(self, subtotal):
+        self.priced_subtotal = subtotal
+
+    def set_valid_quantity(self, product: str, quantity_after: int):
+        """ Sets the quantity of a `product` that has already been validated to `quantity_after`. """
+        if (product in self.cart) != bool(quantity_after):
+            self.plan = None
+        if quantity_after:
+            self.cart[product] = quantity_after
+        else:
+            self.cart.pop(product, None)
+        self.subtotal_is_stale = True
+
+    def get_subtotal(self):
+        """ Returns the lowest price of the shopping cart with the promotions. """
+        if self.subtotal_is_stale:
+            if self.plan is None:
+                self.plan = self.engine.plan(self.cart)
+            self.priced_subtotal = self.plan.price(self.cart)
+            self.subtotal_is_stale = False
+        return self.priced_subtotal
@@ -0,0 +1,261 @@
+"""
+Replays recorded order logs through shopping carts, and compares the results with a golden output.
+
+An order log is a JSON Lines file (optionally compressed with gzip) where each line is one `take_order` call:
+    {"cart_id": "customer-1", "order": [{"code": "A", "quantity": 3}, ...]}
+The orders are replayed in the order of the log, as fast as possible or at a fixed rate of orders per second,
+so the replay is deterministic. The final content, subtotal and error messages of every cart can be written
+as a golden output, or compared with a golden output written by another build, to check that a change
+kept the same results. The throughput and the latency percentiles of `take_order` are reported.
+
+Usage:
+    python replay.py orders.jsonl --catalogue catalogue.json --write-golden golden.jsonl
+    python replay.py orders.jsonl --catalogue catalogue.json --golden golden.jsonl [--rate N] [--output report.json]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+from decimal import Decimal
+from benchmark import percentile
+from cart import Cart
+from store import Store
+
+Divergence = namedtuple("Divergence", ["cart_id", "field", "expected", "actual"])
+Divergence.__doc__ = """
+A difference between the replayed and the golden result of a cart.
+
+Attributes:
+    cart_id: The id of the cart.
+    field: "cart", "subtotal" or "errors", or "missing" if a cart is only in the golden output, "unexpected" if it is not in it.
+    expected: The golden value.
+    actual: The replayed value.
+"""
+
+
+def iter_order_log(file):
+    """
+    Yields the (cart id, order) of each line of an order log `file`.
+
+    Raises:
+        ValueError: If a line is not valid JSON, or has no cart_id or order.
+
+    >>> from io import StringIO
+    >>> list(iter_order_log(StringIO('{"cart_id": 1, "order": [{"code": "A", "quantity": 3}]}\\n')))
+    [(1, [{'code': 'A', 'quantity': 3}])]
+    """
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f"Line {line_number} of the order log is not valid JSON.") from None
+        if not isinstance(record, dict) or "cart_id" not in record or "order" not in record:
+            raise ValueError(f"Line {line_number} of the order log should have a cart_id and an order.")
+        yield record["cart_id"], record["order"]
+
+
+def replay(store: Store, records, rate: float=None, cart_class=Cart) -> dict:
+    """
+    Replays the (cart id, order) `records` through one cart per cart id, in order.
+
+    Args:
+        store (Store): The store where the carts are shopping.
+        records: An iterable of (cart id, order) pairs, where each order is in the `Cart.take_order` format.
+        rate (float): The number of orders per second to replay, or None to replay as fast as possible.
+            With a rate, the latency of an order is measured from the time it was due, so the time an order
+            waits behind a slow one is not hidden.
+        cart_class: The class of the carts, `Cart` by default.
+
+    Returns:
+        dict: The carts, the error messages of each cart id, the latencies in seconds, and the number of orders,
+            order items and seconds of the replay.
+
+    Raises:
+        ValueError: If `rate` is not positive.
+    """
+    if rate is not None and rate <= 0:
+        raise ValueError("The rate should be a positive number of orders per second.")
+    carts = {}
+    errors = {}
+    latencies = []
+    order_item_count = 0
+    started = time.perf_counter()
+    for index, (cart_id, order) in enumerate(records):
+        cart = carts.get(cart_id)
+        if cart is None:
+            cart = carts[cart_id] = cart_class(store)
+            errors[cart_id] = []
+        if rate is not None:
+            due = started + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            order_started = due
+        else:
+            order_started = time.perf_counter()
+        cart.take_order(order, errors=errors[cart_id])
+        latencies.append(time.perf_counter() - order_started)
+        order_item_count += len(order) if isinstance(order, list) else 0
+    return {
+        "carts": carts,
+        "errors": errors,
+        "latencies": latencies,
+        "orders": len(latencies),
+        "order_items": order_item_count,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def final_results(replayed: dict) -> dict:
+    """ Returns the final cart, subtotal and error messages of each cart id of a replay. """
+    return {
+        cart_id: {"cart": cart.get_cart(), "subtotal": cart.get_subtotal(), "errors": replayed["errors"][cart_id]}
+        for cart_id, cart in replayed["carts"].items()
+    }
+
+
+def json_default(value):
+    """ Converts the values JSON has no type for, like `Decimal` subtotals, to exact strings. """
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_golden(results: dict, file):
+    """
+    Writes the final `results` of a replay to a golden output `file`, one JSON object per cart.
+    `Decimal` subtotals are written as strings, so they are kept exactly.
+
+    >>> from io import StringIO
+    >>> file = StringIO()
+    >>> write_golden({1: {"cart": {"A": 3}, "subtotal": Decimal("1.40"), "errors": []}}, file)
+    >>> file.getvalue()
+    '{"cart_id": 1, "cart": {"A": 3}, "subtotal": "1.40", "errors": []}\\n'
+    """
+    for cart_id, result in results.items():
+        file.write(json.dumps({"cart_id": cart_id, **result}, default=json_default) + "\n")
+
+
+def read_golden(file) -> dict:
+    """ Reads a golden output `file` written by `write_golden`. """
+    golden = {}
+    for line in file:
+        if line.strip():
+            result = json.loads(line)
+            golden[result.pop("cart_id")] = result
+    return golden
+
+
+def compare_results(results: dict, golden: dict) -> list:
+    """
+    Returns the `Divergence`s between the final `results` of a replay and the `golden` results.
+    A `Decimal` subtotal is compared with the string `write_golden` wrote for it.
+
+    >>> compare_results({1: {"cart": {"A": 3}, "subtotal": 140, "errors": []}}, {1: {"cart": {"A": 3}, "subtotal": 150, "errors": []}})
+    [Divergence(cart_id=1, field='subtotal', expected=150, actual=140)]
+    """
+    divergences = []
+    for cart_id, expected in golden.items():
+        actual = results.get(cart_id)
+        if actual is None:
+            divergences.append(Divergence(cart_id, "missing", expected, None))
+            continue
+        for field in ("cart", "subtotal", "errors"):
+            value = str(actual[field]) if isinstance(actual[field], Decimal) else actual[field]
+            if value != expected.get(field):
+                divergences.append(Divergence(cart_id, field, expected.get(field), actual[field]))
+    for cart_id, actual in results.items():
+        if cart_id not in golden:
+            divergences.append(Divergence(cart_id, "unexpected", None, actual))
+    return divergences
+
+
+def make_report(replayed: dict, divergences: list=None) -> dict:
+    """ Returns the throughput, the latency percentiles and the divergences of a replay. """
+    latencies = sorted(replayed["latencies"])
+    seconds = replayed["seconds"]
+    report = {
+        "carts": len(replayed["carts"]),
+        "orders": replayed["orders"],
+        "order_items": replayed["order_items"],
+        "seconds": seconds,
+        "orders_per_second": replayed["orders"] / seconds if seconds else 0,
+        "order_items_per_second": replayed["order_items"] / seconds if seconds else 0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0,
+    }
+    if divergences is not None:
+        report["divergences"] = [divergence._asdict() for divergence in divergences]
+    return report
+
+
+def print_report(report: dict, file=None, max_divergences: int=10):
+    """ Prints a `report` of a replay, with up to `max_divergences` divergences. """
+    file = file or sys.stdout
+    print(
+        f"Replayed {report['orders']} orders with {report['order_items']} order items into {report['carts']} carts "
+        f"in {report['seconds']:.3f}s: {report['orders_per_second']:,.0f} orders/s, {report['order_items_per_second']:,.0f} order items/s",
+        file=file,
+    )
+    print(
+        f"take_order latency: p50 {report['p50_ms']:.4f} ms, p99 {report['p99_ms']:.4f} ms, "
+        f"p99.9 {report['p999_ms']:.4f} ms, max {report['max_ms']:.4f} ms",
+        file=file,
+    )
+    if "divergences" not in report:
+        return
+    divergences = report["divergences"]
+    if not divergences:
+        print("No divergence from the golden output.", file=file)
+        return
+    print(f"{len(divergences)} divergences from the golden output:", file=file)
+    for divergence in divergences[:max_divergences]:
+        if divergence["field"] == "missing":
+            print(f"  cart {divergence['cart_id']}: in the golden output but not replayed", file=file)
+        elif divergence["field"] == "unexpected":
+            print(f"  cart {divergence['cart_id']}: replayed but not in the golden output", file=file)
+        else:
+            print(f"  cart {divergence['cart_id']}: {divergence['field']} expected {divergence['expected']}, got {divergence['actual']}", file=file)
+
+
+def main(arguments=None) -> int:
+    """ Runs the replay tool, and returns 1 if the results diverge from the golden output, otherwise 0. """
+    parser = argparse.ArgumentParser(description="Replay recorded order logs and compare the results with a golden output.")
+    parser.add_argument("log", help="order log to replay, as JSON Lines (optionally compressed with gzip)")
+    parser.add_argument("--catalogue", default="catalogue.json", help="catalogue of the store (JSON, or compiled by catalogue_file.py)")
+    parser.add_argument("--rate", type=float, help="orders per second to replay (default: as fast as possible)")
+    parser.add_argument("--golden", help="golden output to compare the results with")
+    parser.add_argument("--write-golden", help="file to write the results to as a golden output")
+    parser.add_argument("--output", help="file to save the report to as JSON")
+    args = parser.parse_args(arguments)
+
+    from batch import load_store, open_order_file
+    store = load_store(args.catalogue)
+    with open_order_file(args.log) as f:
+        # The log is streamed, so only the carts are kept in memory, not the orders.
+        replayed = replay(store, iter_order_log(f), args.rate)
+    results = final_results(replayed)
+
+    divergences = None
+    if args.golden:
+        with open(args.golden, "r", encoding="utf-8") as f:
+            divergences = compare_results(results, read_golden(f))
+    if args.write_golden:
+        with open(args.write_golden, "w", encoding="utf-8") as f:
+            write_golden(results, f)
+
+    report = make_report(replayed, divergences)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=json_default)
+    return 1 if divergences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
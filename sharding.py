@@ -0,0 +1,412 @@
+"""
+Shards the live shopping carts across worker processes.
+
+The cart ids are assigned to the shards with consistent hashing: each shard owns many points on a hash ring,
+and a cart belongs to the shard owning the first point after the hash of its id. Adding a shard only moves
+the carts between the new points and the points before them, which are about 1 / (shard count) of the carts.
+
+Each shard is a worker process with its own replica of the store, and owns its carts. A `ShardRouter`
+forwards the calls for a cart to the worker of its shard over a pipe. The workers run in parallel,
+so `take_orders` keeps several orders in flight per shard instead of waiting for each answer.
+"""
+import hashlib
+from bisect import bisect
+from collections import deque
+from multiprocessing import Pipe, Process
+from threading import Event, Semaphore, Thread
+from cart import Cart
+from store import Store
+
+
+class HashRing:
+    """
+    A consistent hash ring of nodes.
+
+    Attributes:
+        virtual_nodes: The number of points of each node on the ring.
+
+    >>> ring = HashRing(["shard-0", "shard-1"])
+    >>> ring.node_for("customer-1") in ("shard-0", "shard-1")
+    True
+    """
+    def __init__(self, nodes=(), virtual_nodes: int=64):
+        """
+        Raises:
+            ValueError: If `virtual_nodes` is not a positive integer.
+        """
+        if not isinstance(virtual_nodes, int) or virtual_nodes <= 0:
+            raise ValueError("The number of virtual nodes should be a positive integer.")
+        self.virtual_nodes = virtual_nodes
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node: str):
+        """
+        Raises:
+            ValueError: If the `node` is already on the ring.
+        """
+        if node in self.owners.values():
+            raise ValueError(f"The node {node} is already on the ring.")
+        for index in range(self.virtual_nodes):
+            point = ring_hash(f"{node}#{index}")
+            self.owners[point] = node
+        self.points = sorted(self.owners)
+
+    def remove_node(self, node: str):
+        """
+        Raises:
+            ValueError: If the `node` is not on the ring.
+        """
+        points = [point for point, owner in self.owners.items() if owner == node]
+        if not points:
+            raise ValueError(f"The node {node} is not on the ring.")
+        for point in points:
+            del self.owners[point]
+        self.points = sorted(self.owners)
+
+    def node_for(self, key) -> str:
+        """
+        Returns the node owning the `key`.
+
+        Raises:
+            ValueError: If there are no nodes on the ring.
+        """
+        if not self.points:
+            raise ValueError("There are no nodes on the ring.")
+        index = bisect(self.points, ring_hash(str(key))) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+def ring_hash(key: str) -> int:
+    """ Returns the position of the `key` on the ring, which is the same in every process. """
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+def run_shard(connection, store: Store):
+    """
+    Serves the calls of a router for the carts of a shard, until it receives "stop".
+    Each call is a (method, cart id, arguments) tuple, and is answered with ("ok", result) or ("error", exception).
+    """
+    carts = {}
+    while True:
+        method, cart_id, arguments = connection.recv()
+        if method == "stop":
+            connection.close()
+            return
+        try:
+            result = SHARD_METHODS[method](store, carts, cart_id, *arguments)
+        except Exception as e:
+            # Any error goes back to the router, so a failing call never kills the worker.
+            connection.send(("error", e))
+        else:
+            connection.send(("ok", result))
+
+
+def open_shard_cart(store: Store, carts: dict, cart_id) -> Cart:
+    """ Returns the cart `cart_id` of the shard, creating an empty cart if there is none. """
+    cart = carts.get(cart_id)
+    if cart is None:
+        cart = carts[cart_id] = Cart(store)
+    return cart
+
+
+def shard_add_product(store: Store, carts: dict, cart_id, product, quantity):
+    open_shard_cart(store, carts, cart_id).add_product(product, quantity)
+
+
+def shard_take_order(store: Store, carts: dict, cart_id, data) -> list:
+    """ Takes the order into the cart, and returns the messages for the invalid order items. """
+    errors = []
+    open_shard_cart(store, carts, cart_id).take_order(data, errors=errors)
+    return errors
+
+
+def shard_get_cart(store: Store, carts: dict, cart_id) -> tuple:
+    """ Returns the (cart, subtotal) of the cart, which are empty if the shard does not own the cart. """
+    cart = carts.get(cart_id)
+    return (cart.get_cart(), cart.get_subtotal()) if cart is not None else ({}, 0)
+
+
+def shard_cart_ids(store: Store, carts: dict, cart_id) -> list:
+    return list(carts)
+
+
+def shard_export_carts(store: Store, carts: dict, cart_id, cart_ids) -> list:
+    """ Removes the carts `cart_ids` from the shard, and returns their (cart id, content, subtotal). """
+    exported = []
+    for exported_cart_id in cart_ids:
+        cart = carts.pop(exported_cart_id)
+        exported.append((exported_cart_id, cart.cart, cart.subtotal))
+    return exported
+
+
+def shard_import_carts(store: Store, carts: dict, cart_id, exported: list):
+    """ Adds the carts exported by another shard, without pricing them again. """
+    for imported_cart_id, content, subtotal in exported:
+        cart = Cart(store)
+        cart.cart = content
+        cart.subtotal = subtotal
+        carts[imported_cart_id] = cart
+
+
+SHARD_METHODS = {
+    "add_product": shard_add_product,
+    "take_order": shard_take_order,
+    "get_cart": shard_get_cart,
+    "cart_ids": shard_cart_ids,
+    "export_carts": shard_export_carts,
+    "import_carts": shard_import_carts,
+}
+
+
+class Shard:
+    """
+    A worker process owning the carts of a shard, and the router's end of its pipe.
+
+    Attributes:
+        name: The name of the shard on the hash ring.
+        process: The worker process.
+        connection: The router's end of the pipe to the worker.
+    """
+    def __init__(self, name: str, store: Store):
+        self.name = name
+        self.connection, worker_connection = Pipe()
+        self.process = Process(target=run_shard, args=(worker_connection, store), daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+    def send(self, method: str, cart_id=None, *arguments):
+        self.connection.send((method, cart_id, arguments))
+
+    def receive(self):
+        """
+        Returns the result of the oldest call sent to the shard.
+
+        Raises:
+            Exception: The exception raised by the call in the worker.
+            EOFError: If the worker has stopped.
+        """
+        try:
+            status, result = self.connection.recv()
+        except EOFError:
+            raise EOFError(f"The worker of {self.name} stopped before answering.") from None
+        if status == "error":
+            raise result
+        return result
+
+    def call(self, method: str, cart_id=None, *arguments):
+        self.send(method, cart_id, *arguments)
+        return self.receive()
+
+    def stop(self):
+        self.send("stop")
+        self.process.join()
+        self.connection.close()
+
+
+class ShardReader(Thread):
+    """
+    Receives the answers of a shard to the orders sent by `ShardRouter.take_orders`, in a thread.
+
+    The reader stops once it has received the answer to the `END` call, or once the worker has stopped.
+
+    Attributes:
+        errors: The (cart id, messages) of the orders with invalid order items.
+        failure: The first exception raised in the worker or while receiving, or None.
+        failed: An `Event` shared by the readers of the same orders, set when any of them fails.
+        stopped: True once the worker will not answer anymore.
+    """
+    END = object()
+
+    def __init__(self, shard: Shard, max_pending: int, failed: Event):
+        super().__init__(daemon=True)
+        self.shard = shard
+        self.max_pending = max_pending
+        self.slots = Semaphore(max_pending)
+        self.pending = deque()
+        self.errors = []
+        self.failure = None
+        self.failed = failed
+        self.stopped = False
+
+    def reserve(self, cart_id) -> bool:
+        """
+        Waits until fewer than `max_pending` answers are expected, and expects one for `cart_id`.
+        Returns False if the worker has stopped, so no answer will come.
+        """
+        self.slots.acquire()
+        if self.stopped:
+            return False
+        self.pending.append(cart_id)
+        return True
+
+    def fail(self, exception: Exception):
+        if self.failure is None:
+            self.failure = exception
+        self.failed.set()
+
+    def run(self):
+        while True:
+            try:
+                messages = self.shard.receive()
+            except (EOFError, OSError) as e:
+                self.fail(e)
+                # Unblock the router for good: the worker will not answer anymore.
+                self.stopped = True
+                for _ in range(self.max_pending + 1):
+                    self.slots.release()
+                return
+            except Exception as e:
+                self.fail(e)
+                messages = None
+            cart_id = self.pending.popleft()
+            self.slots.release()
+            if cart_id is ShardReader.END:
+                return
+            if messages:
+                self.errors.append((cart_id, messages))
+
+
+class ShardRouter:
+    """
+    Routes the calls for each cart to the worker process of its shard.
+
+    Attributes:
+        store (Store): The store replicated to every shard.
+        shards: A dictionary where the keys are shard names and the values are `Shard`s.
+        ring (HashRing): The hash ring assigning the cart ids to the shards.
+
+    >>> from product import Product
+    >>> store = Store()
+    >>> store.add_product(Product("A", 50, 3, 140))
+    >>> with ShardRouter(store, 2) as router:
+    ...     router.take_order("customer-1", [{"code": "A", "quantity": 4}, {"code": "E", "quantity": 1}])
+    ...     router.get_cart("customer-1"), router.get_subtotal("customer-1")
+    ["An error occurred: We don't have E in our store."]
+    ({'A': 4}, 190)
+    """
+    def __init__(self, store: Store, shard_count: int=2, virtual_nodes: int=64):
+        """
+        Starts `shard_count` worker processes, each with a replica of the `store`.
+
+        Raises:
+            ValueError: If `shard_count` is not a positive integer.
+        """
+        if not isinstance(shard_count, int) or shard_count <= 0:
+            raise ValueError("The number of shards should be a positive integer.")
+        self.store = store
+        self.shards = {}
+        self.ring = HashRing(virtual_nodes=virtual_nodes)
+        for _ in range(shard_count):
+            self.start_shard()
+
+    def start_shard(self) -> Shard:
+        name = f"shard-{len(self.shards)}"
+        shard = self.shards[name] = Shard(name, self.store)
+        self.ring.add_node(name)
+        return shard
+
+    def shard_for(self, cart_id) -> Shard:
+        """ Returns the shard owning the cart `cart_id`. """
+        return self.shards[self.ring.node_for(cart_id)]
+
+    def add_product(self, cart_id, product: str, quantity: int):
+        """
+        Adds a `product` with a given `quantity` to the cart `cart_id`.
+
+        Raises:
+            TypeError, ValueError: Like `Cart.add_product`.
+        """
+        self.shard_for(cart_id).call("add_product", cart_id, product, quantity)
+
+    def take_order(self, cart_id, data) -> list:
+        """ Takes an order into the cart `cart_id`, and returns the messages for the invalid order items. """
+        return self.shard_for(cart_id).call("take_order", cart_id, data)
+
+    def take_orders(self, orders, max_pending: int=64) -> dict:
+        """
+        Takes many orders, keeping up to `max_pending` orders in flight per shard so that the shards work in parallel.
+
+        The answers of each shard are received by a reader thread while the orders are being sent,
+        so a worker never blocks sending a large answer while the router blocks sending the next order.
+        Once an order raised an exception in a worker, the following orders are not sent anymore,
+        but the orders already sent are still answered before the exception is raised.
+
+        Args:
+            orders: An iterable of (cart id, order) pairs.
+
+        Returns:
+            dict: The messages for the invalid order items of each cart id with invalid order items.
+
+        Raises:
+            Exception: The exception raised by the first failed order of the first shard with a failed order,
+                or EOFError if a worker stopped.
+        """
+        failed = Event()
+        readers = {name: ShardReader(shard, max_pending, failed) for name, shard in self.shards.items()}
+        for reader in readers.values():
+            reader.start()
+        try:
+            for cart_id, order in orders:
+                if failed.is_set():
+                    break
+                shard = self.shard_for(cart_id)
+                if not readers[shard.name].reserve(cart_id):
+                    break
+                shard.send("take_order", cart_id, order)
+        finally:
+            for name, reader in readers.items():
+                # The answer to a last, cheap call tells the reader that every answer has been received.
+                if reader.reserve(ShardReader.END):
+                    try:
+                        self.shards[name].send("cart_ids")
+                    except OSError:
+                        # The worker has stopped, so the reader stops on the end of the pipe.
+                        pass
+                reader.join()
+
+        errors = {}
+        for reader in readers.values():
+            if reader.failure is not None:
+                raise reader.failure
+            for cart_id, messages in reader.errors:
+                errors.setdefault(cart_id, []).extend(messages)
+        return errors
+
+    def get_cart(self, cart_id) -> dict:
+        """ Returns the content of the cart `cart_id`, sorted by product. """
+        return self.shard_for(cart_id).call("get_cart", cart_id)[0]
+
+    def get_subtotal(self, cart_id):
+        """ Returns the subtotal of the cart `cart_id`. """
+        return self.shard_for(cart_id).call("get_cart", cart_id)[1]
+
+    def add_shard(self) -> int:
+        """ Starts a new shard, moves the carts it now owns to it from the other shards, and returns the number of carts moved. """
+        old_shards = list(self.shards.values())
+        new_shard = self.start_shard()
+        moved = 0
+        for shard in old_shards:
+            cart_ids = [cart_id for cart_id in shard.call("cart_ids") if self.shard_for(cart_id) is new_shard]
+            if cart_ids:
+                new_shard.call("import_carts", None, shard.call("export_carts", None, cart_ids))
+                moved += len(cart_ids)
+        return moved
+
+    def cart_counts(self) -> dict:
+        """ Returns the number of carts owned by each shard. """
+        return {name: len(shard.call("cart_ids")) for name, shard in self.shards.items()}
+
+    def close(self):
+        """ Stops the worker processes. """
+        for shard in self.shards.values():
+            shard.stop()
+        self.shards = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -6,6 +6,52 @@ from numbers import Number
 from unittest.mock import patch
 from io import StringIO
 from main import main
+from order_reader import iter_order_items
+import json
+import ast
+import typing
+import batch_pricing
+from batch_pricing import calculate_prices, price_order_lines
+from checkout import CheckoutResult, checkout_cart, checkout_carts
+from concurrent_cart import ConcurrentCart
+from threading import Thread
+import asyncio
+from async_cart import AsyncCart, OrderLineResult, take_order_stream
+from compact_store import CompactStore
+from catalogue_file import MappedStore, compile_catalogue, read_catalogue
+import os
+import pickle
+import tempfile
+from price_cache import PriceCache
+from benchmark import OrderGenerator, generate_catalogue, measure, run_benchmarks, run_price_cache_benchmark, run_validation_benchmark
+import validation
+from validation import partition_order
+from cart_history import HistoryCart
+from promotions import BundlePrice, BuyXGetY, CrossBundle, PercentageDiscount, PromotionCart, PromotionEngine
+import cart_journal
+from cart_journal import CartJournal, SqliteCartJournal
+from batch import find_order_files, run_batch
+import gzip
+from instrumentation import InMemorySink, Instrumentation, JsonLogSink, PrometheusSink
+import gc
+from versioned_store import VersionedStore
+import http.client
+import time
+from checkout_service import CartSession, CheckoutServer, CheckoutService
+from load_generator import run_load
+from decimal import Decimal
+from fractions import Fraction
+from money import CentsCart, CentsStore, from_cents, to_cents
+from bench_money import run_money_benchmark
+from sharding import HashRing, ShardRouter
+from bench_sharding import run_sharding_benchmark
+import analytics
+from analytics import CartAnalytics, iter_batch_carts, read_columns
+import subprocess
+import sys
+from bench_startup import parse_importtime, run_startup_benchmark
+import replay
+from replay import Divergence, compare_results, final_results, iter_order_log, read_golden, write_golden
 
 
 class ProductTestCase(unittest.TestCase):
@@ -32,6 +78,12 @@ class ProductTestCase(unittest.TestCase):
         self.assertRaisesRegex(ValueError, message_special_price, Product, "E", 300, 12, -20)
         self.assertRaisesRegex(ValueError, message_special_price, Product, "E", 300, 12, "YEAH")
 
+        # Numbers other than ints and floats are checked against the Number ABC
+        from fractions import Fraction
+        self.assertEqual(Fraction(1, 2), Product("E", Fraction(1, 2)).get_unit_price())
+        self.assertRaisesRegex(ValueError, message_unit_price, Product, "E", Decimal("-0.5"))
+        self.assertRaisesRegex(ValueError, message_unit_price, Product, "E", float("nan"))
+
 
     def test_product_property(self):
         self.assertEqual("A", self.product_A.get_item_code())
@@ -96,6 +148,57 @@ class ProductTestCase(unittest.TestCase):
 
 
 
+class PriceCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.product_A = Product("A", 50, 3, 140)
+        self.product_B = Product("B", 35, 2, 60)
+        self.cache = PriceCache(max_size=3)
+
+    def test_cached_prices(self):
+        for quantity in (1, 2, 3, 3, 2):
+            self.assertEqual(self.product_A.calculate_price(quantity), self.cache.calculate_price(self.product_A, quantity))
+        self.assertEqual((2, 3, 3), (self.cache.hits, self.cache.misses, len(self.cache)))
+
+        # The least recently used price (A, 1) is evicted.
+        self.cache.calculate_price(self.product_B, 1)
+        self.assertEqual(3, len(self.cache))
+        self.cache.calculate_price(self.product_A, 1)
+        self.assertEqual((2, 5), (self.cache.hits, self.cache.misses))
+
+        self.assertEqual(self.product_A.price_difference(4, 5), self.cache.price_difference(self.product_A, 4, 5))
+        self.assertEqual(0, self.cache.price_difference(self.product_A, 3, 3))
+        message = "The quantity of the product should be a non-negative integer."
+        self.assertRaisesRegex(ValueError, message, self.cache.price_difference, self.product_A, 1.0, 3)
+        self.assertRaisesRegex(ValueError, message, self.cache.price_difference, self.product_A, 3, 3.0)
+        self.assertRaisesRegex(ValueError, "The quantity of A should be a non-negative integer.", self.cache.calculate_price, self.product_A, 1.0)
+        self.assertRaisesRegex(ValueError, "The maximum size of the cache should be a positive integer.", PriceCache, 0)
+
+        self.cache.clear()
+        self.assertEqual((0, 0, 0), (self.cache.hits, self.cache.misses, len(self.cache)))
+
+    def test_cache_invalidation(self):
+        self.assertEqual(140, self.cache.calculate_price(self.product_A, 3))
+        self.product_A.special_price = 120
+        self.assertEqual(120, self.cache.calculate_price(self.product_A, 3))
+        self.product_A.special_quantity = 2
+        self.assertEqual(170, self.cache.calculate_price(self.product_A, 3))
+        self.product_A.unit_price = 40
+        self.assertEqual(160, self.cache.calculate_price(self.product_A, 3))
+        self.assertEqual((0, 4), (self.cache.hits, self.cache.misses))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_cart_with_price_cache(self, mock_stdout):
+        store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            store.add_product(product)
+        cache = PriceCache()
+        for _ in range(3):
+            cart = Cart(store, cache)
+            cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+            self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706), (cart.get_cart(), cart.get_subtotal()))
+        self.assertEqual((26, 10), (cache.hits, cache.misses))
+
+
 class StoreTestCase(unittest.TestCase):
     def test_store(self):
         # Empty store
@@ -122,6 +225,255 @@ class StoreTestCase(unittest.TestCase):
         self.assertRaisesRegex(ValueError, message_already_exist, store.add_product, product_A)
 
 
+class CompactStoreTestCase(unittest.TestCase):
+    def test_compact_store(self):
+        store = CompactStore()
+        self.assertEqual({}, dict(store.get_shelf()))
+        store.add_product(Product("A", 50, 3, 140))
+        store.add_item("B", 35, 2, 60)
+        store.add_item("C", 25)
+        self.assertEqual(["A", "B", "C"], list(store.get_shelf()))
+        self.assertIn("B", store.get_shelf())
+        self.assertNotIn("E", store.get_shelf())
+        self.assertEqual("3 of A costs 140", store.get_shelf()["A"].get_special_price())
+        self.assertEqual("There is no special price for C", store.get_shelf()["C"].get_special_price())
+        self.assertEqual(95, store.get_shelf()["B"].calculate_price(3))
+
+        self.assertRaisesRegex(TypeError, "You should only add the product to the shelf.", store.add_product, "Not a product")
+        self.assertRaisesRegex(ValueError, "The product A is already on the shelf.", store.add_item, "A", 10)
+        self.assertRaisesRegex(ValueError, "Unit price should be a non-negative number.", store.add_item, "E", -8)
+        self.assertEqual(3, len(store.get_shelf()))
+
+        store.add_product(Product("E", 10.5, 3, 29.9))
+        self.assertEqual(29.9, store.get_shelf()["E"].calculate_price(3))
+
+        # A float price does not change the type of the other prices
+        self.assertIs(int, type(store.get_shelf()["A"].unit_price))
+        self.assertIs(int, type(store.get_shelf()["A"].calculate_price(3)))
+        self.assertIs(float, type(store.get_shelf()["E"].unit_price))
+        store.add_item("F", 7)
+        self.assertEqual((7, None), (store.get_shelf()["F"].unit_price, store.get_shelf()["F"].special_price))
+
+        # Prices that cannot be stored exactly are rejected, and nothing is added
+        self.assertRaisesRegex(ValueError, "The price 0.10 cannot be stored exactly", store.add_item, "G", Decimal("0.10"))
+        self.assertRaisesRegex(ValueError, "The price 1/2 cannot be stored exactly", store.add_item, "G", 1, 2, Fraction(1, 2))
+        self.assertRaisesRegex(ValueError, "is too large to be stored as an int of 64 bits", store.add_item, "G", 2 ** 63)
+        self.assertEqual(5, len(store.get_shelf()))
+        self.assertNotIn("G", store.get_shelf())
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_cart_in_compact_store(self, mock_stdout):
+        store = CompactStore()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            store.add_product(product)
+        cart = Cart(store)
+        cart.take_order(TestCheckoutSystem.data_with_invalid_input + [{"code": "E", "quantity": 1}])
+        self.assertEqual({'A': 7, 'B': 5, 'C': 5, 'D': 8}, cart.get_cart())
+        self.assertEqual(706, cart.get_subtotal())
+        self.assertTrue(mock_stdout.getvalue().endswith("An error occurred: We don't have E in our store.\n"))
+
+
+class CatalogueFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, "catalogue.bin")
+        with open("catalogue.json", "r") as f:
+            self.products = read_catalogue(f) + [Product("E", 10.5, 3, 29.9), Product("Étagère", 99, 2, 0)]
+        compile_catalogue(self.products, self.file_name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_mapped_store(self, mock_stdout):
+        store = MappedStore(self.file_name)
+        shelf = store.get_shelf()
+        self.assertEqual(["A", "B", "C", "D", "E", "Étagère"], list(shelf))
+        self.assertEqual(6, len(shelf))
+        for product in self.products:
+            mapped_product = shelf[product.get_item_code()]
+            self.assertIs(mapped_product, shelf[product.get_item_code()])
+            for quantity in range(10):
+                self.assertEqual(product.calculate_price(quantity), mapped_product.calculate_price(quantity))
+            self.assertEqual(product.get_special_price(), mapped_product.get_special_price())
+        self.assertNotIn("F", shelf)
+        self.assertNotIn(None, shelf)
+        self.assertRaises(KeyError, shelf.__getitem__, "F")
+        self.assertRaisesRegex(ValueError, "Cannot add products to a store loaded from a catalogue file.", store.add_product, Product("F", 1))
+
+        cart = Cart(pickle.loads(pickle.dumps(store)))
+        cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706), (cart.get_cart(), cart.get_subtotal()))
+
+    def test_invalid_catalogue(self):
+        self.assertRaisesRegex(ValueError, "The product A is already on the shelf.", compile_catalogue, [Product("A", 1), Product("A", 2)], self.file_name)
+        self.assertRaisesRegex(TypeError, "You should only add the product to the shelf.", compile_catalogue, ["A"], self.file_name)
+        with open(self.file_name, "wb") as f:
+            f.write(b"Not a catalogue file")
+        self.assertRaisesRegex(ValueError, "The file is not a catalogue file.", MappedStore, self.file_name)
+        open(self.file_name, "wb").close()
+        self.assertRaisesRegex(ValueError, "The file is not a catalogue file.", MappedStore, self.file_name)
+        self.assertRaisesRegex(ValueError, "Invalid product", read_catalogue, StringIO('[{"code": "A"}]'))
+
+    def test_price_types(self):
+        products = [Product("A", 50, 3, 140), Product("B", 10.5, 3, 29.9), Product("C", 2 ** 62, 2, 1.5)]
+        compile_catalogue(products, self.file_name)
+        shelf = MappedStore(self.file_name).get_shelf()
+        for product in products:
+            mapped_product = shelf[product.get_item_code()]
+            for attribute in ("unit_price", "special_quantity", "special_price"):
+                self.assertEqual(getattr(product, attribute), getattr(mapped_product, attribute))
+                self.assertIs(type(getattr(product, attribute)), type(getattr(mapped_product, attribute)))
+
+        # Prices that cannot be stored exactly are rejected before the file is written
+        for product in (Product("D", Decimal("0.10")), Product("D", 1, 2, Fraction(1, 2)), Product("D", 2 ** 63)):
+            self.assertRaisesRegex(ValueError, "The price .* (cannot be stored exactly|is too large)", compile_catalogue, products + [product], self.file_name)
+        self.assertEqual(3, len(MappedStore(self.file_name).get_shelf()))
+
+
+class VersionedStoreTestCase(unittest.TestCase):
+    def test_reload(self):
+        store = VersionedStore([Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25)])
+        pinned_cart = store.new_cart()
+        pinned_cart.add_product("A", 3)
+        store.reload([Product("A", 45, 3, 120), Product("D", 12)], removed=["C"])
+        self.assertEqual(2, store.current.version)
+        self.assertEqual(["A", "B", "D"], sorted(store.get_shelf()))
+
+        # The pinned cart keeps pricing against its own snapshot
+        pinned_cart.add_product("A", 1)
+        pinned_cart.add_product("C", 1)
+        self.assertEqual(({'A': 4, 'C': 1}, 215), (pinned_cart.get_cart(), pinned_cart.get_subtotal()))
+
+        cart = store.new_cart()
+        cart.take_order([{"code": "A", "quantity": 4}, {"code": "D", "quantity": 1}])
+        self.assertEqual(177, cart.get_subtotal())
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            cart.take_order([{"code": "C", "quantity": 1}])
+        self.assertEqual("An error occurred: We don't have C in our store.\n", mock_stdout.getvalue())
+
+        self.assertRaisesRegex(ValueError, "We don't have E in our store.", store.reload, removed=["E"])
+        self.assertRaisesRegex(ValueError, "The product A cannot be both changed and removed.", store.reload, [Product("A", 1)], ["A"])
+        self.assertRaisesRegex(ValueError, "The product B is already on the shelf.", store.reload, [Product("B", 1), Product("B", 2)])
+        self.assertRaisesRegex(TypeError, "You should only add the product to the shelf.", store.reload, ["Not a product"])
+        self.assertRaisesRegex(ValueError, "Cannot add products to a catalogue snapshot.", store.current.add_product, Product("E", 1))
+        self.assertEqual(2, store.current.version)
+
+    def test_reload_catalogue(self):
+        store = VersionedStore([Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25)])
+        product_B = store.get_shelf()["B"]
+        snapshot = store.reload_catalogue([Product("A", 50, 3, 130), Product("B", 35, 2, 60), Product("D", 12)])
+        self.assertEqual({"A", "D"}, set(snapshot.get_shelf().changes))
+        self.assertEqual({"C"}, snapshot.get_shelf().removed)
+        self.assertIs(product_B, snapshot.get_shelf()["B"])
+        self.assertEqual(130, snapshot.get_shelf()["A"].calculate_price(3))
+
+        # A change of the type of a price is a change
+        snapshot = store.reload_catalogue([Product("A", 50, 3, 130), Product("B", 35.0, 2, 60), Product("D", 12)])
+        self.assertEqual({"B"}, set(snapshot.get_shelf().changes))
+        self.assertIs(float, type(snapshot.get_shelf()["B"].unit_price))
+
+    def test_concurrent_reload_catalogue(self):
+        store = VersionedStore([Product("A", 50)])
+        mismatches = []
+
+        def reload(unit_price):
+            for _ in range(200):
+                catalogue = [Product("A", unit_price), Product(f"P{unit_price}", unit_price)]
+                shelf = store.reload_catalogue(catalogue).get_shelf()
+                if sorted((code, product.unit_price) for code, product in shelf.flatten().items()) != sorted((product.get_item_code(), product.unit_price) for product in catalogue):
+                    mismatches.append(unit_price)
+
+        threads = [Thread(target=reload, args=(unit_price,)) for unit_price in range(1, 5)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads as often as possible, so a diff made outside the lock would be stale
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual([], mismatches)
+
+    def test_unpinned_cart(self):
+        store = VersionedStore([Product("A", 50)])
+        cart = Cart(store)
+        cart.add_product("A", 1)
+        store.reload([Product("A", 40)])
+        cart.add_product("A", 1)
+        self.assertEqual(90, cart.get_subtotal())
+
+    def test_layers_are_merged(self):
+        store = VersionedStore([Product("A", 50, 3, 140)], max_depth=3)
+        for unit_price in range(1, 5):
+            store.reload([Product("A", 50 + unit_price)])
+        shelf = store.get_shelf()
+        self.assertEqual(2, shelf.depth)
+        self.assertEqual(54, shelf["A"].calculate_price(1))
+        self.assertEqual({"A": shelf["A"]}, dict(shelf))
+
+    def test_old_snapshots_are_freed(self):
+        store = VersionedStore([Product("A", 50, 3, 140)])
+        cart = store.new_cart()
+        store.reload([Product("A", 45)])
+        store.reload([Product("A", 40)])
+        gc.collect()
+        self.assertEqual([1, 3], store.live_versions())
+        del cart
+        gc.collect()
+        self.assertEqual([3], store.live_versions())
+
+
+class MoneyTestCase(unittest.TestCase):
+    def test_conversions(self):
+        self.assertEqual([140, 10, 5, 1200, 0], [to_cents(Decimal("1.40")), to_cents(0.1), to_cents("0.05"), to_cents(12), to_cents(0)])
+        self.assertEqual([Decimal("1.40"), Decimal("0.00")], [from_cents(140), from_cents(0)])
+        self.assertRaisesRegex(ValueError, "The amount 0.001 is not a whole number of cents.", to_cents, Decimal("0.001"))
+        self.assertRaisesRegex(ValueError, "The amount inf is not a whole number of cents.", to_cents, float("inf"))
+        self.assertRaisesRegex(ValueError, "The amount Not a number is not a number.", to_cents, "Not a number")
+        self.assertEqual(50, to_cents(Fraction(1, 2)))
+        self.assertRaisesRegex(ValueError, "The amount 1/3 is not a whole number of cents.", to_cents, Fraction(1, 3))
+
+    def test_cents_cart(self):
+        store = CentsStore()
+        for product in [
+            Product("A", Decimal("0.50"), 3, Decimal("1.40")),
+            Product("B", 0.35, 2, 0.6),
+            Product("C", Decimal("0.25")),
+            Product("D", Decimal("0.12")),
+        ]:
+            store.add_product(product)
+        self.assertEqual((50, 3, 140), (store.get_shelf()["A"].unit_price, store.get_shelf()["A"].special_quantity, store.get_shelf()["A"].special_price))
+        self.assertRaisesRegex(TypeError, "You should only add the product to the shelf.", store.add_product, "Not a product")
+        self.assertRaisesRegex(ValueError, "The product A is already on the shelf.", store.add_product, Product("A", 1))
+        self.assertRaisesRegex(TypeError, "A CentsCart should shop in a CentsStore", CentsCart, Store())
+
+        cart = CentsCart(store)
+        with patch('sys.stdout', new_callable=StringIO):
+            cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706, Decimal("7.06")), (cart.get_cart(), cart.get_subtotal_cents(), cart.get_subtotal()))
+
+        # The float subtotal drifts, the cents subtotal does not
+        float_store = Store()
+        cents_store = CentsStore()
+        for product in [Product("E", 0.1), Product("F", 0.2)]:
+            float_store.add_product(product)
+            cents_store.add_product(product)
+        float_cart = Cart(float_store)
+        cents_cart = CentsCart(cents_store)
+        for cart_to_fill in (float_cart, cents_cart):
+            cart_to_fill.add_product("E", 1)
+            cart_to_fill.add_product("F", 1)
+        self.assertNotEqual(0.3, float_cart.get_subtotal())
+        self.assertEqual(Decimal("0.30"), cents_cart.get_subtotal())
+
+    def test_money_benchmark(self):
+        report = run_money_benchmark(sku_count=100, order_size=10, order_count=5)
+        self.assertEqual(["take_order (float)", "take_order (Decimal)", "take_order (cents)"], [result["name"] for result in report["results"]])
+        self.assertEqual(report["subtotals"]["Decimal"], report["subtotals"]["cents"])
+
+
 class CartTestCast(unittest.TestCase):
     def setUp(self):
         # Set up a store with product A, B, C, D and an empty shopping cart in the store
@@ -238,6 +590,1180 @@ class CartTestCast(unittest.TestCase):
         self.assertEqual(mock_stdout.getvalue(), print_msg)
 
 
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_take_order_with_errors(self, mock_stdout):
+        errors = []
+        self.cart.take_order(TestCheckoutSystem.data_with_invalid_input, errors=errors)
+        self.cart.take_order([], errors=errors)
+        self.assertEqual({'A': 7, 'B': 5, 'C': 5, 'D': 8}, self.cart.get_cart())
+        self.assertEqual(5, len(errors))
+        self.assertEqual("The data [] is not a valid list.", errors[-1])
+        self.assertEqual("", mock_stdout.getvalue())
+
+    def test_take_order_with_empty_or_broken_stream(self):
+        errors = []
+        self.cart.take_order(iter_order_items(StringIO("[]")), errors=errors)
+        self.assertEqual(["The order is empty."], errors)
+
+        # The order items before an invalid part of the stream stay in the cart
+        stream = iter_order_items(StringIO('[{"code": "A", "quantity": 3}, {"code": "B", "quantity": 2}, {"code": '))
+        self.assertRaises(json.JSONDecodeError, self.cart.take_order, stream)
+        self.assertEqual(({"A": 3, "B": 2}, 200), (self.cart.get_cart(), self.cart.get_subtotal()))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_take_order_with_generator(self, mock_stdout):
+        self.cart.take_order(item for item in [{'code': 'A', 'quantity': 3}, {'code': 'E', 'quantity': 1}, {'code': 'B', 'quantity': 2}])
+        self.assertEqual({"A": 3, "B": 2}, self.cart.get_cart())
+        self.assertEqual(200, self.cart.get_subtotal())
+        self.assertEqual(mock_stdout.getvalue(), "An error occurred: We don't have E in our store.\n")
+
+
+    def test_take_order_aggregate(self):
+        data = TestCheckoutSystem.data_with_invalid_input * 50 + [{'code': 'E', 'quantity': 3}, {'code': 'D', 'quantity': 0}]
+        with patch('sys.stdout', new_callable=StringIO) as expected_stdout:
+            self.cart.take_order(data)
+        cart = Cart(self.store)
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            cart.take_order(data, aggregate=True)
+        self.assertEqual(self.cart.get_cart(), cart.get_cart())
+        self.assertEqual(self.cart.get_subtotal(), cart.get_subtotal())
+        self.assertEqual(expected_stdout.getvalue(), mock_stdout.getvalue())
+
+        with patch.object(Product, 'calculate_price', autospec=True, side_effect=Product.calculate_price) as mock_calculate_price:
+            cart.take_order(data, aggregate=True)
+        self.assertEqual(8, mock_calculate_price.call_count)
+        self.assertEqual({"A": 700, "B": 500, "C": 500, "D": 800}, cart.get_cart())
+
+    def test_take_order_aggregate_with_float_prices(self):
+        store = Store()
+        for product in [Product("A", 50.3, 3, 140.1), Product("B", 35.7, 2, 60.9), Product("C", 25.1)]:
+            store.add_product(product)
+        data = [{"code": code, "quantity": quantity} for code, quantity in [("A", 4), ("B", 3), ("C", 7), ("A", 2), ("B", 1)]] * 20
+        cart = Cart(store)
+        cart.take_order(data)
+        aggregated_cart = Cart(store)
+        aggregated_cart.take_order(data, aggregate=True)
+        self.assertEqual(cart.get_cart(), aggregated_cart.get_cart())
+        # The float subtotals are rounded differently, so they may only differ in the last digits
+        self.assertAlmostEqual(cart.get_subtotal(), aggregated_cart.get_subtotal(), places=6)
+
+
+    def test_set_quantity_and_remove_product(self):
+        self.cart.add_product("A", 4)
+        self.cart.add_product("B", 3)
+        self.cart.set_quantity("A", 6)
+        self.assertEqual(({"A": 6, "B": 3}, 375), (self.cart.get_cart(), self.cart.get_subtotal()))
+        self.cart.set_quantity("B", 0)
+        self.assertEqual(({"A": 6}, 280), (self.cart.get_cart(), self.cart.get_subtotal()))
+        self.cart.set_quantity("C", 2)
+        self.cart.remove_product("A")
+        self.assertEqual(({"C": 2}, 50), (self.cart.get_cart(), self.cart.get_subtotal()))
+
+        self.assertRaisesRegex(TypeError, "The quantity of C should be a non-negative integer.", self.cart.set_quantity, "C", -1)
+        self.assertRaisesRegex(ValueError, "We don't have E in our store.", self.cart.set_quantity, "E", 1)
+        self.assertRaisesRegex(ValueError, "There is no A in the shopping cart.", self.cart.remove_product, "A")
+        self.assertRaisesRegex(TypeError, "Invalid product None.", self.cart.remove_product, None)
+
+        cart = ConcurrentCart(self.store)
+        cart.add_product("A", 4)
+        cart.set_quantity("A", 3)
+        cart.add_product("B", 1)
+        cart.remove_product("B")
+        self.assertEqual(({"A": 3}, 140), cart.snapshot())
+
+
+class HistoryCartTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.cart = HistoryCart(self.store)
+
+    def test_undo_redo(self):
+        self.cart.add_product("A", 2)
+        self.cart.add_product("B", 2)
+        self.cart.add_product("A", 1)
+        self.cart.add_product("A", 0)
+        self.cart.set_quantity("B", 2)
+        self.assertEqual(3, len(self.cart.log))
+        self.cart.undo()
+        self.cart.undo()
+        self.assertEqual(({"A": 2}, 100), (self.cart.get_cart(), self.cart.get_subtotal()))
+        self.cart.redo()
+        self.assertEqual(({"A": 2, "B": 2}, 160), (self.cart.get_cart(), self.cart.get_subtotal()))
+        self.cart.remove_product("B")
+        self.assertRaisesRegex(IndexError, "There is no change to redo.", self.cart.redo)
+        self.cart.undo()
+        self.cart.undo()
+        self.cart.undo()
+        self.assertEqual(({}, 0), (self.cart.get_cart(), self.cart.get_subtotal()))
+        self.assertRaisesRegex(IndexError, "There is no change to undo.", self.cart.undo)
+        self.assertEqual([("A", 0, 2), ("B", 0, 2), ("A", 2, 3), ("A", 3, 2), ("B", 2, 0), ("B", 0, 2), ("B", 2, 0), ("B", 0, 2), ("B", 2, 0), ("A", 2, 0)], self.cart.log)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_replay(self, mock_stdout):
+        self.cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        self.cart.remove_product("D")
+        for position, expected in ((0, ({}, 0)), (3, ({"A": 5, "B": 3, "D": 8}, 431)), (6, ({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706)), (7, ({'A': 7, 'B': 5, 'C': 5}, 610))):
+            cart = self.cart.replay(position)
+            self.assertEqual(expected, (cart.get_cart(), cart.get_subtotal()))
+        self.assertRaisesRegex(ValueError, "The position should be between 0 and 7.", self.cart.replay, 8)
+
+
+class OrderReaderTestCase(unittest.TestCase):
+    items = [{"code": "A", "quantity": 3}, {"code": "B", "quantity": 12}, ["Not a dictionary"], {"quantity": 3}, 7]
+
+    def test_json_array(self):
+        text = json.dumps(self.items, indent=2)
+        for chunk_size in (1, 2, 5, 65536):
+            self.assertEqual(self.items, list(iter_order_items(StringIO(text), chunk_size)))
+        self.assertEqual([], list(iter_order_items(StringIO(" [ ] "))))
+
+    def test_json_lines(self):
+        text = "\n".join(json.dumps(item) for item in self.items) + "\n\n"
+        for chunk_size in (1, 3, 65536):
+            self.assertEqual(self.items, list(iter_order_items(StringIO(text), chunk_size)))
+
+    def test_numbers_across_chunks(self):
+        items = [12.75, {"code": "A", "quantity": 3}, -3, 1e5, 2.5E-3, 10, 0.5]
+        text = "[12.75,{\"code\":\"A\",\"quantity\":3},-3,1e5,2.5E-3 ,10\n,0.5]"
+        self.assertEqual(items, json.loads(text))
+        for chunk_size in range(1, 12):
+            self.assertEqual(items, list(iter_order_items(StringIO(text), chunk_size)))
+        for text in ("[12.]", "[1 2]", "[1e]"):
+            for chunk_size in (1, 2, 3, 65536):
+                with self.assertRaises(json.JSONDecodeError):
+                    list(iter_order_items(StringIO(text), chunk_size))
+
+    def test_invalid_json(self):
+        for text in ("", "[{\"code\": \"A\"", "[{\"code\": \"A\"} {}]", "[1,]", "[1] 2", "{\"code\": "):
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_order_items(StringIO(text), 2))
+
+    def test_max_item_size(self):
+        # A malformed order item is rejected without reading the rest of the file
+        for text in ('[{"code": "A", "quantity": 1}, {"code": "A"' + " x" * 100_000 + "]", '{"code": "A"}\n{"code": "A"' + " x" * 100_000):
+            file = StringIO(text)
+            items = iter_order_items(file, 100, max_item_size=1000)
+            self.assertEqual({"code": "A", "quantity": 1} if text[0] == "[" else {"code": "A"}, next(items))
+            with self.assertRaisesRegex(json.JSONDecodeError, "Expecting an order item of at most 1000 characters"):
+                next(items)
+            self.assertLess(file.tell(), 2000)
+        self.assertEqual([{"code": "A" * 5000}], list(iter_order_items(StringIO(json.dumps([{"code": "A" * 5000}])), 100)))
+
+
+class BatchPricingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        self.products = [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("E", 10.5, 3, 29.9)]
+        for product in self.products:
+            self.store.add_product(product)
+        self.quantities = list(range(0, 25)) + [100, 1000]
+
+    def test_calculate_prices_matches_scalar_path(self):
+        for product in self.products:
+            expected = [product.calculate_price(quantity) for quantity in self.quantities]
+            self.assertEqual(expected, list(calculate_prices(product, self.quantities)))
+
+        message = "The quantity of A should be a non-negative integer."
+        self.assertRaisesRegex(ValueError, message, calculate_prices, self.products[0], [1, -1])
+
+    @unittest.skipUnless(batch_pricing.np, "NumPy is not installed")
+    def test_calculate_prices_vectorized(self):
+        np = batch_pricing.np
+        for product in self.products:
+            expected = [product.calculate_price(quantity) for quantity in self.quantities]
+            prices = calculate_prices(product, np.array(self.quantities))
+            self.assertIsInstance(prices, np.ndarray)
+            self.assertEqual(expected, prices.tolist())
+
+        message = "The quantity of A should be a non-negative integer."
+        for quantities in ([1, -1], [1.5, 2]):
+            self.assertRaisesRegex(ValueError, message, calculate_prices, self.products[0], np.array(quantities))
+
+    def check_price_order_lines(self):
+        lines = [(product.get_item_code(), quantity) for quantity in self.quantities for product in self.products]
+        expected = [self.store.get_shelf()[code].calculate_price(quantity) for code, quantity in lines]
+        prices = price_order_lines(self.store, lines)
+        self.assertEqual(expected, list(prices))
+        self.assertEqual(0, len(price_order_lines(self.store, [])))
+
+        self.assertRaisesRegex(ValueError, "We don't have F in our store.", price_order_lines, self.store, [("A", 1), ("F", 1)])
+        self.assertRaisesRegex(ValueError, "The quantity of B should be a non-negative integer.", price_order_lines, self.store, [("A", 1), ("B", -1)])
+        return prices
+
+    def test_price_order_lines_matches_scalar_path(self):
+        with patch("batch_pricing.np", None):
+            self.assertIsInstance(self.check_price_order_lines(), list)
+
+    @unittest.skipUnless(batch_pricing.np, "NumPy is not installed")
+    def test_price_order_lines_vectorized(self):
+        self.assertIsInstance(self.check_price_order_lines(), batch_pricing.np.ndarray)
+
+
+class CheckoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.orders = {
+            f"cart-{index}": [{"code": "A", "quantity": index % 5}, {"code": "B", "quantity": index % 3}, {"code": "E", "quantity": 1}]
+            for index in range(40)
+        }
+        self.orders["cart-invalid"] = []
+
+    def expected_result(self, cart_id):
+        cart = Cart(self.store)
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            cart.take_order(self.orders[cart_id])
+        return CheckoutResult(cart_id, cart.get_cart(), cart.get_subtotal(), mock_stdout.getvalue().splitlines())
+
+    def test_checkout_carts(self):
+        expected = {cart_id: self.expected_result(cart_id) for cart_id in self.orders}
+        for processes, chunk_size in ((1, 1), (2, 3)):
+            results = {result.cart_id: result for result in checkout_carts(self.store, self.orders, processes, chunk_size)}
+            self.assertEqual(expected, results)
+        self.assertEqual(["The data [] is not a valid list."], results["cart-invalid"].errors)
+        self.assertEqual(list(checkout_carts(self.store, [], 2)), [])
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_checkout_in_threads(self, mock_stdout):
+        # The messages are collected per cart, without redirecting the standard output of the process
+        expected = {cart_id: self.expected_result(cart_id) for cart_id in self.orders}
+        mock_stdout.truncate(0)
+        results = {}
+
+        def check_out(cart_ids):
+            for cart_id in cart_ids:
+                results[cart_id] = checkout_cart(self.store, cart_id, self.orders[cart_id])
+
+        cart_ids = list(self.orders)
+        threads = [Thread(target=check_out, args=(cart_ids[index::4],)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(expected, results)
+        self.assertEqual("", mock_stdout.getvalue())
+
+    def test_checkout_carts_with_invalid_arguments(self):
+        self.assertRaisesRegex(ValueError, "The number of processes should be a positive integer.", checkout_carts, self.store, self.orders, 0)
+        self.assertRaisesRegex(ValueError, "The chunk size should be a positive integer.", checkout_carts, self.store, self.orders, 2, 0)
+
+
+class ConcurrentCartTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+
+    def test_concurrent_add_product(self):
+        cart = ConcurrentCart(self.store, stripe_count=2)
+
+        def add_products(product):
+            for _ in range(500):
+                cart.add_product(product, 1)
+
+        threads = [Thread(target=add_products, args=(product,)) for product in "AABBCD"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(({"A": 1000, "B": 1000, "C": 500, "D": 500}, 95170), cart.snapshot())
+        self.assertEqual({"A": 1000, "B": 1000, "C": 500, "D": 500}, cart.get_cart())
+        self.assertEqual(95170, cart.get_subtotal())
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_take_order(self, mock_stdout):
+        cart = ConcurrentCart(self.store)
+        cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706), cart.snapshot())
+        self.assertRaisesRegex(TypeError, "The quantity of A should be a non-negative integer.", cart.add_product, "A", -1)
+        self.assertRaisesRegex(ValueError, "The stripe count should be a positive integer.", ConcurrentCart, self.store, 0)
+
+    def test_subtotal_attribute(self):
+        cart = ConcurrentCart(self.store, stripe_count=4)
+        cart.add_product("A", 4)
+        cart.add_product("B", 3)
+        self.assertEqual(285, cart.subtotal)
+        cart.update_subtotal(15)
+        self.assertEqual(300, cart.subtotal)
+
+        # Restoring a cart sets its subtotal, like the journal and the shards do
+        cart.subtotal = 95
+        self.assertEqual((95, [95, 0, 0, 0]), (cart.get_subtotal(), cart.stripe_subtotals))
+
+    def test_concurrent_update_subtotal(self):
+        cart = ConcurrentCart(self.store, stripe_count=4)
+
+        def update_subtotal():
+            for _ in range(1000):
+                cart.update_subtotal(1)
+
+        threads = [Thread(target=update_subtotal) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000, cart.subtotal)
+
+    def test_price_cache(self):
+        cache = PriceCache()
+        cart = ConcurrentCart(self.store, price_cache=cache)
+        cart.add_product("A", 3)
+        cart.add_product("A", 1)
+        self.assertEqual(190, cart.get_subtotal())
+        self.assertEqual(3, cache.misses)
+
+
+class AsyncCartTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.errors = [
+            "An error occurred: Cannot retrieve 'quantity' from the order item: {'code': 'A'}.",
+            "An error occurred: Cannot retrieve 'code' from the order item: {'quantity': 3}.",
+            "An error occurred: The quantity of C should be a non-negative integer.",
+            "The order item ['Not a dictionary'] is not a dictionary.",
+        ]
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_take_order(self, mock_stdout):
+        cart = AsyncCart(self.store, yield_every=3)
+        results = asyncio.run(cart.take_order(TestCheckoutSystem.data_with_invalid_input))
+        self.assertEqual(self.errors, [result.error for result in results if result.error])
+        self.assertEqual(OrderLineResult({"code": "A", "quantity": 5}, "A", 5, None), results[4])
+        self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706), (cart.get_cart(), cart.get_subtotal()))
+        self.assertEqual("", mock_stdout.getvalue())
+
+        for data in ([], {'code': 'A', 'quantity': 3}):
+            results = asyncio.run(cart.take_order(data))
+            self.assertEqual([OrderLineResult(data, None, None, f"The data {data} is not a valid list.")], results)
+        data = (item for item in [])
+        self.assertEqual([OrderLineResult(data, None, None, "The order is empty.")], asyncio.run(cart.take_order(data)))
+
+        asyncio.run(cart.add_product("D", 2))
+        self.assertEqual(730, cart.get_subtotal())
+        self.assertRaisesRegex(ValueError, "We don't have E in our store.", asyncio.run, cart.add_product("E", 2))
+
+    def test_take_order_stream(self):
+        async def order_items():
+            for order_item in TestCheckoutSystem.data_with_invalid_input * 10:
+                yield order_item
+
+        cart = AsyncCart(self.store)
+        errors = asyncio.run(take_order_stream(cart, order_items(), max_pending=2))
+        self.assertEqual(self.errors * 10, [result.error for result in errors])
+        self.assertEqual({'A': 70, 'B': 50, 'C': 50, 'D': 80}, cart.get_cart())
+
+        async def broken_order_items():
+            yield {"code": "A", "quantity": 1}
+            raise OSError("Connection lost")
+
+        self.assertRaisesRegex(OSError, "Connection lost", asyncio.run, take_order_stream(cart, broken_order_items()))
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_order_generator(self):
+        codes = [product.get_item_code() for product in generate_catalogue(50)]
+        orders = [OrderGenerator(codes, 1000, skew=1.2, invalid_share=0.25, seed=7).order() for _ in range(2)]
+        self.assertEqual(orders[0], orders[1])
+        valid_items = [item for item in orders[0] if isinstance(item, dict) and item.get("code") in codes and isinstance(item.get("quantity"), int) and item["quantity"] > 0]
+        self.assertAlmostEqual(0.75, len(valid_items) / 1000, delta=0.05)
+        self.assertGreater(sum(item["code"] == "SKU0" for item in valid_items), sum(item["code"] == "SKU49" for item in valid_items))
+        self.assertRaisesRegex(ValueError, "The share of invalid order items should be between 0 and 1.", OrderGenerator, codes, 10, 1, 2)
+
+    def test_run_benchmarks(self):
+        report = run_benchmarks(sku_count=20, order_size=5, order_count=3)
+        self.assertEqual(["add_product", "take_order", "file_checkout"], [result["name"] for result in report["results"]])
+        self.assertEqual(15, report["results"][1]["operations"])
+        json.dumps(report)
+
+    def test_measure_with_new_state_for_each_run(self):
+        carts = []
+
+        def add_product_operations():
+            cart = Cart(Store())
+            carts.append(cart)
+            return [lambda: cart.update_subtotal(1)] * 10
+
+        result = measure("update_subtotal", add_product_operations)
+        self.assertEqual(10, result["operations"])
+        self.assertEqual([10, 10], [cart.get_subtotal() for cart in carts])
+
+    def test_run_price_cache_benchmark(self):
+        results = run_price_cache_benchmark(sku_count=20, order_size=5, order_count=3)
+        self.assertEqual(["calculate_price", "calculate_price_cached", "take_order", "take_order_cached"], [result["name"] for result in results])
+        self.assertEqual([15] * 4, [result["operations"] for result in results])
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.instrumentation = Instrumentation()
+        self.addCleanup(self.instrumentation.disable)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_instrumentation(self, mock_stdout):
+        original_add_product = Cart.add_product
+        sink = InMemorySink()
+        self.instrumentation.enable(sink)
+        self.assertIsNot(original_add_product, Cart.add_product)
+        self.assertRaisesRegex(RuntimeError, "An instrumentation is already enabled.", Instrumentation().enable)
+
+        cart = Cart(self.store)
+        cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        cart.add_product("A", 1)
+        other_cart = Cart(self.store)
+        other_cart.take_order([{"code": "A", "quantity": 1}])
+        self.instrumentation.disable()
+        self.assertIs(original_add_product, Cart.add_product)
+        self.assertEqual(({'A': 8, 'B': 5, 'C': 5, 'D': 8}, 756), (cart.get_cart(), cart.get_subtotal()))
+
+        metrics = self.instrumentation.snapshot()
+        self.assertEqual(2, metrics["methods"]["Cart.take_order"]["count"])
+        self.assertEqual(1, metrics["methods"]["Cart.add_product"]["count"])
+        self.assertEqual(8, metrics["methods"]["Product.price_difference"]["count"])
+        self.assertEqual({"total": 11, "errors": 4}, metrics["order_items"])
+        self.assertEqual(0.4, self.instrumentation.error_rate(cart))
+        self.assertEqual(0.0, self.instrumentation.error_rate(other_cart))
+        self.assertEqual(0.0, self.instrumentation.error_rate(Cart(self.store)))
+
+        self.instrumentation.flush()
+        self.assertEqual([metrics], sink.snapshots)
+
+    def test_sinks(self):
+        self.instrumentation.enable(profile=True, profile_interval=0.0005)
+        Cart(self.store).add_product("A", 3)
+        self.instrumentation.disable()
+
+        output = StringIO()
+        JsonLogSink(output).emit(self.instrumentation.snapshot())
+        self.assertEqual(1, json.loads(output.getvalue())["methods"]["Cart.add_product"]["count"])
+        self.assertIn("profile", json.loads(output.getvalue()))
+
+        output = StringIO()
+        PrometheusSink(output).emit(self.instrumentation.snapshot())
+        self.assertIn('checkout_method_duration_seconds_bucket{method="Cart.add_product",le="+Inf"} 1\n', output.getvalue())
+        self.assertIn('checkout_method_duration_seconds_count{method="Store.get_shelf"} 2\n', output.getvalue())
+        self.assertIn("checkout_order_items_total 0\n", output.getvalue())
+
+
+class PromotionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+
+    def test_product_specials_match_calculate_price(self):
+        plan = PromotionEngine(self.store).plan(["A", "B", "C", "D"])
+        for code, product in self.store.get_shelf().items():
+            for quantity in range(30):
+                self.assertEqual(product.calculate_price(quantity), plan.product_price(code, quantity))
+
+    def test_rules(self):
+        engine = PromotionEngine(self.store, [BundlePrice("A", 5, 200), BuyXGetY("C", 2, 1), PercentageDiscount("D", 25)])
+        plan = engine.plan(["A", "C", "D"])
+        # 8 of A is best as 5 for 200 and 3 for 140, not 6 for 280 and 2 at 50.
+        self.assertEqual(340, plan.product_price("A", 8))
+        self.assertEqual(150, plan.product_price("C", 8))
+        self.assertEqual(36, plan.product_price("D", 4))
+        self.assertIs(int, type(plan.product_price("D", 4)))
+        self.assertEqual(22.5, PromotionEngine(self.store, [PercentageDiscount("C", 10)]).plan(["C"]).product_price("C", 1))
+        self.assertEqual(340 + 150 + 36, plan.price({"A": 8, "C": 8, "D": 4}))
+        self.assertEqual(0, plan.price({}))
+
+        self.assertRaisesRegex(ValueError, "We don't have E in our store.", engine.add_rule, BundlePrice("E", 2, 10))
+        self.assertRaisesRegex(ValueError, "The bundle quantity should be a positive integer.", BundlePrice, "A", 0, 10)
+        self.assertRaisesRegex(ValueError, "The discount should be between 0 and 100 percent.", PercentageDiscount, "A", 120)
+        self.assertRaisesRegex(ValueError, "The bought and free quantities should be positive integers.", BuyXGetY, "A", 2, 0)
+        self.assertRaisesRegex(ValueError, "The bundle should have products with positive integer quantities.", CrossBundle, {"A": 0}, 10)
+        self.assertRaisesRegex(ValueError, "The bundle price should be a non-negative number.", BundlePrice, "A", 2, "10")
+        self.assertRaisesRegex(ValueError, "The bundle price should be a non-negative number.", CrossBundle, {"A": 1}, None)
+        self.assertRaisesRegex(ValueError, "The discount should be between 0 and 100 percent.", PercentageDiscount, "A", "10")
+
+    def test_large_quantities(self):
+        engine = PromotionEngine(self.store, [BundlePrice("A", 5, 200), BundlePrice("B", 7, 250), BuyXGetY("C", 4, 1), PercentageDiscount("D", 25)])
+        plan = engine.plan(["A", "B", "C", "D"])
+        for code, unit_price in plan.unit_prices.items():
+            # The lowest prices of a cost table built up to every quantity
+            table = [0]
+            for count in range(1, 200):
+                table.append(min([table[count - 1] + unit_price] + [table[count - size] + price for size, price in plan.bundle_options[code] if size <= count]))
+            self.assertEqual(table, [plan.product_price(code, quantity) for quantity in range(200)])
+
+        # The cost tables stay small, whatever the quantity
+        self.assertEqual(40 * 10**9, plan.product_price("A", 10**9))
+        self.assertEqual(Product("A", 50, 3, 140).calculate_price(10**9 + 1), PromotionEngine(self.store).plan(["A"]).product_price("A", 10**9 + 1))
+        self.assertTrue(all(len(table) <= 50 for table in plan.cost_tables.values()))
+
+        cart = PromotionCart(self.store, PromotionEngine(self.store))
+        cart.add_product("A", 3_000_000)
+        cart.add_product("B", 10**9)
+        self.assertEqual(1_000_000 * 140 + 10**9 // 2 * 60, cart.get_subtotal())
+
+    def test_cross_bundles(self):
+        engine = PromotionEngine(self.store, [CrossBundle({"A": 1, "B": 1}, 70), CrossBundle({"B": 1, "C": 2}, 60), CrossBundle({"C": 1, "D": 1}, 30)])
+        # The cross bundles of B+C are only in plans with both B and C.
+        self.assertEqual(1, len(engine.plan(["A", "B"]).components[0][0]))
+        plan = engine.plan(["A", "B", "C", "D"])
+        self.assertEqual(1, len(plan.components))
+        quantities = {"A": 3, "B": 2, "C": 4, "D": 1}
+
+        def brute_force(quantities, bundles):
+            best = sum(plan.product_price(code, quantity) for code, quantity in quantities.items())
+            for index, bundle in enumerate(bundles):
+                if all(quantities[code] >= need for code, need in bundle.quantities.items()):
+                    left = {code: quantity - bundle.quantities.get(code, 0) for code, quantity in quantities.items()}
+                    best = min(best, bundle.price + brute_force(left, bundles[index:]))
+            return best
+
+        self.assertEqual(brute_force(quantities, plan.components[0][0]), plan.price(quantities))
+        # Two B+C bundles, 3 of A for 140, and D.
+        self.assertEqual(120 + 140 + 12, plan.price(quantities))
+
+        # Past the limit of states, the products are priced greedily, never below the lowest price
+        plan.max_states = 10
+        self.assertEqual(brute_force(quantities, plan.components[0][0]), plan.price(quantities))
+        large_quantities = {"A": 30, "B": 20, "C": 40, "D": 10}
+        greedy_price = plan.price(large_quantities)
+        plan.max_states = 1_000_000
+        self.assertGreaterEqual(greedy_price, plan.price(large_quantities))
+        self.assertLess(greedy_price, sum(plan.product_price(code, quantity) for code, quantity in large_quantities.items()))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_promotion_cart(self, mock_stdout):
+        engine = PromotionEngine(self.store, [CrossBundle({"A": 1, "D": 1}, 55)])
+        cart = PromotionCart(self.store, engine)
+        cart.take_order(TestCheckoutSystem.data_with_invalid_input)
+        self.assertEqual({'A': 7, 'B': 5, 'C': 5, 'D': 8}, cart.get_cart())
+        # 7 A+D bundles, 1 of D, 5 of B and 5 of C.
+        self.assertEqual(385 + 12 + 155 + 125, cart.get_subtotal())
+        cart.add_product("C", 1)
+        self.assertEqual(385 + 12 + 155 + 150, cart.subtotal)
+        cart.set_quantity("C", 5)
+        plan = cart.plan
+        cart.set_quantity("A", 3)
+        self.assertEqual(165 + 60 + 155 + 125, cart.get_subtotal())
+        self.assertIs(plan, cart.plan)
+        cart.remove_product("D")
+        self.assertEqual(140 + 155 + 125, cart.get_subtotal())
+        self.assertIsNot(plan, cart.plan)
+
+
+class CartJournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def fill_carts(self, journal):
+        for index in range(20):
+            cart = journal.open_cart(f"cart-{index}")
+            cart.add_product("A", index % 4 + 1)
+            cart.add_product("B", 2)
+        journal.open_cart("cart-3").remove_product("B")
+        journal.open_cart("cart-4").set_quantity("A", 7)
+
+    def assert_recovered(self, journal):
+        self.assertEqual(20, len(journal.carts))
+        self.assertEqual(({"A": 4}, 190), (journal.carts["cart-3"].get_cart(), journal.carts["cart-3"].get_subtotal()))
+        self.assertEqual(({"A": 7, "B": 2}, 390), (journal.carts["cart-4"].get_cart(), journal.carts["cart-4"].get_subtotal()))
+        self.assertEqual(({"A": 2, "B": 2}, 160), (journal.carts["cart-5"].get_cart(), journal.carts["cart-5"].get_subtotal()))
+
+    def test_recover_from_log(self):
+        journal = CartJournal(self.directory.name, self.store, batch_size=8)
+        self.fill_carts(journal)
+        journal.commit()
+        # Simulate a crash in the middle of writing a change.
+        journal.log_file.write('["cart-0", "C", 1')
+        journal.log_file.flush()
+
+        recovered = CartJournal(self.directory.name, self.store)
+        self.assert_recovered(recovered)
+        self.assertEqual({"A": 1, "B": 2}, recovered.carts["cart-0"].get_cart())
+        recovered.open_cart("cart-0").add_product("C", 1)
+        recovered.close()
+        self.assertEqual({"A": 1, "B": 2, "C": 1}, CartJournal(self.directory.name, self.store).carts["cart-0"].get_cart())
+
+    def test_recover_from_snapshot(self):
+        with CartJournal(self.directory.name, self.store, snapshot_every=25) as journal:
+            self.fill_carts(journal)
+        self.assertEqual(1, len(journal.segments()))
+        with open(journal.segment_path(journal.segment), "r") as f:
+            self.assertEqual(42 % 25, len(f.readlines()))
+        self.assert_recovered(CartJournal(self.directory.name, self.store))
+
+        with CartJournal(self.directory.name, self.store) as journal:
+            journal.open_cart("cart-3").remove_product("A")
+            journal.snapshot()
+        journal = CartJournal(self.directory.name, self.store)
+        self.assertEqual(19, len(journal.carts))
+        self.assertRaisesRegex(ValueError, "The batch size should be a positive integer.", CartJournal, self.directory.name, self.store, 0)
+
+    def test_snapshot_syncs_directory(self):
+        with CartJournal(self.directory.name, self.store) as journal:
+            journal.open_cart("cart-0").add_product("A", 1)
+            with patch("cart_journal.fsync_directory", wraps=cart_journal.fsync_directory) as fsync_directory:
+                journal.snapshot()
+        self.assertEqual(2, fsync_directory.call_count)
+        fsync_directory.assert_called_with(self.directory.name)
+
+    def test_decimal_subtotals(self):
+        store = Store()
+        store.add_product(Product("A", Decimal("0.50"), 3, Decimal("1.40")))
+        store.add_product(Product("B", Decimal("0.35")))
+        journals = [
+            lambda: CartJournal(os.path.join(self.directory.name, "files"), store, snapshot_every=3),
+            lambda: SqliteCartJournal(os.path.join(self.directory.name, "carts.sqlite"), store, snapshot_every=3),
+        ]
+        for open_journal in journals:
+            with open_journal() as journal:
+                cart = journal.open_cart("cart-0")
+                for _ in range(4):
+                    cart.add_product("A", 1)
+                cart.add_product("B", 1)
+            recovered = open_journal()
+            self.assertEqual(Decimal("2.25"), recovered.carts["cart-0"].get_subtotal())
+            recovered.open_cart("cart-0").add_product("B", 1)
+            self.assertEqual(Decimal("2.60"), recovered.carts["cart-0"].get_subtotal())
+            recovered.close()
+
+    def test_failed_snapshot(self):
+        with CartJournal(self.directory.name, self.store, snapshot_every=2) as journal:
+            journal.open_cart("cart-0").add_product("A", 1)
+            with patch("cart_journal.json.dump", side_effect=OSError("No space left on device")):
+                self.assertRaisesRegex(OSError, "No space left on device", journal.open_cart("cart-0").add_product, "B", 1)
+            self.assertEqual(["wal-00000000.log"], os.listdir(self.directory.name))
+            journal.open_cart("cart-0").add_product("C", 1)
+            self.assertEqual(1, journal.segment)
+        self.assertEqual({"A": 1, "B": 1, "C": 1}, CartJournal(self.directory.name, self.store).carts["cart-0"].get_cart())
+
+    def test_cart_ids(self):
+        with CartJournal(self.directory.name, self.store) as journal:
+            journal.open_cart(7).add_product("A", 1)
+            journal.open_cart("7").add_product("B", 1)
+            for cart_id in [("customer", 1), 1.5, None, True]:
+                self.assertRaisesRegex(TypeError, "The cart id should be a string or an integer.", journal.open_cart, cart_id)
+            journal.snapshot()
+            journal.open_cart(7).add_product("C", 1)
+        carts = CartJournal(self.directory.name, self.store).carts
+        self.assertEqual({"A": 1, "C": 1}, carts[7].get_cart())
+        self.assertEqual({"B": 1}, carts["7"].get_cart())
+
+    def test_sqlite_journal(self):
+        database = os.path.join(self.directory.name, "carts.sqlite")
+        journal = SqliteCartJournal(database, self.store, batch_size=1000)
+        self.fill_carts(journal)
+        journal.close()
+        self.assert_recovered(SqliteCartJournal(database, self.store))
+
+        with SqliteCartJournal(database, self.store, snapshot_every=10) as journal:
+            journal.open_cart("cart-0").add_product("D", 1)
+            journal.snapshot()
+            journal.open_cart("cart-0").add_product("D", 1)
+        journal = SqliteCartJournal(database, self.store)
+        self.assert_recovered(journal)
+        self.assertEqual({"A": 1, "B": 2, "D": 2}, journal.carts["cart-0"].get_cart())
+        self.assertEqual(1, journal.connection.execute("SELECT COUNT(*) FROM changes").fetchone()[0])
+        journal.close()
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = self.directory.name
+        with open(os.path.join(self.path, "order-1.json"), "w") as f:
+            json.dump(TestCheckoutSystem.data_with_invalid_input, f)
+        with gzip.open(os.path.join(self.path, "order-2.ndjson.gz"), "wt") as f:
+            f.write('{"code": "A", "quantity": 3}\n{"code": "E", "quantity": 1}\n')
+        with open(os.path.join(self.path, "order-3.json"), "w") as f:
+            f.write("[{")
+        with open(os.path.join(self.path, "notes.txt"), "w") as f:
+            f.write("Not an order file")
+
+    def test_find_order_files(self):
+        files = [os.path.join(self.path, name) for name in ("order-1.json", "order-2.ndjson.gz", "order-3.json")]
+        self.assertEqual(files, find_order_files([self.path]))
+        self.assertEqual(files[::2], find_order_files([os.path.join(self.path, "*.json"), files[0]]))
+
+    def test_run_batch(self):
+        for processes in (1, 2):
+            output, stats = StringIO(), StringIO()
+            self.assertEqual(1, run_batch([self.path], "catalogue.json", processes, output, stats))
+            results = {os.path.basename(result["file"]): result for result in map(json.loads, output.getvalue().splitlines())}
+            self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706, 4), (results["order-1.json"]["cart"], results["order-1.json"]["subtotal"], len(results["order-1.json"]["errors"])))
+            self.assertEqual(({'A': 3}, 140, ["An error occurred: We don't have E in our store."]), (results["order-2.ndjson.gz"]["cart"], results["order-2.ndjson.gz"]["subtotal"], results["order-2.ndjson.gz"]["errors"]))
+            self.assertIn("is not a valid JSON file.", results["order-3.json"]["error"])
+            self.assertIn("Checked out 3 files (1 failed) with 12 order items (5 invalid)", stats.getvalue())
+
+
+class CheckoutServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.server = CheckoutServer(("127.0.0.1", 0), CheckoutService(self.store))
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.connection = http.client.HTTPConnection(*self.server.server_address)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None):
+        self.connection.request(method, path, body)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_endpoints(self):
+        # All the requests reuse the same connection
+        self.assertEqual((201, {"cart_id": "1"}), self.request("POST", "/carts"))
+        self.assertEqual(
+            (200, {"cart": {"A": 3}, "subtotal": 140, "errors": []}),
+            self.request("POST", "/carts/1/items", json.dumps({"code": "A", "quantity": 3})),
+        )
+        status, content = self.request("POST", "/carts/1/items", json.dumps(TestCheckoutSystem.data_with_invalid_input))
+        self.assertEqual((200, {'A': 10, 'B': 5, 'C': 5, 'D': 8}, 846), (status, content["cart"], content["subtotal"]))
+        self.assertEqual(4, len(content["errors"]))
+        self.assertEqual((200, {"cart": {'A': 10, 'B': 5, 'C': 5, 'D': 8}, "subtotal": 846}), self.request("GET", "/carts/1"))
+        self.assertEqual((200, {"carts": 1, "requests": 2, "take_order_calls": 2}), self.request("GET", "/stats"))
+
+        self.assertEqual((404, {"error": "There is no cart 2."}), self.request("GET", "/carts/2"))
+        self.assertEqual((404, {"error": "There is no cart 2."}), self.request("POST", "/carts/2/items", "[]"))
+        self.assertEqual((404, {"error": "There is no resource at /shelf."}), self.request("GET", "/shelf"))
+        self.assertEqual((400, {"error": "The body is not valid JSON."}), self.request("POST", "/carts/1/items", "{"))
+
+    def test_invalid_content_length(self):
+        for length in ("abc", "-1"):
+            connection = http.client.HTTPConnection(*self.server.server_address)
+            connection.putrequest("POST", "/carts")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            self.assertEqual((400, {"error": "The Content-Length header is not a valid length."}), (response.status, json.loads(response.read())))
+            connection.close()
+        self.assertEqual((201, {"cart_id": "1"}), self.request("POST", "/carts"))
+
+    def test_failed_batch(self):
+        self.request("POST", "/carts")
+        with patch.object(Cart, "add_valid_product", side_effect=RuntimeError("The cart is broken.")):
+            self.assertEqual(
+                (500, {"error": "The order items could not be taken: The cart is broken."}),
+                self.request("POST", "/carts/1/items", json.dumps({"code": "A", "quantity": 3})),
+            )
+        self.assertEqual(200, self.request("POST", "/carts/1/items", json.dumps({"code": "A", "quantity": 3}))[0])
+
+    def test_load_generator(self):
+        results = run_load(*self.server.server_address, list(self.store.get_shelf()), client_count=4, request_count=10, cart_count=2)
+        self.assertEqual((40, 0), (results["requests"], results["failures"]))
+        self.assertLessEqual(results["take_order_calls"], 40)
+        self.assertLessEqual(results["p50_ms"], results["p99_ms"])
+
+
+class CartSessionTestCase(unittest.TestCase):
+    def test_concurrent_requests_are_coalesced(self):
+        store = Store()
+        store.add_product(Product("A", 50, 3, 140))
+        session = CartSession(Cart(store))
+        requests = []
+        with session.cart_lock:
+            threads = [
+                Thread(target=lambda order_items=order_items: requests.append(session.take_order_items(order_items)))
+                for order_items in ([{"code": "A", "quantity": 1}], [{"code": "A", "quantity": 2}], [{"code": "E", "quantity": 1}])
+            ]
+            for thread in threads:
+                thread.start()
+            while len(session.pending) < 3:
+                time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+        self.assertEqual((1, 3), (session.batches, session.requests))
+        self.assertEqual([({'A': 3}, 140)] * 3, [request.result for request in requests])
+        self.assertEqual([[], [], ["An error occurred: We don't have E in our store."]], sorted(request.errors for request in requests))
+
+    def test_order_items_are_validated_once(self):
+        store = Store()
+        store.add_product(Product("A", 50, 3, 140))
+        session = CartSession(Cart(store))
+        with patch.object(Cart, "check_order_item") as mock_check_order_item, patch.object(Cart, "validate_order_line") as mock_validate_order_line:
+            request = session.take_order_items([{"code": "A", "quantity": 2}, {"code": "A", "quantity": 2}, {"code": "A", "quantity": 0}])
+        mock_check_order_item.assert_not_called()
+        mock_validate_order_line.assert_not_called()
+        self.assertEqual(({"A": 4}, 190), request.result)
+
+    def test_failure_is_reported_to_every_request(self):
+        store = Store()
+        store.add_product(Product("A", 50, 3, 140))
+        session = CartSession(Cart(store))
+        with patch.object(Cart, "add_valid_product", side_effect=RuntimeError("The cart is broken.")):
+            request = session.take_order_items([{"code": "A", "quantity": 1}])
+        self.assertTrue(request.done)
+        self.assertIsNone(request.result)
+        self.assertEqual("The cart is broken.", str(request.failure))
+        self.assertEqual(({"A": 1}, 50), session.take_order_items([{"code": "A", "quantity": 1}]).result)
+
+
+class UnhashableCode(str):
+    """ A code that cannot be looked up in the store, to make an order fail in a worker. """
+    def __hash__(self):
+        raise ValueError("The code is unhashable.")
+
+
+class ShardingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+
+    def test_hash_ring(self):
+        ring = HashRing(["shard-0", "shard-1", "shard-2"])
+        cart_ids = [f"customer-{index}" for index in range(3000)]
+        owners = {cart_id: ring.node_for(cart_id) for cart_id in cart_ids}
+        for node in ("shard-0", "shard-1", "shard-2"):
+            self.assertGreater(list(owners.values()).count(node), 600)
+
+        # Adding a node only moves carts to the new node
+        ring.add_node("shard-3")
+        moved = [cart_id for cart_id in cart_ids if ring.node_for(cart_id) != owners[cart_id]]
+        self.assertTrue(all(ring.node_for(cart_id) == "shard-3" for cart_id in moved))
+        self.assertLess(len(moved), 1200)
+        ring.remove_node("shard-3")
+        self.assertEqual(owners, {cart_id: ring.node_for(cart_id) for cart_id in cart_ids})
+
+        self.assertRaisesRegex(ValueError, "The node shard-0 is already on the ring.", ring.add_node, "shard-0")
+        self.assertRaisesRegex(ValueError, "The node shard-3 is not on the ring.", ring.remove_node, "shard-3")
+        self.assertRaisesRegex(ValueError, "There are no nodes on the ring.", HashRing().node_for, "customer-1")
+
+    def test_router(self):
+        with ShardRouter(self.store, 2) as router:
+            errors = router.take_order("customer-1", TestCheckoutSystem.data_with_invalid_input)
+            self.assertEqual(4, len(errors))
+            router.add_product("customer-2", "A", 3)
+            self.assertRaisesRegex(ValueError, "We don't have E in our store.", router.add_product, "customer-2", "E", 1)
+            self.assertRaisesRegex(TypeError, "The quantity of A should be a non-negative integer.", router.add_product, "customer-2", "A", -1)
+            errors = router.take_orders(
+                [(f"customer-{index}", [{"code": "B", "quantity": 2}]) for index in range(3, 40)] + [("customer-3", [{"code": "E", "quantity": 1}])],
+                max_pending=4,
+            )
+            self.assertEqual({"customer-3": ["An error occurred: We don't have E in our store."]}, errors)
+            self.assertEqual(39, sum(router.cart_counts().values()))
+
+            # Rebalancing keeps the content and the subtotal of the carts
+            moved = router.add_shard()
+            self.assertEqual(moved, router.cart_counts()["shard-2"])
+            self.assertGreater(moved, 0)
+            self.assertEqual(39, sum(router.cart_counts().values()))
+            self.assertEqual(({'A': 7, 'B': 5, 'C': 5, 'D': 8}, 706), (router.get_cart("customer-1"), router.get_subtotal("customer-1")))
+            self.assertEqual(({'A': 3}, 140), (router.get_cart("customer-2"), router.get_subtotal("customer-2")))
+            for index in range(3, 40):
+                self.assertEqual(60, router.get_subtotal(f"customer-{index}"))
+            self.assertEqual(({}, 0), (router.get_cart("customer-40"), router.get_subtotal("customer-40")))
+
+        self.assertRaisesRegex(ValueError, "The number of shards should be a positive integer.", ShardRouter, self.store, 0)
+
+    def test_large_answers(self):
+        # The answers are larger than the buffer of the pipe, so the router must receive them while it sends
+        with ShardRouter(self.store, 1) as router:
+            errors = router.take_orders([(f"customer-{index}", [{"code": "E", "quantity": 1}] * 20000) for index in range(20)])
+            self.assertEqual(20, len(errors))
+            self.assertTrue(all(len(messages) == 20000 for messages in errors.values()))
+
+            # Any error of the worker is sent back, and the worker keeps serving
+            shard = router.shards["shard-0"]
+            self.assertRaises(KeyError, shard.call, "unknown", "customer-1")
+            self.assertEqual({}, router.get_cart("customer-1"))
+
+    def test_failed_order(self):
+        # Every order is sent to the same shard, the fifth one fails in the worker
+        orders = [(f"customer-{index}", [{"code": "A", "quantity": 1}]) for index in range(200)]
+        orders[4] = ("customer-4", [{"code": UnhashableCode("A"), "quantity": 1}])
+        with ShardRouter(self.store, 1) as router:
+            failures = []
+            thread = Thread(target=lambda: failures.append(self.assertRaisesRegex(ValueError, "The code is unhashable.", router.take_orders, orders, 8)))
+            thread.start()
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(1, len(failures))
+            cart_ids = router.shards["shard-0"].call("cart_ids")
+            self.assertIn("customer-3", cart_ids)
+            self.assertNotIn("customer-199", cart_ids)
+            # The worker keeps serving after the failure
+            self.assertEqual({}, router.take_orders([("customer-0", [{"code": "B", "quantity": 1}])]))
+            self.assertEqual({"A": 1, "B": 1}, router.get_cart("customer-0"))
+
+    def test_sharding_benchmark(self):
+        results = run_sharding_benchmark(max_shards=2, sku_count=100, cart_count=10, order_count=20, order_size=5)
+        self.assertEqual([1, 2], [result["shards"] for result in results])
+        self.assertEqual([10, 10], [sum(result["carts_per_shard"]) for result in results])
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            store.add_product(product)
+        self.analytics = CartAnalytics(store)
+        self.analytics.add_carts([
+            ("customer-1", {'A': 7, 'B': 5, 'C': 5, 'D': 8}),
+            ("customer-2", {'A': 2, 'B': 2}),
+            ("customer-3", {'A': 3, 'C': 0}),
+        ])
+
+    def check_columns_and_aggregates(self):
+        columns = self.analytics.columns()
+        self.assertEqual(["customer-1"] * 4 + ["customer-2"] * 2 + ["customer-3"] * 2, list(columns["cart_id"]))
+        self.assertEqual(["A", "B", "C", "D", "A", "B", "A", "C"], list(columns["code"]))
+        self.assertEqual([330, 155, 125, 96, 100, 60, 140, 0], [int(price) for price in columns["line_price"]])
+        self.assertEqual([20, 20, 0, 0, 0, 10, 10, 0], [int(savings) for savings in columns["savings"]])
+        self.assertEqual([2, 2, 0, 0, 0, 1, 1, 0], [int(bundles) for bundles in columns["bundles"]])
+
+        by_code = self.analytics.aggregate("code")
+        self.assertEqual(["A", "B", "C", "D"], by_code["code"])
+        self.assertEqual([3, 2, 2, 1], [int(lines) for lines in by_code["lines"]])
+        self.assertEqual([12, 7, 5, 8], [int(units) for units in by_code["units"]])
+        self.assertEqual([570, 215, 125, 96], [int(revenue) for revenue in by_code["revenue"]])
+        self.assertEqual([30, 30, 0, 0], [int(savings) for savings in by_code["savings"]])
+        self.assertEqual([2, 2, 0, 0], [int(hits) for hits in by_code["bundle_hits"]])
+        self.assertAlmostEqual(2 / 3, by_code["bundle_hit_rate"][0])
+
+        by_cart = self.analytics.aggregate("cart_id")
+        self.assertEqual([706, 160, 140], [int(revenue) for revenue in by_cart["revenue"]])
+        self.assertRaisesRegex(ValueError, "The lines can only be grouped by code or by cart_id.", self.analytics.aggregate, "quantity")
+
+    def test_columns_and_aggregates(self):
+        with patch("analytics.np", None):
+            self.assertFalse(self.analytics.is_vectorized())
+            self.check_columns_and_aggregates()
+
+    @unittest.skipUnless(analytics.np, "NumPy is not installed")
+    def test_columns_and_aggregates_vectorized(self):
+        self.assertTrue(self.analytics.is_vectorized())
+        self.assertIsInstance(self.analytics.columns()["line_price"], analytics.np.ndarray)
+        self.check_columns_and_aggregates()
+
+    def test_decimal_prices(self):
+        store = Store()
+        store.add_product(Product("A", Decimal("0.50"), 3, Decimal("1.40")))
+        store.add_product(Product("C", Decimal("0.25")))
+        decimal_analytics = CartAnalytics(store)
+        decimal_analytics.add_carts([("customer-1", {"A": 4, "C": 1}), ("customer-2", {"A": 2})])
+        self.assertIsNone(decimal_analytics.price_typecode())
+        self.assertFalse(decimal_analytics.is_vectorized())
+        self.assertEqual([Decimal("1.90"), Decimal("0.25"), Decimal("1.00")], decimal_analytics.columns()["line_price"])
+        by_code = decimal_analytics.aggregate("code")
+        self.assertEqual([Decimal("2.90"), Decimal("0.25")], by_code["revenue"])
+        self.assertEqual([Decimal("0.10"), Decimal("0.00")], by_code["savings"])
+
+        output = StringIO()
+        decimal_analytics.write_csv(output)
+        self.assertEqual("customer-1,A,4,1.90,0.10,1", output.getvalue().splitlines()[1])
+        with tempfile.TemporaryDirectory() as directory:
+            message = "The line prices can only be written as binary columns if every price is an int or a float."
+            self.assertRaisesRegex(ValueError, message, decimal_analytics.write_columns, os.path.join(directory, "lines"))
+            self.assertFalse(os.path.exists(os.path.join(directory, "lines")))
+
+    @unittest.skipUnless(analytics.np, "NumPy is not installed")
+    def test_group_sum(self):
+        np = analytics.np
+        rows = np.array([0, 1, 0])
+        self.assertEqual([4, 2], analytics.group_sum(rows, np.array([1, 2, 3]), 2).tolist())
+        self.assertEqual([Decimal("0.40"), Decimal("0.20")], analytics.group_sum(rows, np.array([Decimal("0.10"), Decimal("0.20"), Decimal("0.30")], dtype=object), 2).tolist())
+        self.assertEqual([0.5, 0.25], analytics.group_sum(rows, np.array([0.25, 0.25, 0.25]), 2).tolist())
+
+    def test_unknown_code(self):
+        self.assertRaisesRegex(ValueError, "We don't have E in our store.", self.analytics.add_cart, "customer-4", {"E": 1})
+
+    def test_export(self):
+        output = StringIO()
+        self.analytics.write_csv(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(["cart_id,code,quantity,line_price,savings,bundles", "customer-1,A,7,330,20,2"], lines[:2])
+        self.assertEqual(9, len(lines))
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.analytics.write_columns(directory)
+            columns = read_columns(directory)
+        self.assertEqual(list(self.analytics.columns()["cart_id"]), columns["cart_id"])
+        self.assertEqual(["A", "B", "C", "D", "A", "B", "A", "C"], columns["code"])
+        self.assertEqual([7, 5, 5, 8, 2, 2, 3, 0], list(columns["quantity"]))
+        self.assertEqual([330, 155, 125, 96, 100, 60, 140, 0], list(columns["line_price"]))
+        self.assertEqual("q", columns["savings"].typecode)
+
+        self.analytics.store.add_product(Product("E", 10.5))
+        self.analytics.add_cart("customer-4", {"E": 2})
+        self.assertEqual("d", self.analytics.price_typecode())
+        with tempfile.TemporaryDirectory() as directory:
+            self.analytics.write_columns(directory)
+            columns = read_columns(directory)
+        self.assertEqual("d", columns["line_price"].typecode)
+        self.assertEqual(21.0, columns["line_price"][-1])
+
+    def test_iter_batch_carts(self):
+        results = StringIO(
+            '{"file": "a.json", "cart": {"A": 3}, "subtotal": 140, "errors": [], "order_items": 1}\n'
+            '{"file": "b.json", "error": "The file b.json is not a valid JSON file.", "order_items": 0}\n'
+        )
+        self.assertEqual([("a.json", {"A": 3})], list(iter_batch_carts(results)))
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_main_imports_lazily(self):
+        heavy_modules = ["argparse", "json", "numbers", "typing", "product", "cart", "store", "order_reader"]
+        output = subprocess.run(
+            [sys.executable, "-c", "import sys; before = set(sys.modules); import main; print(sorted(set(sys.modules) - before))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout
+        imported = ast.literal_eval(output)
+        self.assertIn("main", imported)
+        for module in heavy_modules:
+            self.assertNotIn(module, imported)
+
+    def test_product_annotations(self):
+        self.assertEqual(
+            {"unit_price": Number, "special_quantity": int, "special_price": Number},
+            typing.get_type_hints(Product.__init__),
+        )
+        self.assertEqual(Number, typing.get_type_hints(Product.calculate_price)["return"])
+
+    def test_startup_benchmark(self):
+        self.assertEqual([("numbers", 375, 375), ("  json", 12, 400)], parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       375 |        375 | numbers\n"
+            "import time:        12 |        400 |   json\n"
+        ))
+        results = run_startup_benchmark(runs=1)
+        self.assertEqual(["interpreter only", "eager imports", "main.py", "main.py --stream"], [result["name"] for result in results])
+        names = {result["name"]: {module.strip() for module, _, _ in result["slowest_imports"]} for result in results}
+        self.assertIn("argparse", names["eager imports"])
+        self.assertNotIn("argparse", names["main.py"])
+        self.assertNotIn("order_reader", names["main.py"])
+        self.assertIn("order_reader", names["main.py --stream"])
+        self.assertIn("cart", names["main.py"])
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = Store()
+        for product in [Product("A", 50, 3, 140), Product("B", 35, 2, 60), Product("C", 25), Product("D", 12)]:
+            self.store.add_product(product)
+        self.log = "".join(json.dumps(record) + "\n" for record in [
+            {"cart_id": "customer-1", "order": TestCheckoutSystem.data_with_invalid_input[:5]},
+            {"cart_id": "customer-2", "order": [{"code": "A", "quantity": 3}]},
+            {"cart_id": "customer-1", "order": TestCheckoutSystem.data_with_invalid_input[5:]},
+        ])
+
+    def test_replay_and_compare(self):
+        replayed = replay.replay(self.store, iter_order_log(StringIO(self.log)))
+        self.assertEqual((3, 11, 3), (replayed["orders"], replayed["order_items"], len(replayed["latencies"])))
+        results = final_results(replayed)
+        self.assertEqual({"cart": {'A': 7, 'B': 5, 'C': 5, 'D': 8}, "subtotal": 706}, {key: results["customer-1"][key] for key in ("cart", "subtotal")})
+        self.assertEqual(4, len(results["customer-1"]["errors"]))
+        self.assertEqual({"cart": {'A': 3}, "subtotal": 140, "errors": []}, results["customer-2"])
+
+        golden_file = StringIO()
+        write_golden(results, golden_file)
+        golden = read_golden(StringIO(golden_file.getvalue()))
+        self.assertEqual(results, golden)
+
+        # The same log at a fixed rate gives the same results
+        paced = replay.replay(self.store, iter_order_log(StringIO(self.log)), rate=1000)
+        self.assertEqual([], compare_results(final_results(paced), golden))
+        self.assertGreaterEqual(paced["seconds"], 0.002)
+
+        # A build that prices differently diverges
+        class DiscountCart(Cart):
+            def update_subtotal(self, price):
+                self.subtotal += price - 1
+        changed = final_results(replay.replay(self.store, iter_order_log(StringIO(self.log)), cart_class=DiscountCart))
+        del golden["customer-2"]
+        self.assertEqual([
+            Divergence("customer-1", "subtotal", 706, 700),
+            Divergence("customer-2", "unexpected", None, {"cart": {'A': 3}, "subtotal": 139, "errors": []}),
+        ], compare_results(changed, golden))
+
+        report = replay.make_report(replayed, [])
+        self.assertEqual((2, 3, []), (report["carts"], report["orders"], report["divergences"]))
+        self.assertRaisesRegex(ValueError, "The rate should be a positive number of orders per second.", replay.replay, self.store, [], 0)
+
+    def test_decimal_subtotals(self):
+        store = CentsStore()
+        for product in [Product("A", Decimal("0.50"), 3, Decimal("1.40")), Product("B", Decimal("0.35"), 2, Decimal("0.60")), Product("C", Decimal("0.25")), Product("D", Decimal("0.12"))]:
+            store.add_product(product)
+        results = final_results(replay.replay(store, iter_order_log(StringIO(self.log)), cart_class=CentsCart))
+        self.assertEqual(Decimal("7.06"), results["customer-1"]["subtotal"])
+        golden_file = StringIO()
+        write_golden(results, golden_file)
+        self.assertIn('"subtotal": "7.06"', golden_file.getvalue())
+        golden = read_golden(StringIO(golden_file.getvalue()))
+        self.assertEqual([], compare_results(results, golden))
+
+        golden["customer-1"]["subtotal"] = "7.05"
+        divergences = compare_results(results, golden)
+        self.assertEqual([Divergence("customer-1", "subtotal", "7.05", Decimal("7.06"))], divergences)
+        report = replay.make_report({"carts": {}, "orders": 0, "order_items": 0, "seconds": 0, "latencies": []}, divergences)
+        self.assertIn('"actual": "7.06"', json.dumps(report, default=replay.json_default))
+
+    def test_invalid_log(self):
+        self.assertRaisesRegex(ValueError, "Line 2 of the order log is not valid JSON.", list, iter_order_log(StringIO('{"cart_id": 1, "order": []}\n{')))
+        self.assertRaisesRegex(ValueError, "Line 1 of the order log should have a cart_id and an order.", list, iter_order_log(StringIO('{"order": []}\n')))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, "orders.jsonl.gz")
+            with gzip.open(log_file, "wt") as f:
+                f.write(self.log)
+            golden_file = os.path.join(directory, "golden.jsonl")
+            with patch('sys.stdout', new_callable=StringIO):
+                self.assertEqual(0, replay.main([log_file, "--write-golden", golden_file]))
+                self.assertEqual(0, replay.main([log_file, "--golden", golden_file]))
+            with open(golden_file, "r") as f:
+                lines = f.readlines()
+            with open(golden_file, "w") as f:
+                f.write(lines[0].replace('"subtotal": 706', '"subtotal": 705'))
+            with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+                self.assertEqual(1, replay.main([log_file, "--golden", golden_file]))
+        self.assertIn(
+            "2 divergences from the golden output:\n"
+            "  cart customer-1: subtotal expected 705, got 706\n"
+            "  cart customer-2: replayed but not in the golden output\n",
+            mock_stdout.getvalue(),
+        )
+
+
+class ValidationTestCase(unittest.TestCase):
+    def test_partition_order(self):
+        shelf = {"A": None, "B": None}
+        data = TestCheckoutSystem.data_with_invalid_input + [{"code": "E", "quantity": 1}, {"code": None, "quantity": 1}, {"code": ["A"], "quantity": 1}, {"code": "B", "quantity": 0}]
+        valid, invalid = partition_order(data, shelf)
+        self.assertEqual([("A", 5), ("B", 3), ("B", 2), ("A", 2)], valid)
+        self.assertEqual([0, 1, 2, 3, 6, 9, 10, 11, 12], [item.index for item in invalid])
+        self.assertEqual([
+            validation.MISSING_QUANTITY, validation.MISSING_CODE, validation.INVALID_QUANTITY, validation.NOT_A_DICTIONARY,
+            validation.UNKNOWN_PRODUCT, validation.UNKNOWN_PRODUCT, validation.UNKNOWN_PRODUCT, validation.INVALID_PRODUCT, validation.INVALID_PRODUCT,
+        ], [item.error_code for item in invalid])
+        self.assertEqual("An error occurred: unhashable type: 'list'", invalid[-1].message)
+
+    def test_validation_benchmark(self):
+        check_order_item = Cart.check_order_item
+        results = run_validation_benchmark(sku_count=20, order_size=5, order_count=3)
+        self.assertEqual(["take_order_dirty", "take_order_dirty_exceptions"], [result["name"] for result in results])
+        self.assertIs(check_order_item, Cart.check_order_item)
+
+    def test_trusted_pricing(self):
+        product_A = Product("A", 50, 3, 140)
+        self.assertEqual(190, product_A.calculate_price(4, trusted=True))
+        self.assertEqual(50, product_A.price_difference(3, 4, trusted=True))
+        self.assertRaisesRegex(ValueError, "The quantity of the product should be a non-negative integer.", product_A.price_difference, 3, -4)
+
+
 class TestCheckoutSystem(unittest.TestCase):
     @patch('builtins.input', return_value='')
     @patch('builtins.open', new_callable=unittest.mock.mock_open, read_data='[{"code":"A","quantity":3}, {"code":"B","quantity":3}, {"code":"C","quantity":1}, {"code":"D","quantity":2}]')
@@ -290,5 +1816,19 @@ class TestCheckoutSystem(unittest.TestCase):
         self.assertEqual(mock_stdout.getvalue(), print_msg)
 
 
+    @patch('builtins.input', return_value='')
+    @patch('builtins.open', new_callable=unittest.mock.mock_open, read_data='{"code":"A","quantity":3}\n{"code":"E","quantity":1}\n{"code":"B","quantity":3}\n')
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_main_stream(self, mock_stdout, mock_open, mock_input):
+        main(stream=True)
+        mock_open.assert_called_once_with('data-set-1.json', 'r')
+        print_msg = (
+            "An error occurred: We don't have E in our store.\n\n"
+            "Shopping cart content: {'A': 3, 'B': 3}\n\n"
+            "Subtotal: 235\n"
+        )
+        self.assertEqual(mock_stdout.getvalue(), print_msg)
+
+
 if __name__ == '__main__':
     unittest.main()    
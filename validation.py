@@ -0,0 +1,86 @@
+"""
+Single-pass validation of order items, without raising exceptions.
+
+Each invalid order item gets a structured error code together with the same message
+that `Cart.take_order` prints for it, so that the valid order items can be priced
+by the trusted paths, which do not check them again.
+"""
+from collections import namedtuple
+
+NOT_A_DICTIONARY = "not_a_dictionary"
+MISSING_CODE = "missing_code"
+MISSING_QUANTITY = "missing_quantity"
+INVALID_PRODUCT = "invalid_product"
+INVALID_QUANTITY = "invalid_quantity"
+UNKNOWN_PRODUCT = "unknown_product"
+
+InvalidOrderItem = namedtuple("InvalidOrderItem", ["index", "order_item", "error_code", "message"])
+InvalidOrderItem.__doc__ = """
+An invalid order item.
+
+Attributes:
+    index: The position of the order item in the order.
+    order_item: The order item.
+    error_code: One of the error codes of this module, such as `UNKNOWN_PRODUCT`.
+    message: The error message printed by `Cart.take_order` for the order item.
+"""
+
+
+def validate_order_item(order_item, shelf):
+    """
+    Validates an `order_item` against the products on a `shelf`.
+
+    Returns:
+        tuple: The (product, quantity, error code, message) of the order item.
+            If the order item is valid, the error code and the message are None.
+            Otherwise the product and the quantity are None.
+
+    >>> validate_order_item({"code": "A", "quantity": 3}, {"A": None})
+    ('A', 3, None, None)
+    >>> validate_order_item({"code": "A", "quantity": -3}, {"A": None})
+    (None, None, 'invalid_quantity', 'An error occurred: The quantity of A should be a non-negative integer.')
+    """
+    if not isinstance(order_item, dict):
+        return None, None, NOT_A_DICTIONARY, f"The order item {order_item} is not a dictionary."
+    if "code" not in order_item:
+        return None, None, MISSING_CODE, f"An error occurred: Cannot retrieve 'code' from the order item: {order_item}."
+    if "quantity" not in order_item:
+        return None, None, MISSING_QUANTITY, f"An error occurred: Cannot retrieve 'quantity' from the order item: {order_item}."
+    product = order_item["code"]
+    quantity = order_item["quantity"]
+    if not product:
+        return None, None, INVALID_PRODUCT, f"An error occurred: Invalid product {product}."
+    if not isinstance(quantity, int) or quantity < 0:
+        return None, None, INVALID_QUANTITY, f"An error occurred: The quantity of {product} should be a non-negative integer."
+    try:
+        on_shelf = product in shelf
+    except TypeError as e:
+        return None, None, INVALID_PRODUCT, f"An error occurred: {e}"
+    if not on_shelf:
+        return None, None, UNKNOWN_PRODUCT, f"An error occurred: We don't have {product} in our store."
+    return str(product), quantity, None, None
+
+
+def partition_order(data, shelf):
+    """
+    Sorts the order items of the `data` into valid and invalid order items in a single pass.
+
+    Returns:
+        tuple: A list of the (product, quantity) of the valid order items with a non-zero quantity,
+            and a list of `InvalidOrderItem`s.
+
+    >>> valid, invalid = partition_order([{"code": "A", "quantity": 3}, {"code": "E", "quantity": 1}], {"A": None})
+    >>> valid
+    [('A', 3)]
+    >>> [item.error_code for item in invalid]
+    ['unknown_product']
+    """
+    valid = []
+    invalid = []
+    for index, order_item in enumerate(data):
+        product, quantity, error_code, message = validate_order_item(order_item, shelf)
+        if error_code:
+            invalid.append(InvalidOrderItem(index, order_item, error_code, message))
+        elif quantity:
+            valid.append((product, quantity))
+    return valid, invalid
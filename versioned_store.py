@@ -0,0 +1,228 @@
+"""
+Versioned, immutable catalogue snapshots that can be reloaded without restarting.
+
+A reload creates a new `CatalogueSnapshot` holding only the changed products on top of the previous shelf,
+and switches the current snapshot of the `VersionedStore` to it in a single assignment.
+Each cart created by `VersionedStore.new_cart` keeps the snapshot it was created with, so a reload never changes
+the prices of a cart being priced. A `Cart(store)` created directly on the `VersionedStore` is not pinned:
+it prices against whichever snapshot is current at each call.
+
+A snapshot is dropped from `VersionedStore.live_versions` when no cart refers to it anymore. Its layer of products
+is still referenced by the layers of the newer snapshots, and is only freed when the layers are merged,
+once there are more than `max_depth` of them.
+"""
+from collections.abc import Mapping
+from threading import Lock
+from weakref import WeakValueDictionary
+from cart import Cart
+from product import Product
+from store import Store
+
+
+class SnapshotShelf(Mapping):
+    """
+    A read-only shelf made of a layer of changed and removed products on top of a parent shelf.
+
+    Attributes:
+        changes: A dictionary where the keys are item codes and the values are the added or changed products.
+        removed: The item codes of the products removed in this layer.
+        parent: The shelf below this layer, or None.
+        depth: The number of layers, including this one.
+    """
+    def __init__(self, changes: dict, removed=frozenset(), parent: "SnapshotShelf"=None):
+        self.changes = changes
+        self.removed = frozenset(removed)
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+    def __getitem__(self, item_code):
+        layer = self
+        while layer is not None:
+            if item_code in layer.changes:
+                return layer.changes[item_code]
+            if item_code in layer.removed:
+                break
+            layer = layer.parent
+        raise KeyError(item_code)
+
+    def __contains__(self, item_code):
+        layer = self
+        while layer is not None:
+            if item_code in layer.changes:
+                return True
+            if item_code in layer.removed:
+                return False
+            layer = layer.parent
+        return False
+
+    def flatten(self) -> dict:
+        """ Returns all the products of the shelf as a new dictionary, merging the layers from the bottom up. """
+        layers = []
+        layer = self
+        while layer is not None:
+            layers.append(layer)
+            layer = layer.parent
+        products = {}
+        for layer in reversed(layers):
+            for item_code in layer.removed:
+                products.pop(item_code, None)
+            products.update(layer.changes)
+        return products
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def __len__(self):
+        return len(self.flatten())
+
+
+class CatalogueSnapshot(Store):
+    """
+    An immutable version of the catalogue of a `VersionedStore`.
+
+    Attributes:
+        version: The version number of the snapshot.
+        shelf (SnapshotShelf): The shelf of the snapshot, where the keys are product names and the values are Product instances.
+    """
+
+    def __init__(self, version: int, shelf: SnapshotShelf):
+        """ Initialize a snapshot of the catalogue. """
+        self.version = version
+        self.shelf = shelf
+
+    def add_product(self, product: Product):
+        """
+        Raises:
+            ValueError: Products cannot be added to a catalogue snapshot, use `VersionedStore.reload` instead.
+        """
+        raise ValueError("Cannot add products to a catalogue snapshot.")
+
+
+class VersionedStore:
+    """
+    A store whose catalogue can be reloaded while carts are pricing against it.
+
+    Use `new_cart` to create carts pinned to the current snapshot. A `Cart` created directly on the store
+    looks up the current snapshot at each call, so a reload can change its prices between two calls.
+
+    Attributes:
+        current: The current `CatalogueSnapshot`.
+        max_depth: The number of layers of changes after which the layers are merged.
+    """
+    def __init__(self, products=(), max_depth: int=8):
+        """
+        Initialize a store with the `products` as version 1 of its catalogue.
+
+        Raises:
+            TypeError: If a product is not an instance of Product.
+            ValueError: If a product appears more than once.
+        """
+        self.max_depth = max_depth
+        self.reload_lock = Lock()
+        self.snapshots = WeakValueDictionary()
+        self.current = None
+        self.publish(SnapshotShelf(self.validate_products(products)))
+
+    def get_shelf(self):
+        """ Returns the shelf of the current snapshot. """
+        return self.current.get_shelf()
+
+    def new_cart(self, *args, **kwargs) -> Cart:
+        """ Returns an empty `Cart` pinned to the current snapshot. Other arguments are passed to `Cart`. """
+        return Cart(self.current, *args, **kwargs)
+
+    def live_versions(self) -> list:
+        """ Returns the versions of the snapshots that are still in use, including the current one. """
+        return sorted(self.snapshots.keys())
+
+    def reload(self, products=(), removed=()) -> CatalogueSnapshot:
+        """
+        Publishes a new snapshot in which the `products` are added or replaced, and the `removed` item codes are removed.
+
+        Raises:
+            TypeError: If a product is not an instance of Product.
+            ValueError: If a product appears more than once, or a removed product is not in the catalogue.
+
+        >>> store = VersionedStore([Product("A", 50, 3, 140), Product("B", 35)])
+        >>> cart = store.new_cart()
+        >>> store.reload([Product("A", 45, 3, 120)]).version
+        2
+        >>> cart.add_product("A", 3)
+        >>> cart.get_subtotal(), store.new_cart().store.get_shelf()["A"].calculate_price(3)
+        (140, 120)
+        """
+        changes = self.validate_products(products)
+        with self.reload_lock:
+            return self.apply_changes(changes, frozenset(removed))
+
+    def reload_catalogue(self, products) -> CatalogueSnapshot:
+        """
+        Publishes a new snapshot with the full catalogue `products`, applying only the products that changed.
+
+        Raises:
+            TypeError: If a product is not an instance of Product.
+            ValueError: If a product appears more than once.
+        """
+        products = self.validate_products(products)
+        # The diff is made under the lock, so a concurrent reload cannot publish between the diff and this reload.
+        with self.reload_lock:
+            shelf = self.current.get_shelf()
+            changed = {
+                item_code: product for item_code, product in products.items()
+                if item_code not in shelf or pricing_terms(shelf[item_code]) != pricing_terms(product)
+            }
+            removed = frozenset(item_code for item_code in shelf if item_code not in products)
+            return self.apply_changes(changed, removed)
+
+    def apply_changes(self, changes: dict, removed: frozenset) -> CatalogueSnapshot:
+        """
+        Publishes a new snapshot with the validated `changes` and the `removed` item codes. Should be called with `reload_lock` held.
+
+        Raises:
+            ValueError: If a removed product is not in the catalogue, or is also changed.
+        """
+        shelf = self.current.get_shelf()
+        for item_code in removed:
+            if item_code not in shelf:
+                raise ValueError(f"We don't have {item_code} in our store.")
+            if item_code in changes:
+                raise ValueError(f"The product {item_code} cannot be both changed and removed.")
+        if shelf.depth >= self.max_depth:
+            new_shelf = SnapshotShelf(shelf.flatten())
+            for item_code in removed:
+                del new_shelf.changes[item_code]
+            new_shelf.changes.update(changes)
+        else:
+            new_shelf = SnapshotShelf(changes, removed, shelf)
+        return self.publish(new_shelf)
+
+    def publish(self, shelf: SnapshotShelf) -> CatalogueSnapshot:
+        """ Makes a snapshot with the `shelf` the current snapshot. """
+        version = self.current.version + 1 if self.current is not None else 1
+        snapshot = CatalogueSnapshot(version, shelf)
+        self.snapshots[version] = snapshot
+        self.current = snapshot
+        return snapshot
+
+    def validate_products(self, products) -> dict:
+        """ Returns a dictionary where the keys are the item codes and the values are the `products`. """
+        validated = {}
+        for product in products:
+            if not isinstance(product, Product):
+                raise TypeError("You should only add the product to the shelf.")
+            item_code = product.get_item_code()
+            if item_code in validated:
+                raise ValueError(f"The product {item_code} is already on the shelf.")
+            validated[item_code] = product
+        return validated
+
+
+def pricing_terms(product: Product) -> tuple:
+    """
+    Returns the terms that determine the prices of the `product`, with their types,
+    so that a price changing from 50 to 50.0 is a change.
+
+    >>> pricing_terms(Product("A", 50, 3, 140)) == pricing_terms(Product("A", 50.0, 3, 140))
+    False
+    """
+    return tuple((type(term), term) for term in (product.unit_price, product.special_quantity, product.special_price))